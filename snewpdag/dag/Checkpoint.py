@@ -0,0 +1,139 @@
+"""
+Checkpoint - save and restore the state of running DAGs
+
+A checkpoint file records
+  * the mutable state of every node of every DAG (see Node.checkpoint()),
+  * the state of the bit generator of the shared random number generator
+    (Node.rng), and
+  * the position reached in the input (e.g., the next trial number),
+so that a long run can be resumed where it stopped, with the same
+random number sequence it would have had.
+
+The file is a gzip-compressed pickle with a format version.
+It is written to a temporary file first, which then replaces the
+previous checkpoint, so there is always a complete checkpoint on disk
+even if the process is killed while writing.
+
+Nodes whose state can't be pickled are skipped (with an error message),
+and will resume from their freshly configured state.
+"""
+import os
+import sys
+import gzip
+import pickle
+import logging
+import numpy as np
+
+from .Node import Node
+
+checkpoint_format = 'snewpdag-checkpoint'
+checkpoint_version = 1
+
+def save(filename, dags, position):
+  """
+  Write a checkpoint of dags (a dictionary of DAGs, keyed by burst_id)
+  and input position to filename.
+  """
+  states = {}
+  for key, dag in dags.items():
+    if dag == None:
+      continue
+    states[key] = {}
+    for name, node in dag.items():
+      try:
+        states[key][name] = pickle.dumps(node.checkpoint(),
+                                         pickle.HIGHEST_PROTOCOL)
+      except Exception:
+        logging.error('{}: cannot checkpoint state: {}'.format(
+                      name, sys.exc_info()[1]))
+  d = {
+        'format': checkpoint_format,
+        'version': checkpoint_version,
+        'position': position,
+        'rng': None if Node.rng == None else Node.rng.bit_generator.state,
+        'dags': states,
+      }
+  tmp = filename + '.tmp'
+  with gzip.open(tmp, 'wb', compresslevel=1) as f:
+    pickle.dump(d, f, pickle.HIGHEST_PROTOCOL)
+  os.replace(tmp, filename)
+
+def load(filename):
+  """
+  Read a checkpoint file.  Returns None if unreadable.
+  """
+  try:
+    with gzip.open(filename, 'rb') as f:
+      d = pickle.load(f)
+  except Exception:
+    logging.error('While reading checkpoint {}: {}'.format(
+                  filename, sys.exc_info()[1]))
+    return None
+  if not isinstance(d, dict) or d.get('format') != checkpoint_format:
+    logging.error('{}: not a checkpoint file'.format(filename))
+    return None
+  if d.get('version') != checkpoint_version:
+    logging.error('{}: unsupported checkpoint version {}'.format(
+                  filename, d.get('version')))
+    return None
+  return d
+
+def restore(checkpoint, dags, make_dag):
+  """
+  Restore DAGs and random number generator from a checkpoint (from load()).
+  DAGs which don't exist in dags are made with make_dag().
+  Returns the input position.
+  """
+  for key, states in checkpoint['dags'].items():
+    if key not in dags:
+      dags[key] = make_dag()
+    dag = dags[key]
+    for name, s in states.items():
+      if name in dag:
+        dag[name].resume(pickle.loads(s))
+      else:
+        logging.error('Checkpoint of unknown node {}'.format(name))
+  if checkpoint['rng'] != None:
+    if Node.rng == None:
+      Node.rng = np.random.default_rng()
+    Node.rng.bit_generator.state = checkpoint['rng']
+  return checkpoint['position']
+
+class Checkpointer:
+  """
+  Keep count of input payloads, writing a checkpoint every so often.
+  After resuming, skip() says which payloads have already been processed.
+  """
+  def __init__(self, filename, every=1000):
+    self.filename = filename
+    self.every = every
+    self.position = 0 # number of payloads processed
+    self.resumed = 0 # number of payloads processed before resuming
+
+  def resume(self, dags, make_dag):
+    """
+    Restore from the checkpoint file, if there is one.
+    """
+    if os.path.exists(self.filename):
+      c = load(self.filename)
+      if c != None:
+        self.resumed = restore(c, dags, make_dag)
+        logging.info('Resuming from {} after {} payloads'.format(
+                     self.filename, self.resumed))
+
+  def skip(self):
+    """
+    True if the next payload was processed before resuming.
+    """
+    if self.position < self.resumed:
+      self.position += 1
+      return True
+    return False
+
+  def step(self, dags):
+    """
+    Count a processed payload, and write a checkpoint if it's time.
+    """
+    self.position += 1
+    if self.every > 0 and self.position % self.every == 0:
+      save(self.filename, dags, self.position)
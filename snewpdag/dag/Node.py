@@ -4,15 +4,38 @@ Implemented on observer-observable pattern.
 
 Plugins should subclass Node and override alert, revoke, reset, report.
 """
+import sys
 import logging
+import numpy as np
 
 from snewpdag.values import History
+from snewpdag.dag.lib import batch_split, batch_merge, combine_snapshots
 
 class Node:
 
   # shared random number generator - initialized by app
   rng = None
 
+  # names of attributes which are read-only after __init__,
+  # and can be shared between copies of a DAG made by a Template
+  # (read-only numpy arrays are shared anyway)
+  shared = ()
+
+  # False if copies of this node can't stand in for a new instance,
+  # e.g., because the constructor draws random numbers
+  cloneable = True
+
+  # True if the action methods handle batched payloads (several trials
+  # in one payload, see lib.batch_split()) themselves.
+  # Otherwise evaluate() runs the action methods once per trial.
+  batch = False
+
+  # True if reset() doesn't clear any state kept between alerts
+  # (e.g., it only passes the payload on), so that a node which doesn't
+  # handle batches can still run in a batched DAG, where it sees all the
+  # alerts of a batch before their resets (see trials/SimpleTrials.py).
+  stateless_reset = False
+
   def __init__(self, name, **kwargs):
     """
     Initialize the node.
@@ -30,9 +53,9 @@ class Node:
     Clear the last data, and detach from all observers and observables.
     """
     self.last_data.clear()
-    for n in self.observers:
+    for n in list(self.observers): # detach() modifies the lists
       self.detach(n)
-    for n in self.watch_list:
+    for n in list(self.watch_list):
       n.detach(self)
 
   def attach(self, observer):
@@ -59,29 +82,28 @@ class Node:
     Notify all observers that they need to update.
     Update history by appending name of current node.
     """
-    self.last_data = data.copy() # shallow copy (copies refs of objects)
-    # record action
-    self.last_data['action'] = action
-    # append to history (tuple, so remember that tuples are immutable)
-    #if history == None:
-    #  if 'history' in data:
-    #    h1 = self.last_data['history']
-    #  else:
-    #    #h1 = ()
-    #    h1 = History()
-    #else:
-    #  h1 = history
-
-    if 'history' not in data:
-      self.last_data['history'] = History()
-    self.last_data['history'].append(self.name)
-    #h2 = (self.name,)
-    #self.last_data['history'] = h1 + h2
+    self.stamp(action, data.copy()) # shallow copy (copies refs of objects)
     # notify all observers
     for obs in self.observers:
-      logging.debug('DEBUG:{0}: notify {1}'.format(self.name, obs.name))
+      logging.debug('DEBUG:%s: notify %s', self.name, obs.name)
       obs.update(self.last_data)
 
+  def stamp(self, action, data):
+    """
+    Record the outgoing payload as last_data, without notifying anyone.
+    The payload is used as is (not copied), so it must belong to this node.
+    Sets the action and appends the name of this node to the history.
+    Returns the recorded payload.
+    """
+    self.last_data = data
+    # record action
+    data['action'] = action
+    # append to history
+    if 'history' not in data:
+      data['history'] = History()
+    data['history'].append(self.name)
+    return data
+
 #
 # entry points
 #   alert, revoke, report, reset are preferred.
@@ -157,8 +179,21 @@ class Node:
     action to add to the payload and return it for notification
     (which will make another shallow copy as self.last_data).
     """
-    logging.debug('{0}: update({1})'.format(self.name,
-                  data['action'] if 'action' in data else 'None'))
+    v = self.evaluate(data)
+    if v != None:
+      self.notify(v[0], v[1])
+
+  def evaluate(self, data):
+    """
+    Run the action method for the payload, but don't notify observers.
+    Returns (action, payload) to forward, or None if nothing is forwarded.
+    The returned payload is always a dictionary owned by this node
+    (never the caller's payload), so it can be recorded without copying.
+    Used by update(), and directly by a compiled Plan.
+    """
+    logging.debug('%s: update(%s)', self.name, data.get('action'))
+    if 'batch' in data and not self.batch:
+      return self.evaluate_trials(data)
     cdata = data.copy() # local shallow copy
     if 'history' in cdata:
       cdata['history'] = data['history'].copy() # local copy of history
@@ -179,16 +214,111 @@ class Node:
         v = self.other(cdata)
 
       if v == True:
-        self.notify(action, cdata) # notify() will update history
+        return (action, cdata)
       elif v == False:
-        return
+        return None
       elif type(v) is dict:
-        self.notify(v['action'] if 'action' in v else action, v)
+        return (v['action'] if 'action' in v else action,
+                v if v is cdata else v.copy())
       else:
         logging.error('{0}: empty action response'.format(self.name))
-        return
+        return None
     else:
       logging.error('[{}] Action not specified'.format(self.name))
+      return None
+
+  def evaluate_trials(self, data):
+    """
+    Evaluate a batched payload one trial at a time, for nodes which
+    don't handle batches themselves.  Trials which aren't forwarded
+    are dropped from the output batch.
+    """
+    action = None
+    outs = []
+    for d in batch_split(data):
+      v = self.evaluate(d)
+      if v != None:
+        action = v[0]
+        outs.append(v[1])
+    if len(outs) == 0:
+      return None
+    return (action, batch_merge(outs, data))
+
+#
+# accumulated state, e.g., for combining MC trials run in parallel
+# or in separate jobs.
+#   snapshot() returns a picklable copy of whatever the node accumulates
+#   over alerts (histogram bins, series, ...), in the format described
+#   in lib.combine_snapshots(), and restore() sets it back.
+#   merge() adds a snapshot (or another instance of the same node)
+#   into this one.  Accumulating nodes only need to override
+#   snapshot() and restore().
+#
+
+  def snapshot(self):
+    """
+    Return accumulated state, or None if the node doesn't accumulate anything.
+    OVERRIDE in accumulating nodes, together with restore().
+    """
+    return None
+
+  def restore(self, snapshot):
+    """
+    Set accumulated state from a snapshot.
+    """
+    logging.error('{}: cannot restore accumulated state'.format(self.name))
+
+  def merge(self, other):
+    """
+    Add the accumulated state of other (a snapshot, or another Node)
+    into this node.
+    """
+    if isinstance(other, Node):
+      other = other.snapshot()
+    if other == None:
+      return
+    s = self.snapshot()
+    if s == None:
+      logging.error('{}: cannot merge accumulated state'.format(self.name))
+      return
+    try:
+      self.restore(combine_snapshots(s, other))
+    except ValueError:
+      logging.error('{}: while merging: {}'.format(self.name, sys.exc_info()[1]))
+
+#
+# checkpoints (see Checkpoint.py).
+#   checkpoint() returns the mutable state of the node, and resume() sets it.
+#   By default, this is every attribute except the DAG structure,
+#   the last payload, attributes named in shared, and read-only numpy
+#   arrays (as for Template, these are set up by __init__ and never change).
+#   OVERRIDE both if the node keeps anything which can't be pickled.
+#
+
+  def checkpoint(self):
+    """
+    Return the mutable state of the node as a picklable dictionary.
+    """
+    skip = ('name', 'observers', 'watch_list', 'last_data', 'last_source')
+    return { k: v for k, v in vars(self).items()
+             if k not in skip and not self.read_only(k, v) }
+
+  def resume(self, state):
+    """
+    Set the mutable state of the node from checkpoint().
+    Read-only attributes (in the state or in the node) are left alone.
+    """
+    d = vars(self)
+    d.update({ k: v for k, v in state.items()
+               if not self.read_only(k, v) and
+                  not self.read_only(k, d.get(k)) })
+
+  def read_only(self, k, v):
+    """
+    True if attribute k with value v doesn't change after __init__.
+    """
+    return k in type(self).shared or \
+           (isinstance(v, np.ndarray) and not v.flags.writeable)
 
 #
 # utility functions
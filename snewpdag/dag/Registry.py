@@ -0,0 +1,117 @@
+"""
+Registry - bounded collection of live DAGs, keyed by burst identifier.
+
+The application keeps one DAG per burst_id (or per coincidence).
+In a long-running process (e.g., --stream), these would accumulate forever,
+along with whatever the nodes cache (time series, skymaps, etc.).
+A Registry behaves like the dictionary of DAGs, but it evicts
+  * the least recently used DAG when there are more than max_dags, and
+  * any DAG which hasn't been used for ttl seconds.
+
+Before a DAG is evicted, the flush hook (if any) is called with the key
+and the DAG, e.g., to send a report action through it so that it writes
+out its final results.  Then every node is disposed (Node.dispose()),
+which clears its last payload and detaches it from the rest of the DAG.
+
+Without max_dags or ttl, nothing is ever evicted.
+"""
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+class Registry:
+  def __init__(self, max_dags=None, ttl=None, flush=None, clock=time.monotonic):
+    """
+    max_dags:  (optional) maximum number of live DAGs.
+    ttl:  (optional) evict a DAG after it has been idle for ttl seconds.
+    flush:  (optional) function flush(key, dag) called before eviction.
+    clock:  function returning the current time in seconds.
+    """
+    if max_dags != None and max_dags < 1:
+      logging.error('Registry: max_dags must be at least 1 (got {})'.format(
+                    max_dags))
+      max_dags = 1
+    self.max_dags = max_dags
+    self.ttl = ttl
+    self.flush = flush
+    self.clock = clock
+    self.dags = OrderedDict() # key -> [ dag, time of last use ], LRU first
+
+  def __setitem__(self, key, dag):
+    if key in self.dags:
+      self.dags.pop(key)
+    self.dags[key] = [ dag, self.clock() ]
+    self.expire(keep=key)
+
+  def __getitem__(self, key):
+    entry = self.dags[key]
+    entry[1] = self.clock()
+    self.dags.move_to_end(key)
+    self.expire(keep=key)
+    return entry[0]
+
+  def __delitem__(self, key):
+    self.dags.pop(key)
+
+  def __contains__(self, key):
+    return key in self.dags
+
+  def __iter__(self):
+    return iter(self.dags)
+
+  def __len__(self):
+    return len(self.dags)
+
+  def get(self, key, default=None):
+    return self[key] if key in self.dags else default
+
+  def keys(self):
+    return self.dags.keys()
+
+  def values(self):
+    return [ entry[0] for entry in self.dags.values() ]
+
+  def items(self):
+    return [ (key, entry[0]) for key, entry in self.dags.items() ]
+
+  def expire(self, keep=None):
+    """
+    Evict DAGs which have been idle too long, or which are in excess
+    of max_dags, least recently used first.
+    The DAG with key keep (the one in use) is never evicted.
+    """
+    if self.ttl != None:
+      limit = self.clock() - self.ttl
+      for key in [ k for k, e in self.dags.items() if e[1] < limit ]:
+        if key != keep:
+          self.evict(key)
+    if self.max_dags != None:
+      while len(self.dags) > self.max_dags:
+        key = next(iter(self.dags))
+        if key == keep: # only if max_dags is too small to hold keep
+          break
+        self.evict(key)
+
+  def evict(self, key):
+    """
+    Flush and dispose of a DAG, and remove it from the registry.
+    """
+    dag = self.dags.pop(key)[0]
+    logging.info('Registry: evicting DAG {}'.format(key))
+    if dag == None:
+      return
+    if self.flush != None:
+      try:
+        self.flush(key, dag)
+      except Exception:
+        logging.error('While flushing DAG {}: {}'.format(key, sys.exc_info()))
+    for node in dag.values():
+      node.dispose()
+
+  def close(self):
+    """
+    Evict all DAGs.
+    """
+    for key in list(self.dags):
+      self.evict(key)
@@ -0,0 +1,69 @@
+"""
+Template - a configured DAG from which fresh instances can be stamped out.
+
+Configuring a DAG imports the plugin classes and runs each constructor,
+which may read detector tables, signal files and so on.  A Template
+keeps one configured DAG (the prototype, which is never updated itself)
+and makes new instances by copying it, so per-burst DAGs don't pay for
+configuration again.
+
+Only mutable state is copied.  The following are shared between the
+prototype and all instances:
+  * numpy arrays which have been made read-only
+    (flags.writeable = False), as the plugins already do for
+    histograms and tables which are not modified after construction;
+  * attributes named in the shared tuple of the node class,
+    for read-only structures which are not numpy arrays
+    (e.g., a dictionary of detector information).
+
+Everything else (caches, accumulated histograms, observer lists, etc.)
+is deep-copied, so instances are independent of each other.
+
+Some nodes draw random numbers in their constructor, so copies would
+all get the same values.  Such node classes set cloneable = False,
+and a Template containing any of them builds every instance with the
+fallback function instead (normally a call to app.configure()).
+
+If the prototype was compiled into a Plan, instances are Plans as well.
+"""
+import copy
+import logging
+import sys
+import numpy as np
+
+class Template:
+  def __init__(self, prototype, fallback=None):
+    """
+    prototype:  a freshly configured DAG, i.e., a dictionary { name: Node }
+                or a Plan, as returned by app.configure().
+                It belongs to the Template afterwards, and must not be
+                updated by anyone else.
+    fallback:  (optional) function returning a new DAG, for prototypes
+               which can't be copied.
+    """
+    self.prototype = prototype
+    self.fallback = fallback
+    self.cloneable = all( type(node).cloneable for node in prototype.values() )
+    if not self.cloneable and fallback == None:
+      logging.error('DAG template has nodes which cannot be copied')
+    self.shared = {} # memo for deepcopy: id -> shared object
+    for node in prototype.values():
+      for k, v in vars(node).items():
+        if k in type(node).shared:
+          self.shared[id(v)] = v
+        elif isinstance(v, np.ndarray) and not v.flags.writeable:
+          self.shared[id(v)] = v
+
+  def instantiate(self):
+    """
+    Return a new instance of the DAG, or None if it can't be copied.
+    """
+    if not self.cloneable:
+      return self.fallback() if self.fallback != None else None
+    memo = dict(self.shared) # deepcopy adds to memo, so start from a copy
+    try:
+      return copy.deepcopy(self.prototype, memo)
+    except Exception:
+      logging.error('While instantiating DAG template: {}'.format(
+                    sys.exc_info()))
+      return None
@@ -1,4 +1,7 @@
 from .Node import Node
+from .Plan import Plan
+from .Template import Template
+from .Registry import Registry
 from .Detector import Detector
 from .DetectorDB import DetectorDB
 from .CelestialPixels import CelestialPixels
@@ -7,7 +7,8 @@ See README for details of the configuration and input data files.
 import os, sys, argparse, json, logging, importlib, ast, csv
 #from SNEWS_PT.snews_sub import Subscriber
 import numpy as np
-from . import Node
+from . import Node, Plan, Template, Registry, CelestialPixels
+from . import Checkpoint
 
 parser = argparse.ArgumentParser()
 parser.add_argument('config', help='configuration py/json/csv file')
@@ -20,7 +21,17 @@ parser.add_argument('--action', help='default action (alert by default)',
                     default='alert')
 parser.add_argument('--inject', help='name of default injection module',
                     default='Control')
+parser.add_argument('--compile', action='store_true', help='run DAGs through a compiled execution plan')
+parser.add_argument('--max-dags', type=int, help='maximum number of live DAGs (least recently used are evicted)')
+parser.add_argument('--dag-ttl', type=float, help='evict DAGs idle for this many seconds')
+parser.add_argument('--pixel-cache', help='directory for ICRS to GCRS pixel maps shared between runs')
+parser.add_argument('--fast-pixels', action='store_true', help='fitted ICRS to GCRS model instead of a full transformation of every pixel')
+parser.add_argument('--checkpoint', help='checkpoint file to resume from and save to')
+parser.add_argument('--checkpoint-every', type=int, default=1000, help='number of input payloads between checkpoints')
 args = parser.parse_args()
+
+checkpointer = None # set by run() if checkpointing
+
 if args.stream:
   try:
     from hop import stream
@@ -74,6 +85,7 @@ def run():
   alert_topic = "kafka://kafka.scimma.org/snews.alert-test"
   ###read from the firedrill topic (not exisisting yet)
   #alert_topic="kafka://kafka.scimma.org/snews.alert-firedrill"
+  global checkpointer
 
   if args.log:
     numeric_level = getattr(logging, args.log.upper(), None)
@@ -87,6 +99,13 @@ def run():
   else:
     Node.rng = np.random.default_rng()
 
+  # on-disk pixel maps, also for worker processes
+  if args.pixel_cache:
+    os.environ['SNEWPDAG_PIXEL_CACHE'] = args.pixel_cache
+    CelestialPixels.cache_dir = args.pixel_cache
+  if args.fast_pixels:
+    CelestialPixels.fast = True
+
   cfn, cfx = os.path.splitext(args.config)
   if cfx == '.csv':
     # name, class, observe
@@ -101,7 +120,23 @@ def run():
         sys.exit(2)
     #nodes = configure(nodespecs)
 
-  dags = {}
+  # configure once, then copy the template for each new burst
+  nodespecs = template(nodespecs, args.compile)
+  if nodespecs == None:
+    logging.error('Invalid configuration')
+    sys.exit(2)
+
+  # evicted DAGs are sent a report before they are disposed
+  dags = Registry(args.max_dags, args.dag_ttl, flush)
+
+  # resume from checkpoint, skipping input which was already processed
+  # (stream messages can't be replayed, so they're never skipped)
+  if args.checkpoint:
+    checkpointer = Checkpoint.Checkpointer(args.checkpoint,
+                                           args.checkpoint_every)
+    checkpointer.resume(dags, lambda: instantiate(nodespecs))
+    if args.stream:
+      checkpointer.position = checkpointer.resumed
 
   if args.stream:
       s = stream.open(alert_topic, "r")
@@ -194,9 +229,11 @@ def find_class(name):
     logging.error('Unknown class {} in {}'.format(cl, path))
     sys.exit(2)
 
-def configure(nodespecs):
+def configure(nodespecs, compiled=False):
   """
   Build DAG from configuration dictionary.
+  If compiled, return a Plan (a compiled execution plan) wrapping the nodes,
+  otherwise return a dictionary of nodes keyed by name.
   """
   nodes = {}
 
@@ -236,13 +273,39 @@ def configure(nodespecs):
           logging.error('{0} observing unknown node {1}'.format(name, obs))
           return None
 
+  if compiled:
+    try:
+      return Plan(nodes)
+    except ValueError:
+      logging.error('While compiling DAG: {}'.format(sys.exc_info()))
+      return None
   return nodes
 
+def template(nodespecs, compiled=False):
+  """
+  Build a Template from the configuration, from which new DAGs
+  can be instantiated without configuring them again.
+  """
+  nodes = configure(nodespecs, compiled)
+  if nodes == None:
+    return None
+  return Template(nodes, lambda: configure(nodespecs, compiled))
+
+def instantiate(nodespecs):
+  """
+  Make a new DAG, either from a Template or from a configuration.
+  """
+  if isinstance(nodespecs, Template):
+    return nodespecs.instantiate()
+  else:
+    return configure(nodespecs, args.compile)
+
 def inject(dags, data, nodespecs):
   """
   Send data through DAG.
   If there is no burst identifier, assume it's 0.
   If the DAG doesn't exist for this coincidence, create a new one.
+  nodespecs is either the configuration or a Template.
   """
   if type(data) is dict:
     inject_one(dags, data, nodespecs)
@@ -254,6 +317,8 @@ def inject(dags, data, nodespecs):
     sys.exit(2)
 
 def inject_one(dags, data, nodespecs):
+  if checkpointer != None and checkpointer.skip():
+    return
   # add an action if none already exists (default 'alert')
   if 'action' not in data:
     data['action'] = args.action
@@ -262,18 +327,38 @@ def inject_one(dags, data, nodespecs):
   if 'sub list number' in data:
     index_coincidence = str(data['sub list number'])
     if 'dag_coinc' + index_coincidence not in dags: # e.g. dag_coinc1, dag_coinc2
-      dags['dag_coinc' + index_coincidence] = configure(nodespecs)
+      dags['dag_coinc' + index_coincidence] = instantiate(nodespecs)
     dag = dags['dag_coinc' + index_coincidence]
-    dag[data['name']].update(data)
+    update(dag, data)
   else:
     burst_id = 0
     if 'burst_id' in data:
       burst_id = data['burst_id']
     if burst_id not in dags:
-      dags[burst_id] = configure(nodespecs)
+      dags[burst_id] = instantiate(nodespecs)
       if dags[burst_id] == None:
         logging.error('Invalid configuration for burst id {}'.format(burst_id))
         sys.exit(2)
     dag = dags[burst_id]
+    update(dag, data)
+  if checkpointer != None:
+    checkpointer.step(dags)
+
+def flush(key, dag):
+  """
+  Send a report action through a DAG which is about to be evicted,
+  so that it writes out its final results.
+  """
+  if args.inject in dag:
+    update(dag, { 'action': 'report', 'name': args.inject, 'burst_id': key })
+
+def update(dag, data):
+  """
+  Inject data into the node named by data['name'] of a DAG,
+  which is either a dictionary of nodes or a compiled Plan.
+  """
+  if isinstance(dag, Plan):
+    dag.update(data['name'], data)
+  else:
     dag[data['name']].update(data)
 
@@ -75,3 +75,148 @@ def fill_filename(pattern, module_name, count, data):
   fn = ps.format(module_name, count, data.get('burst_id', 0))
   return fn
 
+
+#
+# batched payloads
+#
+# A batched payload carries several MC trials at once.
+#   'batch':  number of trials
+#   'batch_fields':  tuple of names of fields which have a leading trial axis,
+#                    i.e., a list (or array) with one element per trial.
+# All other fields are shared by all trials.
+#
+
+def parabolic_peak(x, y, i):
+  """
+  Refine the position of the peak y[i] of a profile sampled at uniformly
+  spaced points x, using the parabola through y[i-1], y[i], y[i+1].
+  Return x[i] if the peak is at either end or the points aren't concave.
+  """
+  if i <= 0 or i >= len(y) - 1:
+    return x[i]
+  d = y[i-1] - 2.0 * y[i] + y[i+1]
+  if not d < 0.0:
+    return x[i]
+  return x[i] + 0.5 * (y[i-1] - y[i+1]) / d * (x[i+1] - x[i])
+
+def batch_split(data):
+  """
+  Split a batched payload into single-trial payloads (a generator).
+  The single-trial payloads don't have 'batch' or 'batch_fields'.
+  """
+  n = data['batch']
+  fields = data.get('batch_fields', ())
+  base = { k: v for k, v in data.items()
+           if k != 'batch' and k != 'batch_fields' and k not in fields }
+  for i in range(n):
+    d = base.copy()
+    for f in fields:
+      d[f] = data[f][i]
+    yield d
+
+def batch_merge(payloads, data):
+  """
+  Merge single-trial payloads (e.g., from batch_split) into a batched payload.
+  data is the original batched payload, used to find out which fields
+  are shared by all trials:  a field is shared if it's shared in data
+  and every trial payload still has the same object (or an equal
+  string or number).
+  Per-trial fields are returned as lists.
+  The history is taken from the first trial.
+  """
+  fields = data.get('batch_fields', ())
+  out = {}
+  bf = []
+  for k in payloads[0]:
+    if k == 'history':
+      out[k] = payloads[0][k]
+      continue
+    vals = [ p.get(k) for p in payloads ]
+    if k not in fields and all(_same(v, vals[0]) for v in vals):
+      out[k] = vals[0]
+    else:
+      out[k] = vals
+      bf.append(k)
+  out['batch'] = len(payloads)
+  out['batch_fields'] = tuple(bf)
+  return out
+
+def _same(a, b):
+  if a is b:
+    return True
+  return type(a) is type(b) and isinstance(a, (str, numbers.Number)) and a == b
+
+def batch_field(data, field):
+  """
+  Return the value of a field of a batched payload as a list (or array)
+  with one element per trial, whether it's a per-trial field or shared.
+  """
+  if field in data.get('batch_fields', ()):
+    return data[field]
+  else:
+    return [ data[field] ] * data['batch']
+
+#
+# snapshots of accumulated state (see Node.snapshot())
+#
+# A snapshot is a dictionary.  Two snapshots of the same kind are combined
+# field by field:  numbers and numpy arrays are added, lists concatenated,
+# and dictionaries combined recursively.  Tuples and strings describe
+# the shape of what was accumulated (e.g., binning), and must match.
+# So a dictionary { name: snapshot } for a whole DAG is a snapshot as well.
+#
+
+def combine_snapshots(a, b):
+  """
+  Return the combination of two snapshots (neither is modified).
+  Raises ValueError if they are incompatible.
+  Counts combine exactly, so the combination is associative
+  (up to floating-point rounding of non-integer sums).
+  """
+  if a.keys() != b.keys():
+    raise ValueError('snapshots have different fields')
+  c = {}
+  for k, va in a.items():
+    vb = b[k]
+    if isinstance(va, dict):
+      c[k] = combine_snapshots(va, vb)
+    elif isinstance(va, (tuple, str)) or va is None:
+      if va != vb:
+        raise ValueError('incompatible snapshots, {} = {} and {}'.format(
+                         k, va, vb))
+      c[k] = va
+    elif isinstance(va, list):
+      c[k] = va + list(vb)
+    elif isinstance(va, np.ndarray):
+      if np.shape(va) != np.shape(vb):
+        raise ValueError('incompatible snapshots, {} has shape {} and {}'.format(
+                         k, np.shape(va), np.shape(vb)))
+      c[k] = va + vb
+    elif isinstance(va, numbers.Number):
+      c[k] = va + vb
+    else:
+      raise ValueError('cannot combine snapshot field {}'.format(k))
+  return c
+
+def snapshot_dag(nodes):
+  """
+  Return the snapshots of all the nodes of a DAG which accumulate something,
+  as a dictionary { name: snapshot }.
+  """
+  snaps = {}
+  for name, node in nodes.items():
+    s = node.snapshot()
+    if s != None:
+      snaps[name] = s
+  return snaps
+
+def merge_dag(nodes, snaps):
+  """
+  Merge snapshots { name: snapshot } (e.g., from snapshot_dag())
+  into the nodes of a DAG.
+  """
+  for name, s in snaps.items():
+    if name in nodes:
+      nodes[name].merge(s)
+    else:
+      logging.error('Snapshot of unknown node {}'.format(name))
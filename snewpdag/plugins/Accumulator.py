@@ -4,14 +4,19 @@ Accumulator:  a plugin which simply accumulates a list of numbers
 
 In general, assumes only a single source, so revoke and reset are
 the same.
+
+A batched payload (see dag/lib.py) appends one entry per trial.
 """
 import logging
 import numpy as np
 
 from snewpdag.dag import Node
-from snewpdag.dag.lib import fetch_field
+from snewpdag.dag.lib import fetch_field, batch_split
 
 class Accumulator(Node):
+
+  batch = True
+
   def __init__(self, title, in_field, **kwargs):
     self.title = title
     self.in_field = in_field
@@ -23,6 +28,15 @@ class Accumulator(Node):
     self.series = []
 
   def alert(self, data):
+    if 'batch' in data:
+      for d in batch_split(data):
+        self.append(d)
+      return self.alert_pass != False
+    if not self.append(data):
+      return False
+    return self.alert_pass != False
+
+  def append(self, data):
     if self.index:
       x = data[self.in_field][self.index]
     else:
@@ -31,7 +45,7 @@ class Accumulator(Node):
         return False
     # append
     self.series.append(x)
-    return self.alert_pass != False
+    return True
 
   def report(self, data):
     a = np.array(self.series)
@@ -49,6 +63,12 @@ class Accumulator(Node):
       data[self.out_field] = d
     return True
 
+  def snapshot(self):
+    return { 'series': list(self.series) }
+
+  def restore(self, snapshot):
+    self.series = list(snapshot['series'])
+
   def revoke(self, data):
     if 'revoke' in self.clear_on:
       self.series = []
@@ -17,6 +17,8 @@ import logging
 from snewpdag.dag import Node
 
 class ActionFilter(Node):
+    stateless_reset = True
+
     def __init__(self, **kwargs):
         self.on_alert = kwargs.pop('on_alert', None)
         self.on_reset = kwargs.pop('on_reset', None)
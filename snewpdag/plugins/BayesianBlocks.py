@@ -1,5 +1,10 @@
 """
 Bayes: Bayesian block method.  It's now set to always run in hybrid mode.  To run a pure Bayesian block, set division to be lower than h_low
+
+Values above division are split into Bayesian blocks (Scargle et al. 2013)
+with a dynamic program over cumulative counts and edges, which is O(N^2)
+in the number of values, and typically close to O(N) with pruning
+(prune=True, the default, gives the same blocks).
 """
 import logging
 import math
@@ -9,7 +14,8 @@ import numpy as np
 
 
 class BayesianBlocks(Node):
-  def __init__(self, h_bins, h_low, h_up, shape, gamma, division, **kwargs):
+  def __init__(self, h_bins, h_low, h_up, shape, gamma, division,
+               prune=True, **kwargs):
     self.h_bins = h_bins # number of bins in histograms
     self.h_low = h_low # lower edge of histogram
     self.h_up = h_up # upper edge of histogram
@@ -21,10 +27,10 @@ class BayesianBlocks(Node):
     self.fit_range = shape.fit_range # metric-dt fit range, fitting +-dt_range around the point of minimum metric
     self.gamma = gamma # prior probability used in the Bayesian block method, larger gamma means finer bins
     self.division = division # division between uniform bins and Bayesian blocks
+    self.prune = prune # drop start points which can't start the last block
     self.valid = [ False, False ] # flags indicating valid data from sources
     self.h = [ (), () ] # histories from each source
     self.history_data = []
-    self.hybrid_bin_value = []
     super().__init__(**kwargs)
 
     if self.dt0 > 0:
@@ -68,162 +74,99 @@ class BayesianBlocks(Node):
 
 
   def metric_list(self, values1, values2):
-    mlist = [0] * self.dt_N
-
-    block2 = self.bayesian_block(values2)
-    hist2 = self.block_hist(block2[0], block2[1], 0)
-    for i in range(self.dt_N):
-      block1 = self.bayesian_block(values1)
-      hist1 = self.block_hist(block1[0], block1[1], self.dt0 + i*self.dt_step)
-      metric = SHF.diff_hist(hist1, hist2, self.scale)
-      mlist[i] = metric
-
-    return mlist
+    """
+    Metric between the histogram of the blocks of values2 and that of
+    the blocks of values1 shifted by each dt of the scan.
+    The blocks of each series are only found once.
+    """
+    hist2 = self.block_hist(self.bayesian_block(values2), 0.0)
+    dt = self.dt0 + self.dt_step * np.arange(self.dt_N)
+    hist1 = self.block_hist(self.bayesian_block(values1), dt)
+    return SHF.diff_hist(hist1, hist2, self.scale)
 
 
   def bayesian_block(self, values):
+    """
+    Split the values in [h_low, h_up) above division into Bayesian blocks.
+    Returns (edges, counts, uniform), where edges are the nblocks+1 block
+    edges, counts the number of values in each block, and uniform the
+    sorted values at or below division, which are binned uniformly.
+    Blocks need at least two distinct values; otherwise all the values
+    are binned uniformly.
+    """
+    v = np.asarray(values, dtype=np.float64)
+    v = np.sort(v[(v >= self.h_low) & (v < self.h_up)])
+    i = np.searchsorted(v, self.division, side='right')
+    x, nn = np.unique(v[i:], return_counts=True)
+    if len(x) < 2:
+      return np.zeros(0), np.zeros(0), v
+
+    # one cell per distinct value, with edges halfway between values
+    edge = np.concatenate(([ 1.5*x[0] - 0.5*x[1] ],
+                           0.5 * (x[1:] + x[:-1]),
+                           [ 1.5*x[-1] - 0.5*x[-2] ]))
+    cn = np.concatenate(([ 0 ], np.cumsum(nn)))
+    start = self.partition(edge, cn)
+
+    # walk back from the last cell through the best partitions
+    ends = []
+    r = len(x)
+    while r > 0:
+      ends.append(r)
+      r = start[r-1]
+    ends.append(0)
+    ends.reverse()
+    return edge[ends], np.diff(cn[ends]), v[:i]
+
+
+  def partition(self, edge, cn):
+    """
+    Dynamic programming for the best partition of cells into blocks.
+    edge:  cell edges;  cn:  cumulative counts at the edges.
+    Returns the index of the first cell of the last block of the best
+    partition of cells 0..r, for each r.
+
+    The fitness of a block is N log(N/T) for N values in width T, plus
+    log(gamma) per block.  Splitting a block never decreases the summed
+    N log(N/T), so with pruning, start points which can't beat the best
+    partition so far can't do better later either, and are dropped
+    (exact pruning, Killick et al. 2012).
+    """
+    ncells = len(edge) - 1
     log_prior = math.log(self.gamma)
-
-    svalues = []
-    for iv in range(len(values)):
-      if float(values[iv]) >= self.h_low and float(values[iv]) < self.h_up:
-        self.hybrid_bin_value.append(float(values[iv]))           
-        if float(values[iv]) > self.division:
-          svalues.append(float(values[iv]))
-      else:
-        values.remove(values[iv])
-    svalues.sort()
-
-    edge = [(svalues[i] + svalues[i-1])/2 for i in range(len(svalues)) if i > 0]
-    edge.insert(0, 1.5*svalues[0] - 0.5*svalues[1]) #lower edge of the first cell
-    edge.append(1.5*svalues[-1] - 0.5*svalues[-2]) #upper edge of the last cell
-
-    width = [(edge[ii] - edge[ii-1]) for ii in range(len(edge)) if ii > 0]
-
-    best = [] #best[N] = the likelihood of the best combination when there are N+1 data points
-    best_count = [] #best_count[N] = the number of data points in the last block when there are N+1 data points
-
-    for n in range(1, len(svalues) + 1): #start from 1 data point and add one point a time
-      last_n = n #number of data points in the last block 
-
-      if n == 1: #for only one data point the best partition is certainly one block
-        block_width = width[0]
-        max_like = 1 * (math.log(1/block_width)) + log_prior
-        best.append(max_like)
-        best_count.append(1)
-      else:
-        block_width = 0
-        for nn in range(0, last_n):
-          block_width += width[nn]
-        max_like = last_n * (math.log(last_n/block_width)) + log_prior
-        best_n = last_n
-        last_n -= 1
-        while last_n > 0:
-          block_width = 0
-          for nn in range(0, last_n):
-            block_width += width[n-1-nn]
-          like = last_n * (math.log(last_n/block_width)) #likelihood for the last block
-          like += best[n-last_n-1] #likelihood of the best partition for the data points not in the last block
-          like += log_prior #suppresion prior for creating a new block
-          if like > max_like:
-            max_like = like
-            best_n = last_n
-          last_n -= 1
-        best.append(max_like)
-        best_count.append(best_n)
-
-    best_edge = []
-    best_content = []
-    bayes_block = []
-
-    best_edge.append(edge[-1])
-    dataN = len(svalues)
-    edge_index = -1
-    while dataN > 0:
-      best_content.append(best_count[dataN-1])
-      edge_index -= best_count[dataN-1]
-      best_edge.append(edge[edge_index])
-      dataN -= best_count[dataN-1]
-
-    best_content.reverse()
-    best_edge.reverse()
-
-    best_content = [x/float(len(values)) for x in best_content]
-
-    bayes_block.append(best_edge)
-    bayes_block.append(best_content)
-
-    return bayes_block
-
-
-  def block_hist(self, block_edge, block_content, dt_offset):
-    bin_width = (float(self.h_up) - float(self.h_low)) / float(self.h_bins)
-    hist = [0] * (self.h_bins)
-
-    block_width = [block_edge[ie] - block_edge[ie-1] for ie in range(len(block_edge)) if ie > 0]
-
-    edge_index = 0
-    for i in range(self.h_bins): #fill in the bins of the histogram
-      bin_edge = self.h_low + (i+1) * bin_width #upper edge of the bin
-
-      if edge_index == 0 and bin_edge <= block_edge[edge_index]+dt_offset: #if the bin is below the lower end of the blocks
-        hist[i] = 0
-        continue
-
-      reach_end = False
-      while block_edge[edge_index]+dt_offset < bin_edge: #loop until there's a block whose upper edge covers the bin
-        edge_index += 1
-
-        if edge_index == len(block_edge): #flag when the upper bin edge exceeds the upper end of the blocks
-          reach_end = True
-          break
-
-      if reach_end == True: #when the upper bin edge exceeds the upper end of the blocks
-        if bin_edge - bin_width >= block_edge[-2]+dt_offset: #if the bin doesn't include any full blocks
-          hist[i] += (block_content[-1]/block_width[-1]) * ( (block_edge[-1]+dt_offset) - bin_edge + bin_width)
-          break
-        else: #if the bin includes full blocks
-          ib = 1 #number of block edges included in the bin
-          while bin_edge - bin_width < block_edge[-1-ib]+dt_offset:
-            ib += 1
-
-          hist[i] += (block_content[-ib]/block_width[-ib]) * ( (block_edge[-ib]+dt_offset) - bin_edge + bin_width)
-          for iib in range(ib-1):
-            hist[i] += (block_content[-1-iib]/block_width[-1-iib]) * (block_edge[-1-iib] - block_edge[-2-iib])
-          break
-
-      if block_edge[edge_index]+dt_offset >= bin_edge:
-        if edge_index == 1: #if the bin is completely or partially in the first block
-          if bin_edge - bin_width < block_edge[edge_index-1]+dt_offset: #if the bin is partially in the first block
-            hist[i] += (block_content[edge_index-1]/block_width[edge_index-1]) * (bin_edge - (block_edge[edge_index-1]+dt_offset) )
-            continue
-          else: #if the bin is completely in the first block
-            hist[i] += (block_content[edge_index-1]/block_width[edge_index-1]) * bin_width
-            continue
-        elif bin_edge - bin_width >= block_edge[edge_index-1]+dt_offset: #if the bin is completely within one single block
-          hist[i] += (block_content[edge_index-1]/block_width[edge_index-1]) * bin_width
-          continue
-        else: #if the bin is only partially in a block or even contains several blocks
-          ib = 1 #number of block edges included in the bin
-          while bin_edge - bin_width < block_edge[edge_index-1-ib]+dt_offset:
-            ib += 1
-
-          hist[i] += (block_content[edge_index-1]/block_width[edge_index-1]) * (bin_edge - (block_edge[edge_index-1]+dt_offset))
-          for iib in range(ib-1):
-            hist[i] += (block_content[edge_index-2-iib]/block_width[edge_index-2-iib]) * (block_edge[edge_index-1-iib] - block_edge[edge_index-2-iib])
-          hist[i] += (block_content[edge_index-1-ib]/block_width[edge_index-1-ib]) * ( (block_edge[edge_index-ib]+dt_offset) - bin_edge + bin_width)
-          continue
-
-    for i in range(self.h_bins):
-      bin_up_edge = self.h_low + (i+1) * bin_width #upper edge of the bin
-      bin_low_edge = self.h_low + i * bin_width #lower edge of the bin
-
-      for ii in range(len(self.hybrid_bin_value)):
-        if self.hybrid_bin_value[ii]+dt_offset > bin_low_edge and self.hybrid_bin_value[ii]+dt_offset <= bin_up_edge and self.hybrid_bin_value[ii] <= self.division:
-          hist[i] += 1/float(len(self.hybrid_bin_value))
-    self.hybrid_bin_value.clear()
-
-    return hist
-
-
-
+    best = np.zeros(ncells + 1) # best[r] = best fitness of cells 0..r-1
+    start = np.zeros(ncells, dtype=int)
+    cand = np.zeros(1, dtype=int) # candidate first cells of the last block
+    for r in range(ncells):
+      if not self.prune:
+        cand = np.arange(r + 1)
+      n = cn[r+1] - cn[cand]
+      fit = n * np.log(n / (edge[r+1] - edge[cand])) + best[cand]
+      i = np.argmax(fit) # ties go to the longest last block
+      best[r+1] = fit[i] + log_prior
+      start[r] = cand[i]
+      if self.prune:
+        cand = np.append(cand[fit >= fit[i] + log_prior], r + 1)
+    return start
+
+
+  def block_hist(self, blocks, dt_offset):
+    """
+    Histogram of the blocks (from bayesian_block()) shifted by dt_offset,
+    in h_bins bins between h_low and h_up, normalised to the number of
+    values.  Each block spreads its values uniformly over its width.
+    dt_offset may be an array, in which case the result has one
+    histogram per offset, shape (len(dt_offset), h_bins).
+    """
+    block_edge, block_count, uniform = blocks
+    n = np.sum(block_count) + len(uniform)
+    dt = np.asarray(dt_offset, dtype=np.float64)[...,np.newaxis]
+    x = np.linspace(self.h_low, self.h_up, self.h_bins + 1) - dt
+    if len(block_edge) > 0:
+      cum = np.concatenate(([ 0.0 ], np.cumsum(block_count)))
+      hist = np.diff(np.interp(x, block_edge, cum), axis=-1)
+    else:
+      hist = np.zeros(x.shape[:-1] + (self.h_bins,))
+    # uniformly binned values v count in bins low < v + dt <= up
+    hist += np.diff(np.searchsorted(uniform, x, side='right'), axis=-1)
+    return hist / n if n > 0 else hist
@@ -49,15 +49,15 @@ class BiasTest(Node):
       if tf1 == None or tf2 == None:
         return False
     else:
-      tf1 = np.min(ts1.times)
-      tf2 = np.min(ts2.times)
+      tf1 = ts1.min()
+      tf2 = ts2.min()
     dtf = tf1 - tf2
     store_field(data, self.out_delta_field, dtf)
 
     # expected value of delta
     # note that aside from alpha, this only depends on first series
     alpha = len(ts2.times) / len(ts1.times)
-    s1 = np.sort(ts1.times)
+    s1 = ts1.sorted_times()
     k1 = range(len(s1))
     ik1 = np.arange(len(s1)) + 1.0
     e1 = np.exp(-ik1)
@@ -35,6 +35,8 @@ import numpy as np
 from snewpdag.dag import Node
 
 class BinnedAccumulator(Node):
+  stateless_reset = True
+
   def __init__(self, in_field, nbins, xlow, xhigh,
                out_xfield, out_yfield, **kwargs):
     self.nbins = nbins
@@ -78,6 +80,33 @@ class BinnedAccumulator(Node):
     self.changed = True
     return False
 
+  def snapshot(self):
+    return {
+            'shape': (self.nbins, self.xlow, self.xhigh),
+            'bins': self.bins.copy(),
+            'underflow': self.underflow,
+            'overflow': self.overflow,
+            'sum': self.sum,
+            'sum2': self.sum2,
+            'count': self.count,
+           }
+
+  def restore(self, snapshot):
+    if snapshot['shape'] != (self.nbins, self.xlow, self.xhigh):
+      logging.error('{}: incompatible histogram {}'.format(
+                    self.name, snapshot['shape']))
+      return
+    self.bins = snapshot['bins'].copy()
+    self.underflow = snapshot['underflow']
+    self.overflow = snapshot['overflow']
+    self.sum = snapshot['sum']
+    self.sum2 = snapshot['sum2']
+    self.count = snapshot['count']
+    # same edges as np.histogram() would give in alert()
+    if self.count > 0:
+      self.edges = np.linspace(float(self.xlow), float(self.xhigh), self.nbins+1)
+    self.changed = True
+
   def reset(self, data):
     return False
 
@@ -45,8 +45,8 @@ class BurstTime(Node):
       return False
 
     # bin the time series
-    t1 = np.min(ts.times)
-    t2 = np.max(ts.times)
+    t1 = ts.min()
+    t2 = ts.max()
     nb = int((t2 - t1) / self.twidth) + 1
     t2a = t1 + nb * self.twidth
     h, edges = ts.histogram(nb, start=t1, stop=t2a)
@@ -65,7 +65,8 @@ class BurstTime(Node):
         break
     tf = t1 + (i + 1) * self.twidth
     logging.debug('{}:  i = {}, h = {}'.format(self.name, i, h[:i+1]))
-    evs = np.sort(ts.times[ts.times < tf]) # only sort those events before tf
+    tsort = ts.sorted_times()
+    evs = tsort[:np.searchsorted(tsort, tf)] # events before tf
 
     # if lead_time > 0, estimate background rate/s; otherwise 0
     bg_rate = 0.0
@@ -74,7 +75,7 @@ class BurstTime(Node):
 
     else:
       tbg = t1 + self.lead_time
-      nbg = np.sum([ts.times < tbg])
+      nbg = np.searchsorted(tsort, tbg)
       bg_rate = nbg / self.lead_time
       logging.debug('{}:  nbg = {}, bg_rate = {}'.format(self.name, nbg, bg_rate))
 
@@ -7,6 +7,13 @@ Constructor Arguments:
                 options: "HK", "IC", "JUNO", "KM3", "SK"                           / same as in NeutrinoArrivalTime
     detector_location: csv file name ('detector_location.csv')                  __/
     NSIDE: (int) healpy map parameter, it describes map resolution (32 is a reasonable number)
+    max_nside: (int, optional) finest nside for adaptive resolution. The map is evaluated at NSIDE,
+                and pixels which may be within a margin of the minimum chi2 are split into their
+                nested children, repeatedly up to max_nside (see SkymapRefine)
+    refine_chi2: (optional) chi2 margin for refinement
+    refine_cl: credible level for the margin if refine_chi2 is not given (default 0.9999)
+    refine_output: 'dense' (default) for a map upsampled to max_nside,
+                or 'moc' for a multi-order map (values.MultiOrderMap)
 
 Output:
     adds hp map (np.array) in nested ordering as 'chi2' and number of DOF (int) as 'ndof' to data
@@ -21,11 +28,16 @@ from scipy.stats import chi2
 from datetime import datetime
 
 from snewpdag.dag import Node
+from snewpdag.plugins import SkymapRefine as SR
 
 
 class Chi2Calculator(Node):
+    # read from the detector file, and not modified afterwards
+    shared = ('detector_info',)
+
     def __init__(self, detector_list, detector_location,
-                NSIDE, **kwargs):
+                NSIDE, max_nside=None, refine_chi2=None, refine_cl=0.9999,
+                refine_output='dense', **kwargs):
         self.detector_info = {}
         with open(detector_location, 'r') as f:
             detectors = csv.reader(f)
@@ -41,6 +53,10 @@ class Chi2Calculator(Node):
                 self.detector_info[name] = [lon, lat, height, sigma, bias]
         self.NSIDE = NSIDE
         self.NPIX = hp.nside2npix(NSIDE)
+        self.max_nside = max_nside
+        self.refine_chi2 = refine_chi2
+        self.refine_cl = refine_cl
+        self.refine_output = refine_output
         self.map = {}
 
         self.measured_times = {}
@@ -69,19 +85,12 @@ class Chi2Calculator(Node):
 
 
     # Generates precision matrix (inverse of covariance matrix)
+    # rows/columns ordered as in measured_det_info
     def generatePrecisionMatrix(self, measured_det_info, det0_info):
-
-        n_det = len(measured_det_info)
         sigma_0 = det0_info[3]
-        V = np.zeros((n_det, n_det))
-
-        for i in range(n_det):
-            for j in range(n_det):
-                if i == j:
-                    det = list(measured_det_info.keys())[i]
-                    V[i][j] = sigma_0**2 + self.detector_info[det][3]**2
-                else:
-                    V[i][j] = sigma_0**2
+        sigmas = np.array([ info[3] for info in measured_det_info.values() ])
+        V = np.full((len(sigmas), len(sigmas)), sigma_0**2)
+        V[np.diag_indices_from(V)] += sigmas**2
         return np.linalg.inv(V)
 
     # Generates unit vector for given lattitude and longnitude,
@@ -91,9 +100,9 @@ class Chi2Calculator(Node):
         x = np.cos(lon)*np.cos(lat)
         y = np.sin(lon)*np.cos(lat)
         z = np.sin(lat)
-        return np.matrix([x, y, z]).getT()
+        return np.array([x, y, z])
 
-    # Calculates detecotr position in cartesian coordinates
+    # Calculates detector position in cartesian coordinates
     def det_cartesian_position(self, det):
         ang_rot = 7.29e-5  # radians/s
         ang_sun = 2e-7  # radians/s   2pi/365days
@@ -114,55 +123,55 @@ class Chi2Calculator(Node):
 
         return r*self.angles_to_unit_vec(lon, lat)
 
-    # Calculates time_diff given detector names and supernova location
-    def time_diff(self, det1, det2, n):
+    # Calculates baselines (det - det0)/c, shape (n_detectors, 3).
+    # Positions only depend on the arrival time, so once per alert.
+    def baselines(self, measured_det_info, det0_info):
         c = 3.0e8  # speed of light /m*s^-1
 
-        det1_pos = self.det_cartesian_position(det1)
-        det2_pos = self.det_cartesian_position(det2)
-
-        diff = float((det1_pos - det2_pos).getT() @ n)/c
+        det0_pos = self.det_cartesian_position(det0_info)
+        return np.array([ self.det_cartesian_position(info) - det0_pos
+                          for info in measured_det_info.values() ]) / c
 
-        return diff
-
-    # Calculates chi2 for given vector d
+    # Calculates chi2 for vectors d, shape (n_detectors, npix)
     def chi2(self, d):
-        return (d.getT() @ (self.precision_matrix @ d))
+        return np.einsum('ip,ij,jp->p', d, self.precision_matrix, d)
 
-    # Calculates vector d given supernova position and time differences
+    # Calculates vectors d for all pixel directions n, shape (3, npix),
+    # given time differences
     def d_vec(self, n, measured, measured_det_info, det0_time, det0_info):
-        n_detectors = len(measured)
-        d = np.zeros(n_detectors)
-
-        for i in range(n_detectors):
-            det = list(measured.keys())[i]
-            
-            d[i] = measured[det][0] + measured[det][1] / 1e9 \
-                 - det0_time[0] - det0_time[1] / 1e9
-
-            d[i] = d[i] - measured_det_info[det][4] + det0_info[4]
-            d[i] -= self.time_diff(measured_det_info[det], det0_info, n)
-
-        return np.matrix(d).getT()
+        dt = np.array([ measured[det][0] - det0_time[0] \
+                        + (measured[det][1] - det0_time[1]) / 1e9 \
+                        - measured_det_info[det][4] + det0_info[4]
+                        for det in measured_det_info ])
+        return dt[:,np.newaxis] \
+               - self.baselines(measured_det_info, det0_info) @ n
 
     # Generates chi2 map
     def generate_map(self, measured, measured_det_info, det0_time, det0_info):
-        map = np.zeros(self.NPIX)
-
-        for i in range(self.NPIX):
-            delta, alpha = hp.pixelfunc.pix2ang(self.NSIDE, i, nest=True)
-
-            delta -= np.pi/2
-            alpha -= np.pi
-
-            n_pointing = -1*self.angles_to_unit_vec(alpha, delta)
-            map[i] = self.chi2(self.d_vec(n_pointing, measured, measured_det_info, det0_time, det0_info))
-
-        chi2_min = map.min()
-        for i in range(self.NPIX):
-            map[i] -= chi2_min
-
-        return map
+        if self.max_nside != None and self.max_nside > self.NSIDE:
+            return self.refine_map(measured, measured_det_info,
+                                   det0_time, det0_info)
+        # pointing vectors towards supernova for all pixels at once
+        n_pointing = np.array(hp.pixelfunc.pix2vec(self.NSIDE,
+                                                   np.arange(self.NPIX),
+                                                   nest=True))
+        map = self.chi2(self.d_vec(n_pointing, measured, measured_det_info,
+                                   det0_time, det0_info))
+        return map - map.min()
+
+    # Generates chi2 map with adaptive resolution, from NSIDE to max_nside,
+    # as a MultiOrderMap ('moc' output) or upsampled to max_nside ('dense')
+    def refine_map(self, measured, measured_det_info, det0_time, det0_info):
+        def evaluate(nside, ipix):
+            n = np.array(hp.pixelfunc.pix2vec(nside, ipix, nest=True))
+            return self.chi2(self.d_vec(n, measured, measured_det_info,
+                                        det0_time, det0_info))
+        delta = SR.margin(self.refine_chi2, self.refine_cl, len(measured) - 1)
+        map = SR.refine(evaluate, self.NSIDE, self.max_nside, delta)
+        map.values -= map.values.min()
+        if self.refine_output == 'moc':
+            return map
+        return map.to_dense(self.max_nside)
 
 
     def alert(self, data):
@@ -10,7 +10,6 @@ Arguments:
   pair_time:  coincidence window in s
 """
 import logging
-import numpy as np
 
 from snewpdag.dag import Node
 from snewpdag.dag.lib import fetch_field, store_field
@@ -27,7 +26,7 @@ class CoincSeries(Node):
     ts, valid = fetch_field(data, self.in_series_field)
     if not valid:
       return False
-    tsort = np.sort(ts.times)
+    tsort = ts.sorted_times()
     tsort0 = tsort[:-1]
     dt = tsort[1:] - tsort0
     tc = tsort0[dt < self.pair_time]
@@ -14,6 +14,10 @@ The finest-grained healpix pixellation is chosen.
 We use the healpy.ud_grade() function to upgrade.
 The map is always assumed to be in nested order.
 
+If any of the maps is a values.MultiOrderMap, they are all combined as
+multi-order maps (dense maps are converted), and the output is one too,
+with the finer pixels of the inputs everywhere.
+
 May also add a function to input.
 """
 import logging
@@ -22,6 +26,7 @@ import healpy as hp
 from scipy.stats import chi2
 
 from snewpdag.dag import Node
+from snewpdag.values import MultiOrderMap
 
 class CombineMaps(Node):
   def __init__(self, force_cl, **kwargs):
@@ -70,6 +75,12 @@ class CombineMaps(Node):
           use_chi2 = False
           break
 
+    if any([ isinstance(self.map[k]['chi2'] if 'chi2' in self.map[k]
+                        else self.map[k]['cl'], MultiOrderMap)
+             for k in self.map if self.map[k]['valid'] ]):
+      self.combine_multiorder(data, use_chi2)
+      return self.combine_histories(data)
+
     # find finest binning.
     # for nested ordering, nside values can only be powers of 2,
     # so just take largest value
@@ -118,6 +129,37 @@ class CombineMaps(Node):
           m *= ma
       data['cl'] = m
 
+    return self.combine_histories(data)
+
+  def combine_multiorder(self, data, use_chi2):
+    """
+    Combine the valid maps as MultiOrderMap's.
+    """
+    m = None
+    df = 0
+    for k in self.map:
+      v = self.map[k]
+      if v['valid']:
+        ma = v['chi2'] if 'chi2' in v else v['cl']
+        if not isinstance(ma, MultiOrderMap):
+          ma = MultiOrderMap.from_dense(np.array(ma))
+        if 'chi2' in v and not use_chi2:
+          ma = MultiOrderMap(ma.uniq, chi2(v['ndof']).cdf(ma.values))
+        if m == None:
+          m = ma.copy()
+        else:
+          m.combine(ma, 'sum' if use_chi2 else 'product')
+        if use_chi2:
+          df += v['ndof']
+    if m == None: # nothing valid
+      m = MultiOrderMap.from_dense(np.zeros(12) if use_chi2 else np.ones(12))
+    if use_chi2:
+      data['chi2'] = m
+      data['ndof'] = df
+    else:
+      data['cl'] = m
+
+  def combine_histories(self, data):
     # notify
     hlist = []
     for k in self.map:
@@ -13,6 +13,8 @@ import logging
 from snewpdag.dag import Node
 
 class Copy(Node):
+  stateless_reset = True
+
   def __init__(self, cp, **kwargs):
     self.cp = []
     for op in cp:
@@ -6,6 +6,15 @@ Arguments:
   detector_location: filename of detector database for DetectorDB
   nside: healpix nside parameter, i.e., skymap resolution
   min_dts: minimum number of time differences in order to do calculation
+  max_nside: (optional) finest nside for adaptive resolution.  If greater
+    than nside, the map is evaluated at nside, and pixels which may be
+    within a margin of the minimum chi2 are split into their nested
+    children, repeatedly up to max_nside (see SkymapRefine).
+  refine_chi2: (optional) chi2 margin for refinement
+  refine_cl: credible level for the margin if refine_chi2 not given
+    (default 0.9999)
+  refine_output: 'dense' (default) for a map upsampled to max_nside,
+    or 'moc' for a values.MultiOrderMap
 
 Input payload:
   dts: a dictionary of time differences. Keys are of form (det1,det2),
@@ -22,25 +31,35 @@ Input payload:
       dsig2: (d(dt)/dt2) * sigma2, in seconds, for covariance calculation.
 
 Output payload:
-  map: healpix map with specified nside, nested ordering.
+  map: healpix map with specified nside (max_nside if refining),
+    nested ordering, or a MultiOrderMap ('moc' output).
   ndof: 2
   map_zeroes: indices of bins with 0 value (min chi2)
+    (NUNIQ indices for a MultiOrderMap)
 """
 import sys
 import logging
 import numpy as np
 import healpy as hp
+from scipy.linalg import cholesky, solve_triangular
 
 from snewpdag.dag import Node, Detector, DetectorDB, CelestialPixels
+from snewpdag.plugins import SkymapRefine as SR
 from astropy import units as u
 from astropy.time import Time
 
 class DiffPointing(Node):
-  def __init__(self, detector_location, nside, min_dts, **kwargs):
+  def __init__(self, detector_location, nside, min_dts, max_nside=None,
+               refine_chi2=None, refine_cl=0.9999, refine_output='dense',
+               **kwargs):
     self.db = DetectorDB(detector_location)
     self.nside = nside
     self.npix = hp.nside2npix(nside)
     self.min_dts = min_dts
+    self.max_nside = max_nside
+    self.refine_chi2 = refine_chi2
+    self.refine_cl = refine_cl
+    self.refine_output = refine_output
     self.cache = {} # (det1, det2): dt, t1, t2, bias, var, dsig1, dsig2
     super().__init__(**kwargs)
 
@@ -98,6 +117,16 @@ class DiffPointing(Node):
       directions = direction hypotheses, Cartesian unit vector, shape [3,nv]
     Returns vector as np.array with shape [nv,nkeys]
     """
+    ddt, dp = self.baselines(keys)
+    d = np.transpose(dp @ directions) # [nv,nkeys]
+    d = d + ddt # broadcast adding ddt to each column
+    return d
+
+  def baselines(self, keys):
+    """
+    Time differences corrected for bias, shape [nkeys],
+    and baselines (p1-p2)/c in s, shape [nkeys,3].
+    """
     rc = 1.0 / 3.0e8 # 1/(m/s)
     nkeys = len(keys) # number of detector pairs
     ddt = np.zeros(nkeys)
@@ -113,93 +142,87 @@ class DiffPointing(Node):
       p2[i] = det2.get_xyz(Time(dts['t2'], format='unix'))
       i += 1
     dp = (p1 - p2) * rc # s, shape [nkeys,3]
-    d = np.transpose(dp @ directions) # [nv,nkeys]
-    d = d + ddt # broadcast adding ddt to each column
     logging.info('ddt = {}'.format(ddt))
     logging.info('dp = {}'.format(dp))
-    return d
+    return ddt, dp
 
-  def weight_matrix(self, keys):
+  def covariance(self, keys):
     """
-    Calculate weight matrix.
+    Calculate covariance matrix of the time differences.
     Arguments:
       keys = ordered list of keys of (det1, det2).
     Returns matrix as np.array, columns/rows ordered as in keys.
     """
-    dim = len(self.cache)
-    v = np.zeros([dim, dim])
-    i = 0
-    for k1 in keys:
-      d1 = self.cache[k1]
-      j = 0
-      for k2 in keys:
-        d2 = self.cache[k2]
-        if i == j:
-          v[i,j] = d2['var']
-        else:
-          if k1[0] == k2[0]:
-            v[i,j] = d1['dsig1'] * d2['dsig1']
-          elif k1[1] == k2[1]:
-            v[i,j] = d1['dsig2'] * d2['dsig2']
-          elif k1[0] == k2[1]:
-            v[i,j] = d1['dsig1'] * d2['dsig2']
-          elif k1[1] == k2[0]:
-            v[i,j] = d1['dsig2'] * d2['dsig1']
-        j += 1
-      i += 1
-    # then invert the matrix
+    k1 = np.array([ k[0] for k in keys ])
+    k2 = np.array([ k[1] for k in keys ])
+    dsig1 = np.array([ self.cache[k]['dsig1'] for k in keys ])
+    dsig2 = np.array([ self.cache[k]['dsig2'] for k in keys ])
+    var = np.array([ self.cache[k]['var'] for k in keys ])
+    # pairs sharing a detector are correlated.
+    # Later where()'s take priority, so in order of precedence:
+    # same first, same second, first of row = second of column, vice versa.
+    v = np.where(k2[:,None] == k1[None,:], np.outer(dsig2, dsig1), 0.0)
+    v = np.where(k1[:,None] == k2[None,:], np.outer(dsig1, dsig2), v)
+    v = np.where(k2[:,None] == k2[None,:], np.outer(dsig2, dsig2), v)
+    v = np.where(k1[:,None] == k1[None,:], np.outer(dsig1, dsig1), v)
+    np.fill_diagonal(v, var)
     logging.info('covariance matrix = {}'.format(v))
+    return v
+
+  def log_singular(self, keys, v):
+    logging.error('{}:  exception {}'.format(self.name, sys.exc_info()))
+    logging.error('{}:  dim = {}'.format(self.name, len(v)))
+    logging.error('{}:  v = {}'.format(self.name, v))
+    for k in keys:
+      d = self.cache[k]
+      logging.error('{}:  key = {}'.format(self.name, k))
+      logging.error('{}:    dt = {}, bias = {}'.format(self.name, d['dt'], d['bias']))
+      logging.error('{}:    var = {}, dsig1 = {}, dsig2 = {}'.format(self.name, d['var'], d['dsig1'], d['dsig2']))
+
+  def chi2(self, keys, d):
+    """
+    Calculate chi2 = d^T V^-1 d for each row of d (shape [nv,nkeys]),
+    as the squared norm of the residuals whitened by the Cholesky
+    factor of the covariance matrix V, i.e., without inverting V.
+    If V isn't positive definite (e.g., inconsistent input variances),
+    solve V x = d instead.
+    Returns array of shape [nv] (zeroes if V is singular).
+    """
+    v = self.covariance(keys)
+    try:
+      l = cholesky(v, lower=True)
+      z = solve_triangular(l, d.T, lower=True, check_finite=False) # [nkeys,nv]
+      return np.einsum('ij,ij->j', z, z)
+    except np.linalg.LinAlgError:
+      pass
     try:
-      res = np.linalg.inv(v)
-    except:
-      logging.error('{}:  exception {}'.format(self.name, sys.exc_info()))
-      logging.error('{}:  dim = {}'.format(self.name, dim))
-      logging.error('{}:  v = {}'.format(self.name, v))
-      for k in keys:
-        d = self.cache[k]
-        logging.error('{}:  key = {}'.format(self.name, k))
-        logging.error('{}:    dt = {}, bias = {}'.format(self.name, d['dt'], d['bias']))
-        logging.error('{}:    var = {}, dsig1 = {}, dsig2 = {}'.format(self.name, d['var'], d['dsig1'], d['dsig2']))
-      res = 0
-    return res
+      x = np.linalg.solve(v, d.T) # [nkeys,nv]
+      return np.einsum('ij,ij->j', d.T, x)
+    except np.linalg.LinAlgError:
+      self.log_singular(keys, v)
+      return np.zeros(len(d))
 
   def reevaluate(self, data):
     """
     Reevaluate direction based on available time differences
     """
-    keys = self.cache.keys() # keep list to preserve order
-    w = self.weight_matrix(keys) # shape [nkeys,nkeys]
+    keys = list(self.cache.keys()) # keep list to preserve order
 
     # Get the average time of the observing detectors.
     # Use this for time for transforming ICRS into GCRS
     # so triangulation can be done with Earth locations.
     t0 = self.average_time()
 
-    ## get unit vectors to pixel centers.
-    ## The pixel centers are for a skymap in ICRS coordinates.
-    ## We need the unit vectors in GCRS.
-    #c = hp.pixelfunc.pix2ang(self.nside, range(self.npix), \
-    #                         nest=True, lonlat=True)
-    ## c will be an np.array of lon, lat, with shape (2,npix)
-    #sc = SkyCoord(ra=c[0], dec=c[1], unit=u.deg, frame='icrs', \
-    #              representation_type='unitspherical', obstime=t0)
-    #gc = sc.transform_to(GCRS)
-    ## gc is now an array of SkyCoord, but in (ra,dec)
-    #xyz = gc.represent_as(CartesianRepresentation)
-    ## xyz is an array of (x,y,z) unit vectors
-    #rs = np.stack( (xyz.x, xyz.y, xyz.z) ) # shape (3,npix)
+    # get unit vectors to pixel centers.
+    # The pixel centers are for a skymap in ICRS coordinates.
+    # We need the unit vectors in GCRS.
     cp = CelestialPixels()
-    rs = cp.get_map(self.nside, t0)
+    if self.max_nside != None and self.max_nside > self.nside:
+      return self.refine(data, keys, cp, t0)
+    rs = np.asarray(cp.get_map(self.nside, t0)) # shape (3,npix), no units
 
-    # the following was used when we assumed skymap was in GCRS
-    #rs = hp.pixelfunc.pix2vec(self.nside, range(self.npix), nest=True)
-    # rs will be an np.array of x,y,z values, each triple a unit vector.
-    # however, it'll be returned in shape (3,npix)
     d = self.d_vectors(keys, rs) # returns shape (npix,nkeys)
-    dw = d @ w # returns shape (npix,nkeys)
-    m = np.zeros(self.npix)
-    for i in range(self.npix):
-      m[i] = np.dot(dw[i], d[i])
+    m = self.chi2(keys, d)
 
     chi2_min = m.min()
     m -= chi2_min
@@ -208,6 +231,26 @@ class DiffPointing(Node):
     data['map_zeroes'] = np.flatnonzero(m == 0.0)
     return data
 
+  def refine(self, data, keys, cp, t0):
+    """
+    Evaluate the map with adaptive resolution, from nside to max_nside.
+    """
+    ddt, dp = self.baselines(keys)
+    def evaluate(nside, ipix):
+      rs = cp.get_pixels(nside, ipix, t0)
+      return self.chi2(keys, np.transpose(dp @ rs) + ddt)
+    delta = SR.margin(self.refine_chi2, self.refine_cl, 2)
+    mo = SR.refine(evaluate, self.nside, self.max_nside, delta)
+    mo.values -= mo.values.min()
+    if self.refine_output == 'moc':
+      data['map'] = mo
+      data['map_zeroes'] = mo.uniq[mo.values == 0.0]
+    else:
+      data['map'] = mo.to_dense(self.max_nside)
+      data['map_zeroes'] = np.flatnonzero(data['map'] == 0.0)
+    data['ndof'] = 2
+    return data
+
   def alert(self, data):
     if 'dts' in data: # dictionary of time differences
       for k in data['dts']:
@@ -244,7 +287,7 @@ class DiffPointing(Node):
               self.cache.pop(krev)
 
     if len(self.cache) >= self.min_dts:
-      return self.reevaluate()
+      return self.reevaluate(data)
     else:
       return True
 
@@ -23,6 +23,8 @@ import numpy as np
 from snewpdag.dag import Node
 
 class DistErrCalc(Node):
+    stateless_reset = True
+
     def __init__(self, in_field, xno, **kwargs):
         self.in_field = in_field
         self.xno = xno
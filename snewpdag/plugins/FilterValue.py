@@ -14,6 +14,8 @@ from snewpdag.dag import Node
 from snewpdag.dag.lib import fetch_field
 
 class FilterValue(Node):
+  stateless_reset = True
+
   def __init__(self, in_field, value, **kwargs):
     self.in_field = in_field
     self.value = value
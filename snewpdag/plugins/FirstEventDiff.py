@@ -36,22 +36,22 @@ class FirstEventDiff(Node):
       return False
 
     # difference between first times
-    tf1 = np.min(tsr1.times)
-    tf2 = np.min(tsr2.times)
+    tf1 = tsr1.min()
+    tf2 = tsr2.min()
     dtf = tf1 - tf2
 
     # subtract off one of the first times
     base = tf1 if tf1 < tf2 else tf2
-    ts1 = tsr1.times - base
-    ts2 = tsr2.times - base
+    ts1 = tsr1.sorted_times() - base
+    ts2 = tsr2.sorted_times() - base
     #tf1 = tf1 - base
     #tf2 = tf2 - base
 
     # expected value of delta
     # note that aside from alpha, this only depends on first series
     alpha = len(ts2) / len(ts1)
-    s1 = np.sort(ts1)
-    s2 = np.sort(ts2)
+    s1 = ts1 # sorted
+    s2 = ts2
     ik1 = np.arange(1.0, len(s1) + 1.0)
     e1 = np.exp(-ik1)
     et1 = np.sum(e1 * s1) / np.sum(e1) # exp val of t1
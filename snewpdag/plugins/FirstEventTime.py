@@ -9,7 +9,6 @@ Arguments:
   out_delta_field:  output field for burst - true time
 """
 import logging
-import numpy as np
 
 from snewpdag.dag import Node
 from snewpdag.dag.lib import fetch_field, store_field
@@ -27,7 +26,7 @@ class FirstEventTime(Node):
     ts, valid = fetch_field(data, self.in_field) # TimeSeries
     if not valid:
       return False
-    t1 = np.min(ts.times)
+    t1 = ts.min()
     logging.debug('t1 = {}'.format(t1))
     store_field(data, self.out_field, t1)
     t0, valid = fetch_field(data, self.in_truth_field)
@@ -10,7 +10,6 @@ Arguments:
   out_delta_field:  output field for burst - true time
 """
 import logging
-import numpy as np
 
 from snewpdag.dag import Node
 from snewpdag.dag.lib import fetch_field, store_field
@@ -29,7 +28,7 @@ class FirstPairTime(Node):
     ts, valid = fetch_field(data, self.in_field) # TimeSeries
     if not valid:
       return False
-    tsort = np.sort(ts.times)
+    tsort = ts.sorted_times()
     dt = tsort[1:] - tsort[:-1]
     for i in range(len(dt)):
       if dt[i] < self.max_dt:
@@ -29,6 +29,8 @@ Output json:
     error_sum, error_sum2 (default 0.0)
     (doesn't delete input field, since it's not much data
     and may be part of an aggregate)
+
+A batched payload (see dag/lib.py) fills one entry per trial.
 """
 import sys
 import logging
@@ -36,8 +38,12 @@ import math
 import numpy as np
 
 from snewpdag.dag import Node
+from snewpdag.dag.lib import batch_split
 
 class Histogram1D(Node):
+
+  batch = True
+
   def __init__(self, nbins, xlow, xhigh, in_field, **kwargs):
     self.nbins = nbins
     self.xlow = xlow
@@ -68,7 +74,10 @@ class Histogram1D(Node):
     self.sys_sum = 0.0
     self.sys_sum2 = 0.0
 
-  def fill(self, data):
+  def extract(self, data):
+    """
+    Return the value to fill from the payload, or None if not found.
+    """
     if self.field in data:
       if self.index != None:
         if isinstance(self.index, int) or self.index in data[self.field]:
@@ -79,18 +88,24 @@ class Histogram1D(Node):
               logging.info('{0}: index2 {1} not found in data'.format(
                            self.name, self.index2))
               logging.info('data = {}'.format(data[self.field][self.index]))
-              return
+              return None
           else:
             x = data[self.field][self.index]
         else:
           logging.info('{0}: index {1} not found in data'.format(
                        self.name, self.index))
-          return
+          return None
       else:
         x = data[self.field]
     else:
       # field not in data
       logging.info('{0}: field {1} not found in data'.format(self.name, self.field))
+      return None
+    return x
+
+  def fill(self, data):
+    x = self.extract(data)
+    if x is None:
       return
 
     try:
@@ -127,6 +142,49 @@ class Histogram1D(Node):
     self.count += 1
     self.changed = True
 
+  def fill_batch(self, data):
+    """
+    Fill all trials of a batched payload at once.
+    """
+    xs = []
+    errs = []
+    for d in batch_split(data):
+      x = self.extract(d)
+      if x is None:
+        continue
+      xs.append(x)
+      if self.field+"_err" in d:
+        errs.append((d[self.field+"_err"], d[self.field+"_stats"],
+                     d[self.field+"_sys"]))
+      else:
+        errs.append((0.0, 0.0, 0.0))
+    try:
+      x = np.asarray(xs, dtype=float)
+    except:
+      logging.info('Calculation error in {0}: {1}'.format(self.name, sys.exc_info()))
+      return
+    # same binning as int() in fill(), i.e., truncated towards 0
+    ok = np.isfinite(x)
+    x = x[ok]
+    y = self.nbins * (x - self.xlow) / (self.xhigh - self.xlow)
+    ix = np.clip(y, -1.0, self.nbins).astype(int)
+    self.underflow += float(np.sum(ix < 0))
+    self.overflow += float(np.sum(ix >= self.nbins))
+    inside = (ix >= 0) & (ix < self.nbins)
+    self.bins += np.bincount(ix[inside], minlength=self.nbins)
+    self.sum += np.sum(x)
+    self.sum2 += np.sum(x*x)
+    if len(errs) > 0:
+      e = np.asarray(errs, dtype=float)[ok]
+      self.error_sum += np.sum(e[:,0])
+      self.error_sum2 += np.sum(e[:,0]**2)
+      self.stats_sum += np.sum(e[:,1])
+      self.stats_sum2 += np.sum(e[:,1]**2)
+      self.sys_sum += np.sum(e[:,2])
+      self.sys_sum2 += np.sum(e[:,2]**2)
+    self.count += len(x)
+    self.changed = True
+
   def summary(self):
     return {
             'name': self.name,
@@ -176,8 +234,47 @@ class Histogram1D(Node):
       xx = self.sum2 / self.count
       return xx - x*x
 
+  def snapshot(self):
+    return {
+            'shape': (self.nbins, self.xlow, self.xhigh),
+            'bins': self.bins.copy(),
+            'underflow': self.underflow,
+            'overflow': self.overflow,
+            'sum': self.sum,
+            'sum2': self.sum2,
+            'count': self.count,
+            'error_sum': self.error_sum,
+            'error_sum2': self.error_sum2,
+            'stats_sum': self.stats_sum,
+            'stats_sum2': self.stats_sum2,
+            'sys_sum': self.sys_sum,
+            'sys_sum2': self.sys_sum2,
+           }
+
+  def restore(self, snapshot):
+    if snapshot['shape'] != (self.nbins, self.xlow, self.xhigh):
+      logging.error('{}: incompatible histogram {}'.format(
+                    self.name, snapshot['shape']))
+      return
+    self.bins = snapshot['bins'].copy()
+    self.underflow = snapshot['underflow']
+    self.overflow = snapshot['overflow']
+    self.sum = snapshot['sum']
+    self.sum2 = snapshot['sum2']
+    self.count = snapshot['count']
+    self.error_sum = snapshot['error_sum']
+    self.error_sum2 = snapshot['error_sum2']
+    self.stats_sum = snapshot['stats_sum']
+    self.stats_sum2 = snapshot['stats_sum2']
+    self.sys_sum = snapshot['sys_sum']
+    self.sys_sum2 = snapshot['sys_sum2']
+    self.changed = True
+
   def alert(self, data):
-    self.fill(data)
+    if 'batch' in data:
+      self.fill_batch(data)
+    else:
+      self.fill(data)
     return False # don't forward an alert
 
   def reset(self, data):
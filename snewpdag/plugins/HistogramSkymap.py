@@ -23,6 +23,8 @@ import healpy as hp
 from snewpdag.dag import Node
 
 class HistogramSkymap(Node):
+  stateless_reset = True
+
   def __init__(self, nside, in_field, out_field, out_err_field, **kwargs):
     self.in_field = in_field
     self.out_field = out_field
@@ -39,6 +41,16 @@ class HistogramSkymap(Node):
       self.m[js] += weight
     return False
 
+  def snapshot(self):
+    return { 'm': self.m.copy() }
+
+  def restore(self, snapshot):
+    if len(snapshot['m']) != len(self.m):
+      logging.error('{}: incompatible skymap with {} pixels'.format(
+                    self.name, len(snapshot['m'])))
+      return
+    self.m = snapshot['m'].copy()
+
   def reset(self, data):
     return False
 
@@ -14,6 +14,8 @@ from snewpdag.dag import Node
 from snewpdag.dag.lib import fetch_field
 
 class LagPull(Node):
+  stateless_reset = True
+
   def __init__(self, out_field, in_obs_field, in_err_field, in_true_field,
                in_base_field = None, on = ['alert'], **kwargs):
     self.out_field = out_field
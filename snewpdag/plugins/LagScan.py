@@ -0,0 +1,171 @@
+"""
+LagScan:  base class for estimating lags between detector time series
+
+Subclasses provide the statistic to be maximized:
+  profile(k1, kref, dt):  required, statistic for detector k1 relative
+    to kref at an array of uniformly spaced lags dt (s).
+    The constructor checks that it is defined.
+  statistic(k1, kref, dt):  optional, statistic at a single lag dt (s),
+    as used by the 'brent' search.  By default this evaluates profile()
+    at the one lag; override it if there is a faster way.
+  result(k1, kref, best, dt, y):  output for the pair.  dt and y are the
+    scan points and profile, or None if k1 is the reference itself.
+  prepare(keys):  optional, called before the pairs are evaluated
+    (possibly in parallel), e.g., to fill shared tables.
+
+Arguments:
+  tnbins:  nbins for timing comparison between detectors
+  twidth:  timespan (s) for timing histogram
+  in_field:  input field for a new time series
+  in_det_field:  field containing detector identifier
+  in_det_list_field:  field containing list of detectors to match
+  out_lags_field:  output field for { (det, ref): lag } dict
+  fixed_ref:  default None, otherwise calculate all lags relative to
+    identified detector.  If None, the reference is the detector with
+    the most events.
+  scan:  (optional) [ low, high, step ] of lags (s) to scan.
+    Default depends on the subclass.
+  search:  (optional) 'grid' (default) evaluates the whole scan and
+    refines the peak with a parabola (if refine is True).
+    'brent' evaluates a coarse grid, then refines the best point
+    with a bounded Brent (golden section plus parabolic) maximization
+    to a tolerance of one scan step.
+  coarse:  (optional) coarse grid spacing for 'brent' search,
+    default 10 scan steps
+  refine:  (optional) default True, refine the best lag of a 'grid' search
+    with a parabola through the peak of the profile
+  threads:  (optional) evaluate detector pairs in a pool of this many
+    threads (default None, i.e., one pair after another).
+    The numpy kernels release the GIL for most of their work.
+"""
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy.optimize import minimize_scalar
+
+from snewpdag.dag import Node
+from snewpdag.dag.lib import parabolic_peak
+
+class LagScan(Node):
+  # default scan range and step (s)
+  scan = (-0.05, 0.05, 0.0001)
+
+  def __init__(self, tnbins, twidth,
+               in_field, in_det_field, in_det_list_field,
+               out_lags_field,
+               fixed_ref = None,
+               scan = None,
+               search = 'grid',
+               coarse = None,
+               refine = True,
+               threads = None,
+               **kwargs):
+    if not callable(getattr(self, 'profile', None)):
+      raise TypeError('{} does not define profile()'.format(
+                      type(self).__name__))
+    self.tnbins = tnbins # nbins for time histogram
+    self.twidth = twidth # time span (s) for histogram
+    self.in_field = in_field
+    self.in_det_field = in_det_field
+    self.in_det_list_field = in_det_list_field
+    self.out_lags_field = out_lags_field
+    self.fixed_ref = fixed_ref
+    if scan != None:
+      self.scan = tuple(scan)
+    self.search = search
+    self.coarse = 10.0 * self.scan[2] if coarse == None else coarse
+    self.refine = refine
+    self.threads = threads
+    self.cache = {} # { <det>: <TimeSeries> }
+    self.last_burst_report = -1 # only forward one report per burst id
+    super().__init__(**kwargs)
+
+  def statistic(self, k1, kref, dt):
+    return self.profile(k1, kref, np.array([ dt ]))[0]
+
+  def result(self, k1, kref, best, dt, y):
+    return (best, 0.0) if y is None else (best, 0.0, dt, y)
+
+  def prepare(self, keys):
+    pass
+
+  def lag(self, k1, kref):
+    """
+    Find the lag which maximizes the statistic.
+    """
+    t0, t1, step = self.scan
+    if k1 == kref:
+      return self.result(k1, kref, 0.0, np.arange(t0, t1, step), None)
+    if self.search == 'brent':
+      dt = np.arange(t0, t1, self.coarse)
+      y = self.profile(k1, kref, dt)
+      yb = np.argmax(y)
+      lo = max(t0, dt[yb] - self.coarse)
+      hi = min(t1, dt[yb] + self.coarse)
+      r = minimize_scalar(lambda t: - self.statistic(k1, kref, t),
+                          bounds=(lo, hi), method='bounded',
+                          options={ 'xatol': step })
+      # the statistic may be flat or step-like between grid points
+      best = r.x if -r.fun >= y[yb] else dt[yb]
+    else:
+      if self.search != 'grid':
+        logging.error('{}: unknown search {}, using grid'.format(
+                      self.name, self.search))
+      dt = np.arange(t0, t1, step)
+      y = self.profile(k1, kref, dt)
+      yb = np.argmax(y)
+      best = parabolic_peak(dt, y, yb) if self.refine else dt[yb]
+    return self.result(k1, kref, best, dt, y)
+
+  def reevaluate(self, data):
+    iref = -1
+    ks = [ k for k in self.cache.keys() ]
+    if self.fixed_ref != None:
+      if self.fixed_ref in ks:
+        iref = ks.index(self.fixed_ref)
+    if iref < 0:
+      # choose the detector with the most events as the reference
+      ys = [ self.cache[ks[i]].integral() for i in range(len(ks)) ]
+      iref = np.argmax(ys) # index of reference detector
+    self.prepare(ks)
+    pairs = [ (ks[j], ks[iref]) for j in range(len(ks)) ]
+    if self.threads != None and self.threads > 1 and len(pairs) > 1:
+      with ThreadPoolExecutor(max_workers=self.threads) as pool:
+        ls = list(pool.map(lambda p: self.lag(*p), pairs))
+    else:
+      ls = [ self.lag(*p) for p in pairs ]
+    data[self.out_lags_field] = dict(zip(pairs, ls))
+    return data
+
+  def alert(self, data):
+    if self.in_field in data and self.in_det_field in data:
+      self.cache[data[self.in_det_field]] = data[self.in_field]
+      if self.in_det_list_field in data:
+        if set(self.cache.keys()) == set(data[self.in_det_list_field]):
+          return self.reevaluate(data)
+    return False
+
+  def revoke(self, data):
+    if self.in_det_field in data:
+      k = data[self.in_det_field]
+      if k in self.cache:
+        del self.cache[k]
+        return True
+    return False
+
+  def reset(self, data):
+    if len(self.cache) > 0:
+      self.cache = {}
+      return True
+    else:
+      return False
+
+  def report(self, data):
+    if 'burst_id' in data:
+      if data['burst_id'] == self.last_burst_report:
+        return False
+      else:
+        self.last_burst_report = data['burst_id']
+        return True
+    else:
+      return True
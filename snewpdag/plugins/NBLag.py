@@ -12,32 +12,33 @@ Arguments:
     (one half of the interval which contains all points within logL interval)
   fixed_ref:  default None, otherwise calculate all lags relative to
     identified detector
+  bg:  (optional) dictionary of background rate per second of each detector
+  scan, search, coarse, refine, threads:  see LagScan
+    (scan defaults to 1ms steps, refine to False)
 """
 import logging
 import numpy as np
 import scipy.special as sc
 
-from snewpdag.dag import Node, LogTable
+from snewpdag.dag import LogTable
 from snewpdag.values import Hist1D, TimeSeries
+from . import LagScan
+
+class NBLag(LagScan):
+  # 1ms steps; the likelihood is expensive
+  scan = (-0.05, 0.05, 0.001)
 
-class NBLag(Node):
   def __init__(self, tnbins, twidth,
                in_field, in_det_field, in_det_list_field,
                out_lags_field,
-               fixed_ref = None,
                **kwargs):
-    self.tnbins = tnbins # nbins for time histogram
-    self.twidth = twidth # time span (s) for histogram
-    self.in_field = in_field
-    self.in_det_field = in_det_field
-    self.in_det_list_field = in_det_list_field
-    self.out_lags_field = out_lags_field
-    self.fixed_ref = fixed_ref
     self.bg = kwargs.pop('bg', {}) # background rate per second
-    self.cache = {} # { <det>: <TimeSeries> }
-    self.last_burst_report = -1 # only forward one report per burst id
     self.lt = LogTable()
-    super().__init__(**kwargs)
+    self.block = 256 # bin terms evaluated at a time in xprods()
+    # NBLag has always reported the best scan point
+    kwargs.setdefault('refine', False)
+    super().__init__(tnbins, twidth, in_field, in_det_field,
+                     in_det_list_field, out_lags_field, **kwargs)
 
   def xlognm(self, k1, k2, dt):
     w1 = self.cache[k1]
@@ -53,8 +54,8 @@ class NBLag(Node):
     # are included.  So we'll set the nominal start time 100ms
     # after the first event in w1.  Then when dt varies over its range,
     # both timeseries will start before the signal really turns on.
-    st1 = np.min(w1.times)
-    st2 = np.min(w2.times)
+    st1 = w1.min()
+    st2 = w2.min()
     st = st1 if st1 > st2 else st2
     st = st + 0.100 # 100ms buffer time
     h1, edges = w1.histogram(self.tnbins, st, st + self.twidth)
@@ -151,8 +152,8 @@ class NBLag(Node):
     # are included.  So we'll set the nominal start time 100ms
     # after the first event in w1.  Then when dt varies over its range,
     # both timeseries will start before the signal really turns on.
-    st1 = np.min(w1.times)
-    st2 = np.min(w2.times)
+    st1 = w1.min()
+    st2 = w2.min()
     st = st1 if st1 > st2 else st2
     st = st + 0.100 # 100ms buffer time
     h1, edges = w1.histogram(self.tnbins, st, st + self.twidth)
@@ -173,84 +174,103 @@ class NBLag(Node):
       s = self.xprod(h1[k], h2[k], a, b, c)
       #logging.info('{}: time bin = {}, s = {}'.format(self.name, k, s))
       x = x + s
-    logging.info('{}: dt = {}, x = {}'.format(self.name, dt, x))
+    logging.debug('{}: dt = {}, x = {}'.format(self.name, dt, x))
     return x
 
-  def lag(self, k1, kref):
-    # find best lag
-    hdt = 0.001
-    t0 = -0.05
-    t1 = 0.05
-    #hdt = 0.002 # FA values
-    #t0 = -1.0
-    #t1 = 1.0
-    dt = np.arange(t0, t1, hdt)
-    if k1 == kref:
-      return { 'dt': 0.0,
-               't1': np.min(self.cache[k1].times), \
-               't2': np.min(self.cache[kref].times), \
-               'bias': 0.0, 'var': 0.0, 'dsig1': 0.0, 'dsig2': 0.0, \
-               'profile_x': dt, 'profile_y': np.zeros_like(dt) }
-
-    # estimate the error by calculating the second derivative
-    #y = np.array([ self.xlognm(k1, kref, dt[i]) for i in range(len(dt)) ])
-    # below is the wrong order for subsequent modules,
-    # but it puts the larger detector first in tests,
-    # which is what we need to avoid having to use the weights in logsumexp
-    #y = np.array([ self.xlognm(kref, k1, dt[i]) for i in range(len(dt)) ])
-    y = np.array([ self.xprodnm(k1, kref, dt[i]) for i in range(len(dt)) ])
-    yb = np.argmax(y)
-
-    return { 'dt': dt[yb],
-             't1': np.min(self.cache[k1].times), \
-             't2': np.min(self.cache[kref].times), \
-             'bias': 0.0, 'var': 0.0, 'dsig1': 0.0, 'dsig2': 0.0, \
-             'profile_x': dt, 'profile_y': y }
+  def xprods(self, n, m, a):
+    """
+    Same as xprod(n, m, a, b, c), for arrays of n, m and a.
+    The double sum in xprod is
+      exp(S) = int_0^inf e^-t (t + A)^n (t + B)^m dt / (n! m!)
+    with A = 1 + a, B = (1 + a) / a.  Expanding the binomial of the
+    larger of A, B around the smaller one (E) leaves a single sum of
+    positive terms with upper incomplete gamma functions,
+      exp(S) = e^E / (n! m!) sum_i C(k,i) D^i Gamma(n+m-i+1, E),
+    where k is m (if A <= B) or n, and D = |B - A|.
+    Log factorials come from the LogTable.
+    """
+    n = np.asarray(n, dtype=int)
+    m = np.asarray(m, dtype=int)
+    a = np.asarray(a, dtype=float)
+    x = np.full(n.shape, np.nan) # a <= 0 is undefined, as in xprod
+    ok = a > 0
+    n, m, a = n[ok], m[ok], a[ok]
+    if len(n) == 0:
+      return x
+    big = a > 1.0 # expand around B rather than A
+    ea = 1.0 + a
+    eb = ea / a
+    e = np.where(big, eb, ea)
+    d = np.abs(eb - ea)
+    k = np.where(big, n, m)
+    nm = n + m
+    lt = self.lt
+    lt.ensure(np.max(nm, initial=0))
+    y = np.zeros(len(k))
+    # evaluate in blocks of roughly equal k to limit padding
+    order = np.argsort(k)
+    for i0 in range(0, len(order), self.block):
+      idx = order[i0:i0 + self.block]
+      kk = k[idx]
+      i = np.arange(np.max(kk) + 1)
+      valid = i <= kk[:,np.newaxis]
+      ii = np.where(valid, i, 0)
+      with np.errstate(divide='ignore', invalid='ignore'):
+        ld = np.where(ii > 0, ii * np.log(d[idx])[:,np.newaxis], 0.0)
+        t = lt.logfact(kk)[:,np.newaxis] - lt.logfact(ii) \
+            - lt.logfact(kk[:,np.newaxis] - ii) + ld \
+            + lt.logfact(nm[idx,np.newaxis] - ii) \
+            + np.log(sc.gammaincc(nm[idx,np.newaxis] - ii + 1.0,
+                                  e[idx,np.newaxis]))
+      t[~valid] = -np.inf
+      y[idx] = sc.logsumexp(t, axis=1)
+    x[ok] = e - lt.logfact(n) - lt.logfact(m) + y
+    return x
 
-  def reevaluate(self, data):
-    iref = -1
-    ks = [ k for k in self.cache.keys() ]
-    if self.fixed_ref != None:
-      if self.fixed_ref in ks:
-        iref = ks.index(self.fixed_ref)
-    if iref < 0:
-      # choose the detector with the most events as the reference
-      ys = [ self.cache[ks[i]].integral() for i in range(len(ks)) ]
-      iref = np.argmax(ys) # index of reference detector
-    lags = { (ks[j],ks[iref]):self.lag(ks[j], ks[iref]) for j in range(len(ks)) }
-    data[self.out_lags_field] = lags
-    return data
+  def xprodnm_profile(self, k1, k2, dt):
+    """
+    xprodnm(k1, k2, dt) for all lags dt at once.
+    The histograms of k2 for all shifted windows come from cumulative
+    counts, and each distinct (a, h1[k], h2[k]) over all bins and lags
+    is only evaluated once, since many bins share the same counts.
+    """
+    w1 = self.cache[k1]
+    w2 = self.cache[k2]
+    if len(w1.times) == 0 or len(w2.times) == 0:
+      logging.error('{}: w1 or w2 empty'.format(self.name))
+      logging.error('{}: k1 = {}, len(w1) = {}'.format(self.name, k1, len(w1.times)))
+      logging.error('{}: k2 = {}, len(w2) = {}'.format(self.name, k2, len(w2.times)))
+      return np.zeros_like(dt)
+    st1 = w1.min()
+    st2 = w2.min()
+    st = st1 if st1 > st2 else st2
+    st = st + 0.100 # 100ms buffer time
+    h1, edges = w1.histogram(self.tnbins, st, st + self.twidth)
+    h2 = w2.shifted_histograms(self.tnbins, st - dt, self.twidth)
 
-  def alert(self, data):
-    if self.in_field in data and self.in_det_field in data:
-      self.cache[data[self.in_det_field]] = data[self.in_field]
-      if self.in_det_list_field in data:
-        if set(self.cache.keys()) == set(data[self.in_det_list_field]):
-          return self.reevaluate(data)
-    return False
+    s1 = np.sum(h1) - self.bg.get(k1, 0.0) * self.twidth
+    s2 = np.sum(h2, axis=-1) - self.bg.get(k2, 0.0) * self.twidth
+    a = s2 / s1 # signal yield ratio for each lag, shape (nlags,)
 
-  def revoke(self, data):
-    if self.in_det_field in data:
-      k = data[self.in_det_field]
-      if k in self.cache:
-        del self.cache[k]
-        return True
-    return False
+    # distinct (lag with distinct a, h1, h2) combinations
+    ua, ia = np.unique(a, return_inverse=True)
+    keys = np.stack([ np.repeat(ia, self.tnbins),
+                      np.tile(h1, len(dt)), h2.ravel() ], axis=-1)
+    uk, inv = np.unique(keys, axis=0, return_inverse=True)
+    v = self.xprods(uk[:,1], uk[:,2], ua[uk[:,0]])
+    return np.sum(v[inv.ravel()].reshape(len(dt), self.tnbins), axis=-1)
 
-  def reset(self, data):
-    if len(self.cache) > 0:
-      self.cache = {}
-      return True
-    else:
-      return False
+  def profile(self, k1, kref, dt):
+    return self.xprodnm_profile(k1, kref, dt)
 
-  def report(self, data):
-    if 'burst_id' in data:
-      if data['burst_id'] == self.last_burst_report:
-        return False
-      else:
-        self.last_burst_report = data['burst_id']
-        return True
-    else:
-      return True
+  def prepare(self, keys):
+    # fill the shared LogTable before any pairs are evaluated in threads
+    self.lt.ensure(2 * np.max([ len(self.cache[k].times) for k in keys ]))
 
+  def result(self, k1, kref, best, dt, y):
+    return { 'dt': best,
+             't1': self.cache[k1].min(), \
+             't2': self.cache[kref].min(), \
+             'bias': 0.0, 'var': 0.0, 'dsig1': 0.0, 'dsig2': 0.0, \
+             'profile_x': dt,
+             'profile_y': np.zeros_like(dt) if y is None else y }
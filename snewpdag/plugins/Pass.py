@@ -13,6 +13,9 @@ import logging
 from snewpdag.dag import Node
 
 class Pass(Node):
+
+  batch = True # counts every trial of a batched payload
+
   def __init__(self, **kwargs):
     self.line = kwargs.pop('line', 100)
     self.dump = kwargs.pop('dump', 0)
@@ -28,7 +31,7 @@ class Pass(Node):
         print('{0}{1}: {2}'.format(indent, k, repr(v)))
 
   def alert(self, data):
-    self.count += 1
+    self.count += data.get('batch', 1)
     logging.debug('{}: alert'.format(self.name))
     if self.line > 0:
       if self.count == 1 or self.count % self.line == 0:
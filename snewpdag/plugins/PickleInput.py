@@ -11,6 +11,8 @@ from snewpdag.dag import Node
 from snewpdag.dag.lib import fill_filename
 
 class PickleInput(Node):
+  stateless_reset = True
+
   def __init__(self, filename, **kwargs):
     self.filename = filename
     self.on = kwargs.pop('on', [ 'report' ])
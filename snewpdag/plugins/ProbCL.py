@@ -18,6 +18,8 @@ import numpy as np
 from snewpdag.dag import Node
 
 class ProbCL(Node):
+  stateless_reset = True
+
   def __init__(self, in_field, out_field, **kwargs):
     self.in_field = in_field
     self.out_field = out_field
@@ -63,15 +63,12 @@ class ShapeComparison(Node):
 
 
   def metric_list(self, values1, values2):
-    mlist = [0.0] * self.dt_N
-
-    hist2 = SHF.fill_hist(self.h_bins, self.h_low, self.h_up, values2, 0.0)
-    hist2 = SHF.remove_flow(hist2)
-    for i in range(self.dt_N):
-      hist1 = SHF.fill_hist(self.h_bins, self.h_low, self.h_up, values1, self.dt0 + i*self.dt_step)
-      hist1 = SHF.remove_flow(hist1)
-      metric = SHF.diff_hist(hist1, hist2, self.scale)
-
-      mlist[i] = metric
-
-    return mlist
+    """
+    Metric between the histogram of values2 and that of values1
+    shifted by each dt of the scan.
+    """
+    hist2 = SHF.remove_flow(SHF.fill_hist(self.h_bins, self.h_low, self.h_up,
+                                          values2, 0.0))
+    dt = self.dt0 + self.dt_step * np.arange(self.dt_N)
+    hist1 = SHF.shifted_hists(self.h_bins, self.h_low, self.h_up, values1, dt)
+    return SHF.diff_hist(hist1, hist2, self.scale)
@@ -1,89 +1,125 @@
-import math
+"""
+ShapeHistFunctions:  histogram helpers for shape comparison of lightcurves
+
+Histograms are numpy arrays.  fill_hist() returns h_bins + 2 bins,
+i.e., with an underflow bin first and an overflow bin last, normalised
+to the number of entries in range.  shifted_hists() makes the normalised
+in-range histograms for a whole scan of offsets at once, and diff_hist()
+evaluates the metric for one histogram or a stack of them.
+"""
+import logging
 import numpy as np
 
 
-def fill_hist(h_bins, h_low, h_up, values, dt_offset):
+def bin_indices(h_bins, h_low, h_up, values):
+  """
+  Bin index of each value:  -1 for underflow, h_bins for overflow.
+  """
   bin_width = (float(h_up) - float(h_low)) / float(h_bins)
-  hist = [0.0] * (h_bins + 2) #add 2 extra bins for underflow and overflow
-
-  for i in range(0, len(values)):
-    v = values[i] + dt_offset
-    filled = False
+  ix = np.floor((np.asarray(values, dtype=np.float64) - h_low) / bin_width)
+  return np.clip(ix, -1, h_bins).astype(int)
 
-    for ii in range(0, h_bins):
-      if v >= (ii * bin_width + h_low) and v < ((ii+1) * bin_width + h_low):
-        hist[ii+1] += 1
-        filled = True
-        break
 
-    if filled == True:
-      continue
-    elif v < h_low:
-      hist[0] += 1
-    elif v >= h_up:
-      hist[len(hist)-1] += 1
+def normalise(hist):
+  """
+  Normalise the in-range bins (last axis) of histograms to unit sum.
+  Empty histograms are left as zeros.
+  """
+  n = np.sum(hist, axis=-1, keepdims=True)
+  return np.divide(hist, n, out=np.zeros(np.shape(hist)), where=n > 0)
 
-  hist = [float(x)/float(float(len(values))-hist[0]-hist[-1]) for x in hist] #normalise excluding flow bins
 
-  return hist
+def fill_hist(h_bins, h_low, h_up, values, dt_offset):
+  ix = bin_indices(h_bins, h_low, h_up,
+                   np.asarray(values, dtype=np.float64) + dt_offset)
+  hist = np.bincount(ix + 1, minlength=h_bins + 2).astype(np.float64)
+  n = len(ix) - hist[0] - hist[-1] # normalise excluding flow bins
+  return hist / n if n > 0 else hist
 
 
 def remove_flow(hist): #remove the flow bins
-  hist.remove(hist[-1])
-  hist.remove(hist[0])
-
-  return hist
+  return hist[1:-1]
+
+
+def shifted_hists(h_bins, h_low, h_up, values, dt):
+  """
+  Normalised in-range histograms of values + dt for each offset in dt.
+  If the offsets are evenly spaced by a multiple of the bin width,
+  the values are binned once on a finer range and each histogram is
+  a window into it.  Otherwise the bin edges are looked up in the
+  sorted values for each offset.
+  Returns an array of shape (len(dt), h_bins).
+  """
+  dt = np.asarray(dt, dtype=np.float64)
+  v = np.asarray(values, dtype=np.float64)
+  bin_width = (float(h_up) - float(h_low)) / float(h_bins)
+  k = 0
+  if len(dt) > 1:
+    steps = np.diff(dt) / bin_width
+    k = int(np.rint(steps[0]))
+    if k < 1 or not np.allclose(steps, k, rtol=0.0, atol=1e-6):
+      k = 0
+  if k > 0:
+    # bin index of value + dt[i] is the fine index of value + dt[0]
+    # shifted by i * k bins
+    nshift = (len(dt) - 1) * k
+    ix = bin_indices(h_bins + nshift, h_low - nshift * bin_width, h_up,
+                     v + dt[0])
+    fine = np.bincount(ix[(ix >= 0) & (ix < h_bins + nshift)],
+                       minlength=h_bins + nshift)
+    windows = np.lib.stride_tricks.sliding_window_view(fine, h_bins)
+    hists = windows[nshift - k * np.arange(len(dt))]
+  else:
+    vs = np.sort(v)
+    edges = np.linspace(h_low, h_up, h_bins + 1) - dt[:,np.newaxis]
+    hists = np.diff(np.searchsorted(vs, edges, side='left'), axis=-1)
+  return normalise(hists.astype(np.float64))
 
 
 def diff_hist(hist1, hist2, scale):
-  if len(hist1) != len(hist2):
-    print("histograms with different number of bins cannot be merged!")
-    exit()
-
-  h1max = max(hist1) * scale
-  h2max = max(hist2) * scale
-  sum_hist = [0.0] * len(hist1)
-  for i in range(len(sum_hist)):
-    if hist1[i] != 0 and hist2[i] != 0:
-      sum_hist[i] = hist1[i] + hist2[i]
-    else:
-      sum_hist[i] = h1max + h2max
-  diff_hist = [abs(hist2[ii] - hist1[ii]) for ii in range(len(hist1))]
-
-  metric = 0
-  for iii in range(len(diff_hist)):
-    metric += sum_hist[iii] * diff_hist[iii]
-
-  return metric
+  """
+  Metric between histograms:  sum over bins of |hist2 - hist1| weighted by
+  hist1 + hist2, or by the scaled maxima if either bin is empty.
+  hist1 may be a stack of histograms (bins on the last axis),
+  in which case an array of metrics is returned.
+  """
+  h1 = np.asarray(hist1, dtype=np.float64)
+  h2 = np.asarray(hist2, dtype=np.float64)
+  if h1.shape[-1] != h2.shape[-1]:
+    logging.error('diff_hist: histograms with different numbers of bins')
+    return None
+
+  h1max = np.max(h1, axis=-1, keepdims=True) * scale
+  h2max = np.max(h2, axis=-1, keepdims=True) * scale
+  sum_hist = np.where((h1 != 0) & (h2 != 0), h1 + h2, h1max + h2max)
+  return np.sum(sum_hist * np.abs(h2 - h1), axis=-1)
 
 
 def minimise(mlist, dt0, dt_step, dt_N, polyN, fit_range):
-  dt_list = [(dt0 + i*dt_step) for i in range(dt_N)]
+  """
+  Fit a polynomial of order polyN to the metric within fit_range of
+  its smallest value, and return the dt of the fitted minimum.
+  Falls back to the dt of the smallest metric if the fit has no
+  minimum in the fit range.
+  """
+  dt_list = dt0 + dt_step * np.arange(dt_N)
+  m = np.asarray(mlist, dtype=np.float64)
 
   #setting fit range
   i_fit_range = int(fit_range / dt_step) + 1
-  i_min_metric = np.argmin(mlist)
-  i_low = 0
-  i_up = dt_N - 1
-  if (i_min_metric - i_fit_range) > 0:
-    i_low = i_min_metric - i_fit_range
-  if (i_min_metric + i_fit_range) < (dt_N - 1):
-    i_up = i_min_metric + i_fit_range
-  coeff = np.polyfit(dt_list[i_low:i_up], mlist[i_low:i_up], polyN) #polynomial fit, coeff[0]*x^polyN + coeff[1]*x^(polyN-1) + ...
-
-  min_dt = 0
-  func_prev = 0
-  for ii in range(len(dt_list)):
-    func = 0
-    for iii in range(polyN):
-      func += coeff[iii] * (polyN - iii) * pow(dt_list[ii], polyN-1-iii)
-
-    if ii == 0:
-      func_prev = func
-      continue
-    if func * func_prev <= 0:
-      min_dt = (dt_list[ii] + dt_list[ii-1])/2.0
-      break
-    func_prev = func
-
-  return min_dt
+  i_min_metric = np.argmin(m)
+  i_low = max(0, i_min_metric - i_fit_range)
+  i_up = min(dt_N - 1, i_min_metric + i_fit_range)
+  x = dt_list[i_low:i_up+1]
+  if len(x) <= polyN:
+    return dt_list[i_min_metric]
+  p = np.polynomial.Polynomial.fit(x, m[i_low:i_up+1], polyN)
+
+  # stationary points with positive curvature inside the fit range
+  r = p.deriv().roots()
+  r = np.real(r[np.abs(np.imag(r)) <= 1e-9 * np.maximum(1.0, np.abs(r))])
+  r = r[(r >= x[0]) & (r <= x[-1])]
+  r = r[p.deriv(2)(r) > 0]
+  if len(r) == 0:
+    return dt_list[i_min_metric]
+  return r[np.argmin(p(r))]
@@ -0,0 +1,80 @@
+"""
+SkymapRefine:  adaptive-resolution (multi-order) evaluation of chi2 skymaps
+
+Pointing chi2's are negligible over most of the sky, so instead of
+evaluating every pixel at high nside, refine() evaluates all pixels at
+a coarse nside, then splits the pixels which may be within a margin of
+the minimum into their 4 NESTED children, and repeats up to max_nside.
+
+The result is a multi-order map (values.MultiOrderMap), which can be
+upsampled to a full NESTED map at the finest nside with to_dense().
+"""
+import logging
+import numpy as np
+import healpy as hp
+from scipy.stats import chi2
+
+from snewpdag.values import MultiOrderMap
+from snewpdag.values.MultiOrderMap import pix2uniq
+
+
+def margin(refine_chi2, refine_cl, ndof):
+  """
+  chi2 margin above the minimum for pixels to be refined:
+  refine_chi2 if given, otherwise the chi2 of credible level refine_cl
+  with ndof degrees of freedom.
+  """
+  if refine_chi2 != None:
+    return refine_chi2
+  return chi2.ppf(refine_cl, ndof)
+
+
+def candidates(nside, ipix, m, cut):
+  """
+  Pixels which may contain a chi2 <= cut.
+  ipix:  sorted NESTED indices of the pixels evaluated at this nside,
+  m:  chi2 at their centres.
+  The lowest chi2 within a pixel is estimated as m minus half the largest
+  difference to an evaluated neighbour, so that narrow valleys (e.g.,
+  the ring of two detectors) passing between pixel centres are kept.
+  The neighbours of selected pixels are selected too, for chi2's which
+  fluctuate from pixel to pixel (e.g., from binned event counts).
+  """
+  nb = hp.get_all_neighbours(nside, ipix, nest=True) # (8,n), -1 if none
+  j = np.clip(np.searchsorted(ipix, nb), 0, len(ipix) - 1)
+  present = (nb >= 0) & (ipix[j] == nb)
+  dm = np.max(np.where(present, np.abs(m[j] - m), 0.0), axis=0)
+  sel = m - 0.5 * dm <= cut
+  # and their neighbours
+  sel[j[present & sel]] = True
+  return sel
+
+
+def refine(evaluate, nside, max_nside, delta):
+  """
+  Evaluate a chi2 skymap adaptively.
+  evaluate(nside, ipix):  chi2 at the centres of NESTED pixels ipix
+  nside:  starting resolution (all pixels evaluated)
+  max_nside:  finest resolution
+  delta:  pixels which may be within delta of the minimum chi2
+    are refined (see candidates())
+  Returns the chi2 as a MultiOrderMap.
+  """
+  ipix = np.arange(hp.nside2npix(nside))
+  m = np.asarray(evaluate(nside, ipix), dtype=np.float64)
+  uniqs = []
+  ms = []
+  mmin = np.min(m)
+  while nside < max_nside:
+    sel = candidates(nside, ipix, m, mmin + delta)
+    uniqs.append(pix2uniq(nside, ipix[~sel]))
+    ms.append(m[~sel])
+    ipix = (4 * ipix[sel][:,np.newaxis] + np.arange(4)).ravel()
+    nside *= 2
+    m = np.asarray(evaluate(nside, ipix), dtype=np.float64)
+    mmin = min(mmin, np.min(m))
+    logging.debug('refine: nside {}, {} pixels'.format(nside, len(ipix)))
+  uniqs.append(pix2uniq(nside, ipix))
+  ms.append(m)
+  return MultiOrderMap(np.concatenate(uniqs), np.concatenate(ms))
+
@@ -10,6 +10,13 @@ Arguments:
   in_det_field:  field containing detector identifier
   in_det_list_field:  field containing list of detectors to match
   method:  'poisson' (default) or 'gaussian' (optional approximation)
+  max_nside:  (optional) finest nside for adaptive resolution, from nside
+    (see SkymapRefine)
+  refine_chi2:  (optional) chi2 margin above the minimum for refinement
+  refine_cl:  credible level for the margin if refine_chi2 not given
+    (default 0.9999)
+  refine_output:  'dense' (default) for maps upsampled to max_nside,
+    or 'moc' for values.MultiOrderMap's ('map' and 'chi2')
 """
 import logging
 import numpy as np
@@ -21,13 +28,16 @@ from astropy import constants as const
 
 from snewpdag.dag import Node, CelestialPixels
 from snewpdag.dag import DetectorDB
-from snewpdag.values import Hist1D, TimeSeries
+from snewpdag.values import Hist1D, TimeSeries, MultiOrderMap
+from snewpdag.plugins import SkymapRefine as SR
 
 class TopDownSeries(Node):
   def __init__(self, detector_location, nside, tnbins, twidth,
                in_field, in_det_field, in_det_list_field,
                method='poisson',
                debug_pixels=[],
+               max_nside=None, refine_chi2=None, refine_cl=0.9999,
+               refine_output='dense',
                **kwargs):
     self.db = DetectorDB(detector_location)
     self.nside = nside
@@ -39,166 +49,144 @@ class TopDownSeries(Node):
     self.in_det_list_field = in_det_list_field
     self.method = method
     self.debug_pixels = debug_pixels
+    self.max_nside = max_nside
+    self.refine_chi2 = refine_chi2
+    self.refine_cl = refine_cl
+    self.refine_output = refine_output
     self.cache = {} # { <det> : <TimeSeries> }
+    self.block = 4096 # pixels histogrammed at a time
     super().__init__(**kwargs)
 
   def reference_time(self):
-    tm = [ np.min(self.cache[k].times) for k in self.cache.keys() ]
+    tm = [ self.cache[k].min() for k in self.cache.keys() ]
     return np.min(tm)
 
-  def compare(self, keys, tdelays, debug):
+  def histograms(self, times, tstart, tdelays):
     """
-    Compare timing profiles for one sky position (set of time offsets)
-    keys = list of detectors
-    tdelays = time offsets in s, shape (nkeys,)
-    Return chi2-like measure.
+    Histogram the time series for many sky positions at once.
+    times = list of sorted event time arrays, one per detector
+    tstart = start time of histograms (s)
+    tdelays = time offsets in s, shape (nkeys, npix)
+    Returns counts, shape (nkeys, npix, tnbins).
+    Bin j for pixel p of detector i is
+    [tstart - tdelays[i,p] + j*w, tstart - tdelays[i,p] + (j+1)*w),
+    w = twidth/tnbins, with the last bin closed as in np.histogram.
     """
-    # find earliest time
-    tstart = self.reference_time()
-    # bin the time series
-    hs = []
-    areas = []
-    for i in range(len(keys)):
-      k = keys[i]
-      # tdelays should be in s, but may be wrapped in a dimensionless Quantity
-      dt = tdelays[i].value if hasattr(tdelays[i], 'unit') else tdelays[i]
-      v = self.cache[k]
-      #logging.debug('times = {}'.format(v.times))
-      #logging.debug('  hasattr unit tnbins = {}, tstart = {}, dt = {}, twidth = {}'.format(hasattr(self.tnbins, 'unit'), hasattr(tstart, 'unit'), hasattr(dt, 'unit'), hasattr(self.twidth, 'unit')))
-      h, edges = v.histogram(self.tnbins,
-                             start=tstart - dt,
-                             stop=tstart + self.twidth - dt)
-      #logging.debug(f'h[{i}] = {h}')
-      hs.append(h) # total counts, shape (nkeys, nbins)
-      a = np.sum(h)
-      areas.append(a)
-    nn = np.array(hs)
-    aa = np.array(areas)
-    aa_sum = np.sum(aa)
-    f_t = aa / aa_sum # shape (nkeys,)
-
-    # reference profile
-    sigsum = np.sum(nn, 0) # sum within each time bin
-    sigtotal = np.sum(sigsum)
-    ref = sigsum / sigtotal # normalized reference profile
+    nkeys, npix = tdelays.shape
+    edges = np.linspace(0.0, self.twidth, self.tnbins + 1)
+    nn = np.zeros((nkeys, npix, self.tnbins))
+    for i in range(nkeys):
+      e = (tstart - tdelays[i])[:,np.newaxis] + edges # shape (npix,nbins+1)
+      # number of events before each edge
+      c = np.searchsorted(times[i], e, side='left')
+      c[:,-1] = np.searchsorted(times[i], e[:,-1], side='right')
+      nn[i] = np.diff(c, axis=-1)
+    return nn
 
-    if debug:
-      logging.debug('method = {}, nn ='.format(self.method))
-      logging.debug(nn)
-      logging.debug('aa_sum = {}, aa ='.format(aa_sum))
-      logging.debug(aa)
-      logging.debug('f_t =')
-      logging.debug(f_t)
-      logging.debug('sigtotal = {}, sigsum ='.format(sigtotal))
-      logging.debug(sigsum)
-      logging.debug('ref =')
-      logging.debug(ref)
-
-    # compare
-    chi2 = 0.0
-    for i in range(len(aa)): # loop over detectors
-      for j in range(len(ref)): # loop over time bins
-        if aa[i] > 0:
-          pp = aa[i]*ref[j] # predicted area
-          ppi = np.floor(pp)
-          if pp > 0:
-            # unnormalized probability
-            #x = nn[i,j] * np.log(pp) - pp - sc.gammaln(nn[i,j] + 1)
-
-            # logl1:
-            # probability normalized to 1 at maximum
-            #x = (nn[i,j] - ppi) * np.log(pp) + \
-            #    sc.gammaln(ppi + 1) - sc.gammaln(nn[i,j] + 1)
+  def log_likelihood(self, nn):
+    """
+    Compare timing profiles for many sky positions.
+    nn = counts, shape (nkeys, npix, nbins)
+    Returns log likelihood, shape (npix,).
+    """
+    aa = np.sum(nn, axis=-1) # areas, shape (nkeys, npix)
+    aa_sum = np.sum(aa, axis=0) # shape (npix,)
+    sigsum = np.sum(nn, axis=0) # sum within each time bin, (npix, nbins)
+    sigtotal = np.sum(sigsum, axis=-1) # shape (npix,)
 
-            # logl2 ("gaussian"):
-            # probability with unknown true value, gaussian approx,
-            # norm to 1 at max
-            if self.method == 'gaussian':
-              d = nn[i,j] - pp
-              s = nn[i,j] + pp
-              x = 0.5 * np.log(2.0 * pp / s)
-              x -= 0.5 * d * d / s
-              x += np.log(sc.erfc( - np.sqrt(2.0 * nn[i,j] * pp / s) ) /
-                          sc.erfc( - np.sqrt(pp) ))
+    with np.errstate(divide='ignore', invalid='ignore'):
+      f_t = aa / aa_sum # shape (nkeys, npix)
+      ref = sigsum / sigtotal[:,np.newaxis] # normalized reference profile
+      pp = aa[...,np.newaxis] * ref # predicted area, (nkeys, npix, nbins)
+      # only bins with a predicted signal contribute
+      mask = pp > 0
 
-            # logl3:
-            # probability with unknown true value, Poisson, norm to 1 at max
-            #ppr = (aa_sum - aa[i]) * ref[j]
-            #ppri = np.floor(ppr)
-            #x = (nn[i,j] - ppi) * np.log(aa[i])
-            #x += (sigsum[j] - nn[i,j] - ppri) * np.log(aa_sum - aa[i])
-            #x += sc.gammaln(ppi + 1) - sc.gammaln(nn[i,j] + 1)
-            #x += sc.gammaln(ppri + 1) - sc.gammaln(sigsum[j] - nn[i,j] + 1)
+      if self.method == 'gaussian':
+        # logl2:
+        # probability with unknown true value, gaussian approx,
+        # norm to 1 at max
+        d = nn - pp
+        s = nn + pp
+        x = 0.5 * np.log(2.0 * pp / s)
+        x -= 0.5 * d * d / s
+        x += np.log(sc.erfc( - np.sqrt(2.0 * nn * pp / s) ) /
+                    sc.erfc( - np.sqrt(pp) ))
 
-            # logl4:
-            # binomial
-            # (actually looks the same as logl1,
-            # but why doesn't it give similar results?)
-            #pf = f_t[i] * sigsum[j]
-            #logging.debug('i = {}, j = {}, pp = {}, pf = {}'.format(i,j,pp,pf))
-            #pfi = np.floor(pf)
-            #x = (nn[i,j] - pfi) * np.log(f_t[i]) + \
-            #    sc.gammaln(pfi + 1) - sc.gammaln(nn[i,j] + 1)
+      elif self.method == 'binomial-unnorm':
+        x = nn * np.log(aa)[...,np.newaxis] - sc.gammaln(nn + 1.0)
 
-            # binomial-unnorm:
-            elif self.method == 'binomial-unnorm':
-              x = nn[i,j] * np.log(aa[i]) - sc.gammaln(nn[i,j] + 1.0)
-              if debug:
-                logging.debug('  i,j = {}, {}:  nn={}, aa={}, x={}'.format(i,j,nn[i,j],aa[i],x))
+      elif self.method == 'binbin':
+        # binomial over all i,j bins,
+        # probability estimated with A*N/Y^2
+        x = nn * np.log(f_t[...,np.newaxis] * ref) - sc.gammaln(nn + 1.0)
 
-            # binbin:
-            # binomial over all i,j bins,
-            # probability estimated with A*N/Y^2
-            elif self.method == 'binbin':
-              x = nn[i,j] * np.log(f_t[i] * ref[j]) - sc.gammaln(nn[i,j] + 1.0)
-              if debug:
-                logging.debug('  i,j = {}, {}:  nn={}, f_t={}, ref={}, x={}'.format(i,j,nn[i,j],f_t[i],ref[j],x))
+      elif self.method == 'poisson':
+        # logl5:
+        # probability with unknown true value, Poisson, norm to 1 at max
+        x = (pp - nn) * np.log(2.0)
+        x += sc.gammaln(pp + 1.0) - sc.gammaln(nn + 1.0)
+        x += sc.gammaln(pp + nn + 1.0) - sc.gammaln(2.0 * pp + 1.0)
 
-            # logl5:
-            # probability with unknown true value, Poisson, norm to 1 at max
-            elif self.method == 'poisson':
-              x = (pp - nn[i,j]) * np.log(2.0)
-              x += sc.gammaln(pp + 1.0) - sc.gammaln(nn[i,j] + 1.0)
-              x += sc.gammaln(pp + nn[i,j] + 1.0) - sc.gammaln(2.0 * pp + 1.0)
+      else:
+        logging.debug('{}: unrecognized method {}'.format(self.name, self.method))
+        x = np.zeros_like(nn)
 
-            else:
-              # unrecognized
-              logging.debug('{}: unrecognized method {}'.format(self.name, self.method))
-              x = 0.0 # unrecognized
+      logp = np.sum(np.where(mask, x, 0.0), axis=(0, 2))
 
-            chi2 += x
-            #if debug:
-            #  logging.debug('  i,j = {}, {}:  {}'.format(i,j,x))
+      if self.method == 'binomial-unnorm':
+        s1 = sigtotal * np.log(sigtotal)
+        s2 = np.sum(sc.gammaln(sigsum + 1.0), axis=-1)
+        logp += s2 - s1
+      elif self.method == 'binbin':
+        logp += sc.gammaln(sigtotal + 1.0)
 
-    if self.method == 'binomial-unnorm':
-      s1 = sigtotal * np.log(sigtotal)
-      s2 = np.sum(sc.gammaln(sigsum + 1.0))
-      chi2 += s2 - s1
-      if debug:
-        logging.debug('  s1 = {}, s2 = {}'.format(s1, s2))
-    elif self.method == 'binbin':
-      s1 = sc.gammaln(sigtotal + 1.0)
-      chi2 += s1
-      if debug:
-        logging.debug('  s1 = {}'.format(s1))
+    return logp
 
+  def compare(self, keys, tdelays, debug):
+    """
+    Compare timing profiles for one sky position (set of time offsets)
+    keys = list of detectors
+    tdelays = time offsets in s, shape (nkeys,)
+    Return chi2-like measure.
+    """
+    times = [ self.cache[k].sorted_times() for k in keys ]
+    nn = self.histograms(times, self.reference_time(),
+                         np.asarray(tdelays, dtype=float)[:,np.newaxis])
+    chi2 = -2.0 * self.log_likelihood(nn)[0]
     if debug:
-      logging.debug('logP = {}'.format(chi2))
-
-    chi2 *= -2.0
+      logging.debug('method = {}, nn ='.format(self.method))
+      logging.debug(nn[:,0])
+      logging.debug('aa =')
+      logging.debug(np.sum(nn[:,0], axis=-1))
+      logging.debug('sigsum =')
+      logging.debug(np.sum(nn[:,0], axis=0))
+      logging.debug('logP = {}'.format(-0.5 * chi2))
     return chi2
 
+  def chi2(self, times, tstart, tdelays):
+    """
+    chi2-like measure for many sky positions, shape (npix,),
+    comparing shifted histograms of the sorted time series,
+    a block of pixels at a time to limit memory.
+    Arguments as for histograms().
+    """
+    npix = tdelays.shape[1]
+    m = np.zeros(npix)
+    for i in range(0, npix, self.block):
+      j = min(i + self.block, npix)
+      nn = self.histograms(times, tstart, tdelays[:,i:j])
+      m[i:j] = -2.0 * self.log_likelihood(nn)
+    return m
+
   def reevaluate(self, data):
     """
-    Call compare() for each skymap pixel
+    Evaluate the chi2-like measure for all skymap pixels
     """
-    # get directions for each pixel
     t0 = self.reference_time()
     t0a = Time(t0, format='unix')
     cp = CelestialPixels()
-    rs = cp.get_map(self.nside, t0) # shape (3,npix)
 
-    # get nominal time shifts for each detector for each pixel
+    # detector positions, for nominal time shifts of each pixel
     keys = list(self.cache.keys())
     nkeys = len(keys)
     pd = np.zeros([nkeys, 3])
@@ -207,16 +195,32 @@ class TopDownSeries(Node):
       det = self.db.get(k) # Detector object
       pd[i] = det.get_xyz(t0a) # GCRS coordinates at time [m]
       i += 1
-    tdet = pd @ rs / 3.0e8 # time offsets in s, rel to Earth center
-    # shape of tdet should be (nkeys,npix)
+    times = [ self.cache[k].sorted_times() for k in keys ]
 
-    # get reference signal profile for each pixel's hypothetical direction
-    m = np.zeros(self.npix)
-    for i in range(self.npix):
-      debug = (i in self.debug_pixels)
-      m[i] = self.compare(keys, tdet[...,i], debug)
-      if debug:
-        logging.debug('pixel m[{}] = {}'.format(i, m[i]))
+    if self.max_nside != None and self.max_nside > self.nside:
+      # adaptive resolution
+      def evaluate(nside, ipix):
+        rs = cp.get_pixels(nside, ipix, t0)
+        return self.chi2(times, t0, pd @ rs / 3.0e8)
+      delta = SR.margin(self.refine_chi2, self.refine_cl, 2)
+      mo = SR.refine(evaluate, self.nside, self.max_nside, delta)
+      if self.refine_output == 'moc':
+        chi2_min = mo.values.min()
+        data['chi2'] = mo
+        data['map'] = MultiOrderMap(mo.uniq, mo.values - chi2_min)
+        data['ndof'] = 2 # need to confirm this
+        data['map_zeroes'] = mo.uniq[mo.values == chi2_min]
+        return data
+      m = mo.to_dense(self.max_nside)
+    else:
+      # get directions for each pixel
+      rs = np.asarray(cp.get_map(self.nside, t0)) # shape (3,npix)
+      tdet = pd @ rs / 3.0e8 # time offsets in s, rel to Earth center
+      # shape of tdet should be (nkeys,npix)
+      m = self.chi2(times, t0, tdet)
+      for i in self.debug_pixels:
+        logging.debug('pixel m[{}] = {}'.format(i,
+                      self.compare(keys, tdet[:,i], True)))
 
     chi2_min = m.min()
     logging.debug('min = {} ({}), max = {} ({})'.format(chi2_min, np.argmin(m), m.max(), np.argmax(m)))
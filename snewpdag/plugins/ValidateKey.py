@@ -16,6 +16,8 @@ import logging
 from snewpdag.dag import Node
 
 class ValidateKey(Node):
+    stateless_reset = True
+
     def __init__(self, in_field, **kwargs):
         self.in_field = in_field
         self.on_alert = kwargs.pop('on_alert', True)
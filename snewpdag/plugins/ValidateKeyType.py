@@ -17,6 +17,8 @@ Constructor arguments:
 from snewpdag.dag import Node
 
 class ValidateKeyType(Node):
+    stateless_reset = True
+
     def __init__(self, in_field, key_type, **kwargs):
         self.in_field = in_field
         self.key_type = key_type
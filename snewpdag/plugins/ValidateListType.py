@@ -33,6 +33,8 @@ import logging
 from snewpdag.dag import Node
 
 class ValidateListType(Node):
+    stateless_reset = True
+
     def __init__(self, in_field, max_fraction, key_type, **kwargs):
         self.in_field = in_field
         self.max_fraction = max_fraction
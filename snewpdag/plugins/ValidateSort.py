@@ -17,6 +17,8 @@ import logging
 from snewpdag.dag import Node
 
 class ValidateSort(Node):
+    stateless_reset = True
+
     def __init__(self, in_field, **kwargs):
         self.in_field = in_field
         self.list_order = kwargs.pop('list_order', None)
@@ -13,6 +13,8 @@ import logging
 from snewpdag.dag import Node
 
 class Write(Node):
+  stateless_reset = True
+
   def __init__(self, write, **kwargs):
     self.writes = []
     for op in write:
@@ -65,6 +65,7 @@ from .DiffPointing import DiffPointing
 #from .EvalMap import EvalMap
 #from .TopDownSeries import TopDownSeries
 
+from .LagScan import LagScan
 from .XCovLag import XCovLag
 from .NLogLag import NLogLag
 from .NBLag import NBLag
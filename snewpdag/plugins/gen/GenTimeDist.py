@@ -23,6 +23,9 @@ configuration:
              and the number of events will match the first module to run.
   epoch_base (optional): starting time for epoch, float value or field specifier
     (string or tuple)
+  binned (optional):  if the field is a Hist1D, fill it bin by bin with
+    Poisson numbers of events (see TimeDistSource.fill_hist()) rather than
+    generating each event (default True).  Not used with sig_once.
 
   A "field specifier" is either a string or tuple of strings
   which navigate into the payload.
@@ -35,7 +38,6 @@ import logging
 import numpy as np
 import numbers
 
-from snewpdag.dag import Node
 from snewpdag.dag.lib import fetch_field
 from snewpdag.values import Hist1D, TimeSeries
 from . import TimeDistSource
@@ -57,6 +59,7 @@ class GenTimeDist(TimeDistSource):
     self.sig_smear = kwargs.pop('sig_smear', True)
     self.sig_once = kwargs.pop('sig_once', False)
     self.epoch_base = kwargs.pop('epoch_base', 0.0)
+    self.binned = kwargs.pop('binned', True)
 
     if not isinstance(self.epoch_base, (numbers.Number, str, list, tuple)):
       logging.error('GenTimeDist.__init__: unrecognized epoch_base {}. Set to 0.'.format(self.epoch_base))
@@ -65,7 +68,9 @@ class GenTimeDist(TimeDistSource):
     super().__init__(**kwargs)
     self.area = np.sum(self.mu)
     self.mu_norm = self.mu / self.area
+    self.mu_norm.flags.writeable = False
     self.tedges = np.append(self.t, self.thi) # append high end to t array
+    self.tedges.flags.writeable = False
 
     # if sig_mean is 0 or an empty string, set it to self.area
     if self.sig_mean == 0 or self.sig_mean == "":
@@ -74,11 +79,8 @@ class GenTimeDist(TimeDistSource):
 
     # pre-generate single series
     if self.sig_once and np.shape(GenTimeDist.one_series) == (0,):
-      j = Node.rng.choice(len(self.mu_norm), self.sig_mean,
-                          p=self.mu_norm, replace=True, shuffle=False)
-      ta = self.tedges[j]
-      dt = self.tedges[j+1] - ta
-      GenTimeDist.one_series = ta + Node.rng.random(self.sig_mean) * dt
+      j, nev = self.draw_bins(self.mu_norm, self.sig_mean, smear=False)
+      GenTimeDist.one_series = self.jitter(self.tedges, j)
       GenTimeDist.one_mean = self.sig_mean
 
   def alert(self, data):
@@ -132,15 +134,15 @@ class GenTimeDist(TimeDistSource):
             logging.error('{}:  sig_distance field {} not found'.format(self.name, self.sig_distance))
         mean = mean * f * f
 
-        # Poisson fluctuation in mean, if requested
-        nev = Node.rng.poisson(mean) if self.sig_smear else mean
+        if self.binned and isinstance(v, Hist1D):
+          self.fill_hist(v, self.mu_norm, self.tedges, mean, offset,
+                         self.sig_smear)
+          return data
 
-        # generate time series of offsets, with t=0 at core bounce
-        j = Node.rng.choice(len(self.mu_norm), nev,
-                            p=self.mu_norm, replace=True, shuffle=False)
-        ta = self.tedges[j]
-        dt = self.tedges[j+1] - ta
-        a = ta + Node.rng.random(nev) * dt
+        # generate time series of offsets, with t=0 at core bounce,
+        # with Poisson fluctuation in mean, if requested
+        j, nev = self.draw_bins(self.mu_norm, mean, self.sig_smear, key='sig')
+        a = self.jitter(self.tedges, j)
 
       # add offsets in seconds - works for Hist1D or TimeSeries
       a += offset
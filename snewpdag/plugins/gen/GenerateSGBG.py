@@ -14,16 +14,23 @@ output added to data:
            Use uniform distribution within a bin.
            Note that the array is not sorted.
 
+The expected number of background and signal events in each 1 ms bin
+is worked out once, in the constructor.  Each alert scales the signal
+for the distance and, by default (sampler 'poisson', see TimeDistSource),
+draws a Poisson number of events in every bin.
+
 Author: M. Colomer (marta.colomer@ulb.be)
 """
 import logging
 from statistics import mean
 import numpy as np
 import matplotlib.pyplot as plt
-from snewpdag.dag import Node
 from . import TimeDistSource
 
 class GenerateSGBG(TimeDistSource):
+  sampler = 'poisson'
+  tbin = 0.001 # (s) bin width of the lightcurve
+  tdelay = 100 # (ms) signal delay, set to 100ms to match t0
 
   def __init__(self, bg, detector, **kwargs):
     #logging.info("GenerateSGBG: dist {} bg {}".format(dist, bg))
@@ -34,39 +41,50 @@ class GenerateSGBG(TimeDistSource):
     area = sum(self.mu)
     self.mean = kwargs.pop('sig_mean', area)
     self.new_mu = self.mu*self.mean/area
+    self.new_mu.flags.writeable = False
     self.tmin = -10
     self.tmax = 10
-    self.tdelay = 100 #set to 100ms to match t0
-    
-  def alert(self, data):
-    #logging.info('times are {}'.format(self.t[-1]))
-    new_times = np.arange(self.tmin,self.tmax,0.001)
-    #self.tdelay = int(Node.rng.uniform(-20.0, 20.0))
 
-    t_true = self.tdelay
-    #logging.info('t_true {}'.format(t_true))
-    new_data = []
+    # rate template:  expected background and signal (at 10 kpc) per bin
+    nbins = int(round((self.tmax - self.tmin) / self.tbin))
+    self.edges = self.tmin + self.tbin * np.arange(nbins + 1)
+    f = self.veto(nbins)
+    self.bg_rate = np.full(nbins, float(self.bg)) * f
+    self.sig_rate = self.signal(nbins) * f
+    for a in [ self.edges, self.bg_rate, self.sig_rate ]:
+      a.flags.writeable = False
 
-    dist = data['sn_distance'] if 'sn_distance' in data else self.dist
-    #Construct new data with tdelay and sg+bg
-    for i,ti in enumerate(new_times):
-      bg = self.bg
-      if ti>=t_true/1000. and ti<self.t[-1]-0.001+t_true/1000.:                                                                                   
-        signal = self.new_mu[i-t_true+self.tmin*1000-1]*(10./dist)**2
-        new_data.append(signal+bg)
-      else:
-        new_data.append(bg)
+  def signal(self, nbins):
+    """
+    Signal histogram, delayed by tdelay, in the lightcurve bins.
+    Each input bin goes into the lightcurve bin nearest its low edge.
+    """
+    k = np.rint((self.t - self.tmin) / self.tbin).astype(int) + \
+        int(round(0.001 * self.tdelay / self.tbin))
+    m = (k >= 0) & (k < nbins)
+    return np.bincount(k[m], weights=self.new_mu[m], minlength=nbins)
 
-    #randomise the lightcurve    
-    tarea = sum(new_data)
-    new_mu = np.array(new_data) / tarea # normalize histogram to unit area
-    nev = Node.rng.poisson(tarea)
-    size = len(new_data)
-    j = Node.rng.choice(size, nev, p=new_mu, replace=True, shuffle=False)
-    t0 = new_times[j-1]
-    dt = new_times[j] - t0
+  def veto(self, nbins):
+    """
+    Fraction of each bin during which the detector is live.
+    """
+    return np.ones(nbins)
 
-    a = Node.rng.random(nev) * dt + t0
+  def alert(self, data):
+    t_true = self.tdelay
+    dist = data['sn_distance'] if 'sn_distance' in data else self.dist
+    f = (10./dist)**2
+    if self.sampler == 'alias':
+      # the shape of bg + signal depends on distance, so draw
+      # background and signal separately from fixed tables
+      jb, nb = self.draw_bins(self.bg_rate, np.sum(self.bg_rate), key='bg')
+      js, ns = self.draw_bins(self.sig_rate, np.sum(self.sig_rate) * f,
+                              key='sig')
+      j = np.concatenate((jb, js))
+    else:
+      rate = self.bg_rate + self.sig_rate * f
+      j, nev = self.draw_bins(rate, np.sum(rate))
+    a = self.jitter(self.edges, j)
     a.flags.writeable = False
 
     ngen = { 'times': a, 't_true': t_true }
@@ -78,4 +96,3 @@ class GenerateSGBG(TimeDistSource):
     data['detector_name'] = self.detector 
 
     return True
-
@@ -1,5 +1,5 @@
 """
-GenerateSGBG
+GenerateSGBG_deadtimes
 
 Lightcurve generator: simulates a random time delay for the signal at a given distance as well as a poisson background on top of it
 
@@ -14,91 +14,25 @@ output added to data:
            Use uniform distribution within a bin.
            Note that the array is not sorted.
 
+Same as GenerateSGBG, but with periodic vetoes,
+during which background and signal are both reduced.
+
 Author: M. Colomer (marta.colomer@ulb.be)
 """
 import logging
-from statistics import mean
 import numpy as np
-import matplotlib.pyplot as plt
-from snewpdag.dag import Node
-from . import TimeDistSource
-
-class GenerateSGBG_deadtimes(TimeDistSource):
-
-  def __init__(self, bg, detector, **kwargs):
-    #logging.info("GenerateSGBG: dist {} bg {}".format(dist, bg))
-    super().__init__(**kwargs)
-    self.bg = bg
-    self.detector = detector
-    self.dist = kwargs.pop('dist', 10)
-    area = sum(self.mu)
-    self.mean = kwargs.pop('sig_mean', area)
-    self.new_mu = self.mu*self.mean/area
-    self.tmin = -10
-    self.tmax = 10
-    self.tdelay = 0 #maybe put as input field?
-    self.fveto = 0.5 #fraction of detector vetoed
-    self.rveto = 100 #veto rate in Hz 
-    self.veto_dur = 1. #duration of the veto in ms 
-    
-  def alert(self, data):
-    
-    #logging.info('times are {}'.format(self.t[-1]))
-    new_times = np.arange(self.tmin,self.tmax,0.001)
-    #self.tdelay = int(Node.rng.uniform(-20.0, 20.0))
-
-    t_true = self.tdelay
-    #logging.info('t_true {}'.format(t_true))
-    new_data = []
-
-    dist = data['sn_distance'] if 'sn_distance' in data else self.dist
-
-    tcount = 100
-    #Construct new data with tdelay and sg + bg
-    for i,ti in enumerate(new_times):
-      bg = self.bg
-      
-      #when veto actif
-      if int(ti*1000)%self.rveto == 0:
-        bg=bg*self.fveto
-        tcount = 1
-      elif tcount>=1 and tcount<=self.veto_dur:
-        bg=bg*self.fveto
-        
-      #in signal region
-      if ti>=t_true/1000. and ti<self.t[-1]-0.001+t_true/1000.:                                                                                   
-        signal = self.new_mu[i-t_true+self.tmin*1000-1]*(10./dist)**2
-
-        #when veto actif
-        if int(ti*1000)%self.rveto == 0:
-          signal = signal*self.fveto
-        elif tcount>=1 and tcount<=self.veto_dur:
-          signal=signal*self.fveto
-
-        new_data.append(signal+bg)
-      else:
-        new_data.append(bg)
-      tcount +=1
-    
-    #randomise the lightcurve    
-    tarea = sum(new_data)
-    new_mu = np.array(new_data) / tarea # normalize histogram to unit area
-    nev = Node.rng.poisson(tarea)
-    size = len(new_data)
-    j = Node.rng.choice(size, nev, p=new_mu, replace=True, shuffle=False)
-    t0 = new_times[j-1]
-    dt = new_times[j] - t0
-    
-    a = Node.rng.random(nev) * dt + t0
-    a.flags.writeable = False
-    
-    ngen = { 'times': a, 't_true': t_true }
-    if 'gen' in data:
-      data['gen'] += (ngen, )
-    else:
-      data['gen'] = (ngen, )
-
-    data['detector_name'] = self.detector 
-
-    return True
-
+from . import GenerateSGBG
+
+class GenerateSGBG_deadtimes(GenerateSGBG):
+  tdelay = 0 #maybe put as input field?
+  fveto = 0.5 #fraction of detector vetoed
+  rveto = 100 #veto period in ms, i.e., a veto starts every rveto ms
+  veto_dur = 1. #duration of the veto in ms 
+
+  def veto(self, nbins):
+    """
+    Rates are scaled by fveto in the veto_dur ms following each
+    multiple of rveto ms.
+    """
+    ms = np.rint(self.edges[:-1] * 1000.0).astype(int) # low edges in ms
+    return np.where(np.mod(ms, self.rveto) < self.veto_dur, self.fveto, 1.0)
@@ -25,6 +25,9 @@ from . import TimeDistSource
 
 class Generate_bg_glitch(TimeDistSource):
 
+  # random parameters are drawn in the constructor
+  cloneable = False
+
   def __init__(self, bg, detector, **kwargs):
     #logging.info("GenerateSGBG: dist {} bg {}".format(dist, bg))
     super().__init__(**kwargs)
@@ -71,10 +74,7 @@ class Generate_bg_glitch(TimeDistSource):
 
     #randomise the lightcurve    
     tarea = sum(new_data)
-    new_mu = np.array(new_data) / tarea # normalize histogram to unit area
-    nev = Node.rng.poisson(tarea)
-    size = len(new_data)
-    j = Node.rng.choice(size, nev, p=new_mu, replace=True, shuffle=False)
+    j, nev = self.draw_bins(new_data, tarea)
     t0 = new_times[j-1]
     dt = new_times[j] - t0
 
@@ -25,6 +25,9 @@ from . import TimeDistSource
 
 class Generate_delta_peak(Node):
 
+  # random parameters are drawn in the constructor
+  cloneable = False
+
   def __init__(self, detector, mean, bg, **kwargs):
     #logging.info("GenerateSGBG: dist {} bg {}".format(dist, bg))
     super().__init__(**kwargs)
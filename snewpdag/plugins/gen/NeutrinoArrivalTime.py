@@ -18,6 +18,9 @@ from datetime import datetime
 from snewpdag.dag import Node
 
 class NeutrinoArrivalTime(Node):
+    # read from the detector file, and not modified afterwards
+    shared = ('detector_info',)
+
     #Define detector location
     def __init__(self, detector_list, detector_location, **kwargs):
         self.detector_info = {}
@@ -18,6 +18,17 @@ configuration:
                  (for tng case). optional, default 2
   sig_delimiter:  column delimiter for tn or tnw, optional.
                   Default is '\t' for tn, and none for tnw.
+  sampler:  how subclasses draw events from a histogram (optional):
+            'choice' (default) -> Poisson number of events, each placed
+                in a bin with rng.choice.
+            'poisson' -> independent Poisson number of events in each bin
+                (multinomial if the total is fixed).  Costs O(bins) plus
+                O(events) with a small constant, good for large yields.
+            'alias' -> like 'choice', but bins are drawn from an alias
+                table (Walker/Vose) built once per histogram, so each
+                event costs O(1).  Good for sampling the same histogram
+                over and over.
+            All three are statistically equivalent.
 
 output added to data:
   gen: this is a tuple containing references to generated data.
@@ -40,9 +51,17 @@ import numpy as np
 from snewpdag.dag import Node
 
 class TimeDistSource(Node):
+  samplers = ('choice', 'poisson', 'alias')
+  sampler = 'choice'
 
   def __init__(self, sig_filename, sig_filetype, **kwargs):
     dels = kwargs.pop('sig_delimiter', '')
+    self.sampler = kwargs.pop('sampler', self.sampler)
+    if self.sampler not in self.samplers:
+      logging.error('Unrecognized sampler {}, using choice'.format(
+                    self.sampler))
+      self.sampler = 'choice'
+    self.alias_tables = {} # { key: (prob, alias) }
     tcol = kwargs.pop('sig_t_column', 0)
     ycol = kwargs.pop('sig_y_column', 1)
     ecol = kwargs.pop('sig_e_column', 2)
@@ -60,6 +79,8 @@ class TimeDistSource(Node):
       # use the last bin edge as the maximum.
       # This amounts to cutting off the last n element.
       self.mu = np.array(nn[:-1])
+      self.t.flags.writeable = False
+      self.mu.flags.writeable = False
 
     elif sig_filetype == 'tng':
       tt = [] # lower edges of time bins
@@ -84,6 +105,8 @@ class TimeDistSource(Node):
       self.mu = lum[j] * dt[j] / enu[j]
       self.t = np.array(tt[:-1])[j]
       self.thi = tt[-1]
+      self.t.flags.writeable = False
+      self.mu.flags.writeable = False
 
     else:
       with open(sig_filename, 'r') as f:
@@ -108,7 +131,7 @@ class TimeDistSource(Node):
           logging.error('Unrecognized sig_t_low type')
           sys.exit(2)
       else:
-        logger.error('Missing histogram fields')
+        logging.error('Missing histogram fields')
         sys.exit(2)
     super().__init__(**kwargs)
 
@@ -122,3 +145,92 @@ class TimeDistSource(Node):
       data['gen'] = (ngen, )
     return True
 
+  def alias_table(self, key, w):
+    """
+    Alias table (Vose's method) for drawing bins with probability
+    proportional to w, made on first use and kept under key.
+    The caller must use a new key if w changes.
+    """
+    if key in self.alias_tables:
+      return self.alias_tables[key]
+    n = len(w)
+    prob = np.asarray(w, dtype=np.float64) * n / np.sum(w)
+    alias = np.arange(n)
+    small = list(np.nonzero(prob < 1.0)[0])
+    large = list(np.nonzero(prob >= 1.0)[0])
+    while small and large:
+      s = small.pop()
+      l = large.pop()
+      alias[s] = l
+      prob[l] -= 1.0 - prob[s]
+      (small if prob[l] < 1.0 else large).append(l)
+    prob[large] = 1.0 # leftovers are only off by rounding
+    prob[small] = 1.0
+    prob.flags.writeable = False
+    alias.flags.writeable = False
+    if key is not None:
+      self.alias_tables[key] = (prob, alias)
+    return prob, alias
+
+  def draw_bins(self, w, mean, smear=True, key=None):
+    """
+    Draw events from a histogram, using self.sampler.
+    w:  expected (or relative) number of events in each bin.
+    mean:  expected number of events, or an array of them, one per trial.
+    smear:  Poisson fluctuation of the number of events.
+      If False, there are round(mean) events.
+    key:  name under which to keep the alias table for w, if any.
+    Returns (j, nev):  bin index of each event (trial by trial),
+    and number of events (per trial, if mean is an array).
+    """
+    w = np.asarray(w, dtype=np.float64)
+    total = np.sum(w)
+    m = np.asarray(mean, dtype=np.float64)
+    if total <= 0.0:
+      return np.zeros(0, dtype=int), np.zeros(m.shape, dtype=int)
+    p = w / total
+    if self.sampler == 'poisson':
+      if smear:
+        n = Node.rng.poisson(m[...,np.newaxis] * p)
+      else:
+        n = Node.rng.multinomial(np.rint(m).astype(int), p)
+      nev = np.sum(n, axis=-1)
+      j = np.repeat(np.broadcast_to(np.arange(len(w)), n.shape).ravel(),
+                    n.ravel())
+      return j, nev
+    nev = Node.rng.poisson(m) if smear else np.rint(m).astype(int)
+    ntot = np.sum(nev)
+    if self.sampler == 'alias':
+      prob, alias = self.alias_table(key, w)
+      i = Node.rng.integers(len(w), size=ntot)
+      j = np.where(Node.rng.random(ntot) < prob[i], i, alias[i])
+    else:
+      j = Node.rng.choice(len(w), ntot, p=p, replace=True, shuffle=False)
+    return j, nev
+
+  def jitter(self, edges, j):
+    """
+    Times of events in bins j, uniformly distributed within each bin.
+    edges:  bin edges (one more than the number of bins).
+    """
+    t0 = edges[j]
+    return Node.rng.random(len(j)) * (edges[j+1] - t0) + t0
+
+  def fill_hist(self, h, w, tedges, mean, offset=0.0, smear=True):
+    """
+    Fill Hist1D h with events drawn from the histogram w (bin edges tedges)
+    shifted by offset, without generating the individual events.
+    The expected number of events in each bin of h is the integral of w
+    over the bin (uniform within the bins of w, as for jitter()), and the
+    number of events in each bin is Poisson (multinomial if not smear).
+    Memory and time are O(bins) rather than O(events).
+    """
+    cum = np.concatenate(([ 0.0 ], np.cumsum(w)))
+    f = np.interp(h.edges() - offset, tedges, cum / cum[-1])
+    p = np.concatenate(([ f[0] ], np.diff(f), [ 1.0 - f[-1] ]))
+    p = np.clip(p, 0.0, None) # rounding
+    if smear:
+      n = Node.rng.poisson(mean * p)
+    else:
+      n = Node.rng.multinomial(int(np.rint(mean)), p / np.sum(p))
+    h.fill_bins(n[1:-1], n[0], n[-1])
@@ -16,6 +16,9 @@ from snewpdag.dag import Node
 from snewpdag.dag import lib
 
 class TimeOffset(Node):
+    # read from the detector file, and not modified afterwards
+    shared = ('detector_offset',)
+
     
     #Specify arrivial time uncertainties (s)
     def __init__(self, detector_location, **kwargs):
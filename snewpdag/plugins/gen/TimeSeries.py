@@ -11,45 +11,46 @@ output added to data:
   'times': times of individual events based on histogram.
            Use uniform distribution within a bin.
            Note that the array is not sorted.
+
+Batched payloads (see dag/lib.py) are generated in one go,
+with 'gen' becoming a per-trial field.
 """
 import logging
 import numpy as np
 import matplotlib.pyplot as plt
-from snewpdag.dag import Node
+from snewpdag.dag.lib import batch_field
 from . import TimeDistSource
 
 class TimeSeries(TimeDistSource):
 
+  batch = True
+
   def __init__(self, detector, **kwargs):
     super().__init__(**kwargs)
     area = sum(self.mu)
     self.mean = kwargs.pop('sig_mean', area)
     self.new_mu = self.mu*self.mean/area
+    self.new_mu.flags.writeable = False
     self.dist = kwargs.pop('dist', 10)
 
     # append self.thi (high end) to t array
     self.tedges = np.append(self.t, self.thi)
+    self.tedges.flags.writeable = False
     #print('Trial:', len(self.mu), self.name)
     #exit()
     self.detector = detector
 
 
   def alert(self, data):
+    if 'batch' in data:
+      return self.alert_batch(data)
     sn_distance = data['sn_distance'] if 'sn_distance' in data else self.dist
-    new_mu = self.new_mu*(10./sn_distance)**2
     # Define mean (total number of signal events) as the integral of the lightcurve model
-    new_mean = sum(new_mu)
-    # normalize histogram to unit area
-    nmu = new_mu / new_mean
-    nmu.flags.writeable = False
+    new_mean = np.sum(self.new_mu)*(10./sn_distance)**2
 
     tdelay = data['sig_t_delay'] if 'sig_t_delay' in data else 0
-    nev = Node.rng.poisson(new_mean)
-    size = len(self.mu)
-    j = Node.rng.choice(size, nev, p=nmu, replace=True, shuffle=False)
-    t0 = self.tedges[j]
-    dt = self.tedges[j+1] - t0
-    a = Node.rng.random(nev) * dt + t0 + tdelay
+    j, nev = self.draw_bins(self.new_mu, new_mean, key='sig')
+    a = self.jitter(self.tedges, j) + tdelay
     a.flags.writeable = False
 
     ngen = { 'times': a, 'gen_t_delay': tdelay }
@@ -71,3 +72,25 @@ class TimeSeries(TimeDistSource):
     
     return True
 
+  def alert_batch(self, data):
+    n = data['batch']
+    sn_distance = np.asarray(batch_field(data, 'sn_distance'), dtype=float) \
+                  if 'sn_distance' in data else np.full(n, float(self.dist))
+    tdelay = np.asarray(batch_field(data, 'sig_t_delay'), dtype=float) \
+             if 'sig_t_delay' in data else np.zeros(n)
+    # the shape of the histogram doesn't depend on distance
+    new_mean = np.sum(self.new_mu) * (10./sn_distance)**2
+
+    # draw events for all trials together, then split by trial
+    j, nev = self.draw_bins(self.new_mu, new_mean, key='sig')
+    a = self.jitter(self.tedges, j) + np.repeat(tdelay, nev)
+    a.flags.writeable = False
+    times = np.split(a, np.cumsum(nev)[:-1])
+
+    gens = batch_field(data, 'gen') if 'gen' in data else [ () ] * n
+    data['gen'] = [ gens[i] + ({ 'times': times[i], 'gen_t_delay': tdelay[i] }, )
+                    for i in range(n) ]
+    if 'gen' not in data.get('batch_fields', ()):
+      data['batch_fields'] = tuple(data.get('batch_fields', ())) + ('gen', )
+    data['detector_name'] = self.detector
+    return True
@@ -5,6 +5,8 @@ Arguments:
   rate:  number of events per second
   tmin:  starting time (seconds) of the generator.
   tmax:  stopping time (seconds).
+  binned:  (optional) fill a Hist1D bin by bin with Poisson numbers
+    of events rather than generating each event (default True)
 
 If tmin/tmax are floats, use the number as a timestamp.
 If they're strings, interpret as a unix time string.
@@ -26,6 +28,7 @@ class Uniform (Node):
     self.tmax = Time(tmax).to_value('unix', 'long') if isinstance(tmax, str) \
                 else tmax
     self.mean_total = (self.tmax - self.tmin) * self.rate
+    self.binned = kwargs.pop('binned', True)
     super().__init__(**kwargs)
 
   def alert(self, data):
@@ -36,16 +39,24 @@ class Uniform (Node):
         logging.error('Uniform.alert: field is neither TimeSeries nor Hist1D')
         return False
 
-      # suggested optimizations:
-      # * Hist1D can be filled bin by bin with Poisson variates
-      #   mu = self.rate * v.duration / v.nbins
-      #   v.bins += Node.rng.poisson(mu, v.nbins)
-      #   (but need to adjust means for partial bins at ends)
-      # * for Hist1D, and TimeSeries with limits, can restrict generation
-      #   to within those limits, rather than over the whole (tmin,tmax) 
+      if isinstance(v, Hist1D) and self.binned:
+        # fill bin by bin with Poisson variates, with means in proportion
+        # to the overlap of each bin (and the flows) with (tmin, tmax)
+        e = np.clip(np.concatenate(([ -np.inf ], v.edges(), [ np.inf ])),
+                    self.tmin, self.tmax)
+        n = Node.rng.poisson(self.rate * np.diff(e))
+        v.fill_bins(n[1:-1], n[0], n[-1])
+        return True
 
-      nev = Node.rng.poisson(self.mean_total) # Poisson fluctuations around mean
-      u = (self.tmax - self.tmin) * Node.rng.random(size=nev, dtype=np.float64) + self.tmin
+      # for TimeSeries with limits, only generate within those limits
+      t0, t1 = self.tmin, self.tmax
+      if isinstance(v, TimeSeries):
+        t0 = t0 if v.start == None else max(t0, v.start)
+        t1 = t1 if v.stop == None else min(t1, v.stop)
+        if t1 <= t0:
+          return True
+      nev = Node.rng.poisson((t1 - t0) * self.rate) # Poisson fluctuations around mean
+      u = (t1 - t0) * Node.rng.random(size=nev, dtype=np.float64) + t0
       v.add(u)
       return True
     else:
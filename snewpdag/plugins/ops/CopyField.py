@@ -14,6 +14,8 @@ from snewpdag.dag import Node
 from snewpdag.dag.lib import fetch_field, store_field
 
 class CopyField(Node):
+  stateless_reset = True
+
   def __init__(self, copy, **kwargs):
     self.copies = copy
     self.on = kwargs.pop('on', [ 'alert' ])
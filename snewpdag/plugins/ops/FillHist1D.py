@@ -24,6 +24,8 @@ from snewpdag.dag.lib import fetch_field
 from snewpdag.values import Hist1D
 
 class FillHist1D(Node):
+  stateless_reset = True
+
   def __init__(self, nbins, xlow, xhigh, in_field, out_field, **kwargs):
     self.hist = Hist1D(nbins, xlow, xhigh)
     self.in_field = in_field
@@ -42,6 +44,12 @@ class FillHist1D(Node):
     self.hist.fill(v)
     return False # don't forward an alert
 
+  def snapshot(self):
+    return { 'hist': self.hist.snapshot() }
+
+  def restore(self, snapshot):
+    self.hist.restore(snapshot['hist'])
+
   def reset(self, data):
     return False
 
@@ -13,6 +13,8 @@ import logging
 from snewpdag.dag import Node
 
 class WriteField(Node):
+  stateless_reset = True
+
   def __init__(self, write, **kwargs):
     self.writes = write
     self.on = kwargs.pop('on', [ 'alert' ])
@@ -109,6 +109,7 @@ from astropy.table import Table
 
 from snewpdag.dag import Node
 from snewpdag.dag.lib import fill_filename
+from snewpdag.values import MultiOrderMap
 
 class FitsSkymap(Node):
 
@@ -189,6 +190,8 @@ class FitsSkymap(Node):
     burst_id = data.get('burst_id', 0)
     if self.in_field in data:
       m = data[self.in_field]
+      if isinstance(m, MultiOrderMap):
+        m = m.to_dense()
     else:
       logger.warning('{}: no skymap to write'.format(self.name))
       return False
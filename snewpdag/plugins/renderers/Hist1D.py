@@ -34,6 +34,8 @@ from snewpdag.dag import Node
 from snewpdag.dag.lib import fill_filename, fetch_field
 
 class Hist1D(Node):
+  stateless_reset = True
+
   def __init__(self, in_field, title, xlabel, ylabel, filename, **kwargs):
     self.in_field = in_field
     self.title = title
@@ -22,13 +22,13 @@ import numbers
 import numpy as np
 
 from snewpdag.dag import Node
-from snewpdag.values import TimeSeries
+from snewpdag.values import TimeSeries, Hist1D, MultiOrderMap
 from snewpdag.dag.lib import fetch_field, fill_filename
 
 def json_output_default(obj):
   if isinstance(obj, np.ndarray):
     return [ x for x in obj ]
-  elif isinstance(obj, TimeSeries):
+  elif isinstance(obj, (TimeSeries, Hist1D, MultiOrderMap)):
     return obj.to_dict()
   elif isinstance(obj, numbers.Number):
     return float(obj)
@@ -36,6 +36,8 @@ def json_output_default(obj):
     raise TypeError("unjsonable type {}".format(obj))
 
 class JsonOutput(Node):
+  stateless_reset = True
+
   def __init__(self, fields, filename, **kwargs):
     self.fields = fields
     self.filename = filename
@@ -19,9 +19,11 @@ import healpy as hp
 
 from snewpdag.dag import Node
 from snewpdag.dag.lib import fill_filename, fetch_field
-from snewpdag.values import LMap
+from snewpdag.values import LMap, MultiOrderMap
 
 class Mollview(Node):
+  stateless_reset = True
+
   def __init__(self, in_field, title, units, coord, filename, **kwargs):
     self.in_field = in_field
     self.title = title
@@ -55,6 +57,8 @@ class Mollview(Node):
 
     m, exists = fetch_field(data, self.in_field)
     if exists:
+      if isinstance(m, MultiOrderMap):
+        m = m.to_dense()
       # replace a lot of these options later
       kwargs = {}
       if isinstance(self.range, (list, tuple, np.ndarray)):
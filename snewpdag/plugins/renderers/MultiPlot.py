@@ -22,6 +22,8 @@ from snewpdag.dag import Node
 from snewpdag.dag.lib import fill_filename, fetch_field
 
 class MultiPlot(Node):
+  stateless_reset = True
+
   def __init__(self, in_fields, title, xlabel, ylabel, filename, **kwargs):
     self.in_fields = in_fields
     self.title = title
@@ -12,7 +12,7 @@ import healpy as hp
 
 
 from snewpdag.dag import Node
-from snewpdag.values import LMap
+from snewpdag.values import LMap, MultiOrderMap
 
 class Skymap(Node):
   def __init__(self, in_field, title, filename, **kwargs):
@@ -28,6 +28,8 @@ class Skymap(Node):
     self.title = data['coinc_id']
     burst_id = data.get('burst_id', 0) # TODO: decide if burstid = coincid
     m = data.get(self.in_field, None)
+    if isinstance(m, MultiOrderMap):
+      m = m.to_dense()
     if np.any(m):
       # replace a lot of these options later
       hp.mollview(m,
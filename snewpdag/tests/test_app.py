@@ -2,6 +2,7 @@
 Unit tests for app methods for configuration and injection.
 """
 import unittest
+from snewpdag.dag import Plan, Template
 from snewpdag.dag.app import configure, inject
 
 class TestApp(unittest.TestCase):
@@ -126,3 +127,85 @@ class TestApp(unittest.TestCase):
     self.assertEqual(cm.output, [
         'ERROR:root:Diff1 observing itself' ])
 
+  def test_compiled(self):
+    spec = [
+      { 'class': 'TimeSeriesInput', 'name': 'Input1' },
+      { 'class': 'TimeSeriesInput', 'name': 'Input2' },
+      { 'class': 'NthTimeDiff',
+        'name': 'Diff1',
+        'kwargs': { 'nth': 1 },
+        'observe': [ 'Input1', 'Input2' ] },
+      { 'class': 'NthTimeDiff',
+        'name': 'Diff3',
+        'kwargs': { 'nth': 3 },
+        'observe': [ 'Input1', 'Input2' ] },
+      ]
+    plan = configure(spec, compiled=True)
+    self.assertIsInstance(plan, Plan)
+    self.assertEqual([ n.name for n in plan.order ],
+                     [ 'Input1', 'Input2', 'Diff1', 'Diff3' ])
+    self.assertEqual(plan.fanout, ( (2, 3), (2, 3), (), () ))
+
+    data = [
+      { 'name': 'Input1', 'action': 'alert',
+        'times': [ -0.1, 0.1, 0.2, 0.5 ] },
+      { 'name': 'Input2', 'action': 'alert',
+        'times': [ -0.5, 0.3, 0.6, 1.0 ] },
+      ]
+    nodes = { 0: plan }
+    inject(nodes, data, spec)
+    self.assertEqual(plan['Diff1'].last_data['action'], 'alert')
+    self.assertAlmostEqual(plan['Diff1'].last_data['dt'], 0.4)
+    self.assertAlmostEqual(plan['Diff3'].last_data['dt'], -0.4)
+    self.assertEqual(plan['Diff1'].last_data['history'].emit(),
+                     ( (('Input1', ), ('Input2', )), 'Diff1' ) )
+
+    inject(nodes, [ { 'name': 'Input2', 'action': 'revoke' } ], spec)
+    self.assertFalse(plan['Diff1'].valid[1])
+    self.assertEqual(plan['Diff1'].last_data['action'], 'revoke')
+    self.assertEqual(plan['Diff3'].last_data['action'], 'revoke')
+
+  def test_template(self):
+    spec = [
+      { 'class': 'TimeSeriesInput', 'name': 'Input1' },
+      { 'class': 'TimeSeriesInput', 'name': 'Input2' },
+      { 'class': 'NthTimeDiff',
+        'name': 'Diff1',
+        'kwargs': { 'nth': 1 },
+        'observe': [ 'Input1', 'Input2' ] },
+      { 'class': 'gen.TimeSeries',
+        'name': 'Gen',
+        'kwargs': { 'detector': 'D1',
+                    'sig_filetype': 'tn',
+                    'sig_filename': 'snewpdag/data/fluxparametrisation_22.5kT_0Hz_0.0msT0_1msbin.txt' } },
+      ]
+    tmpl = Template(configure(spec))
+    self.assertTrue(tmpl.cloneable)
+    nodes = { 1: tmpl.instantiate(), 2: tmpl.instantiate() }
+    self.assertIsNot(nodes[1]['Diff1'], nodes[2]['Diff1'])
+    self.assertEqual(nodes[1]['Input1'].observers, [ nodes[1]['Diff1'] ])
+    self.assertEqual(nodes[1]['Diff1'].watch_list,
+                     [ nodes[1]['Input1'], nodes[1]['Input2'] ])
+    # read-only arrays are shared
+    self.assertIs(nodes[1]['Gen'].new_mu, nodes[2]['Gen'].new_mu)
+    self.assertIs(nodes[1]['Gen'].new_mu, tmpl.prototype['Gen'].new_mu)
+
+    data = [
+      { 'name': 'Input1', 'action': 'alert', 'burst_id': 1,
+        'times': [ -0.1, 0.1, 0.2, 0.5 ] },
+      { 'name': 'Input2', 'action': 'alert', 'burst_id': 1,
+        'times': [ -0.5, 0.3, 0.6, 1.0 ] },
+      { 'name': 'Input1', 'action': 'alert', 'burst_id': 3,
+        'times': [ 0.0, -0.2, 0.4, 0.1 ] },
+      ]
+    inject(nodes, data, tmpl)
+    self.assertAlmostEqual(nodes[1]['Diff1'].last_data['dt'], 0.4)
+    self.assertEqual(nodes[2]['Diff1'].last_data, {})
+    self.assertIn(3, nodes)
+    self.assertTrue(nodes[3]['Diff1'].valid[0])
+    self.assertFalse(nodes[3]['Diff1'].valid[1])
+    self.assertEqual(tmpl.prototype['Diff1'].last_data, {})
+
+    plan = Template(configure(spec, compiled=True)).instantiate()
+    self.assertIsInstance(plan, Plan)
+    self.assertIs(plan.order[2], plan['Diff1'])
@@ -2,7 +2,7 @@
 Basic tests of the Node class by itself.
 """
 import unittest
-from snewpdag.dag import Node
+from snewpdag.dag import Node, Plan
 
 class TestBasicNode(unittest.TestCase):
 
@@ -69,3 +69,22 @@ class TestBasicNode(unittest.TestCase):
     self.assertEqual(self.n4.last_data['history'].emit(), ('node1','node3', 'node4'))
     self.assertEqual(self.n4.last_data['k'], 'v')
 
+  def test_plan_order(self):
+    self.n1.attach(self.n3)
+    self.n1.attach(self.n2)
+    self.n3.attach(self.n4)
+    plan = Plan({ n.name: n for n in [ self.n1, self.n2, self.n3, self.n4 ] })
+    data = { 'action': 'alert', 'k': 'v' }
+    plan.update('node1', data)
+    self.assertNotIn('history', data)
+    self.assertEqual(self.n1.last_data['history'].emit(), ('node1',))
+    self.assertEqual(self.n2.last_data['history'].emit(), ('node1','node2'))
+    self.assertEqual(self.n3.last_data['history'].emit(), ('node1','node3'))
+    self.assertEqual(self.n4.last_data['history'].emit(), ('node1','node3', 'node4'))
+    self.assertEqual(self.n4.last_data['k'], 'v')
+
+  def test_plan_cycle(self):
+    self.n1.attach(self.n2)
+    self.n2.attach(self.n1)
+    with self.assertRaises(ValueError):
+      Plan({ 'node1': self.n1, 'node2': self.n2 })
@@ -0,0 +1,94 @@
+"""
+Unit tests for batched (multi-trial) payloads.
+"""
+import unittest
+import numpy as np
+from snewpdag.dag import Node
+from snewpdag.dag.lib import batch_split, batch_merge
+from snewpdag.plugins import Histogram1D, Accumulator
+from snewpdag.dag.app import configure
+from snewpdag.trials.SimpleTrials import batchable
+
+class Twice(Node):
+  def alert(self, data):
+    if data['x'] < 0:
+      return False
+    data['y'] = 2 * data['x']
+    return True
+
+class TestBatch(unittest.TestCase):
+
+  def test_split_merge(self):
+    data = { 'action': 'alert', 'batch': 3, 'batch_fields': ('x',),
+             'x': [ 1, 2, 3 ], 'c': 'const' }
+    ds = list(batch_split(data))
+    self.assertEqual(ds, [ { 'action': 'alert', 'x': 1, 'c': 'const' },
+                           { 'action': 'alert', 'x': 2, 'c': 'const' },
+                           { 'action': 'alert', 'x': 3, 'c': 'const' } ])
+    for d in ds:
+      d['y'] = d['x'] + 1
+    m = batch_merge(ds, data)
+    self.assertEqual(m['batch'], 3)
+    self.assertEqual(m['batch_fields'], ('x', 'y'))
+    self.assertEqual(m['x'], [ 1, 2, 3 ])
+    self.assertEqual(m['y'], [ 2, 3, 4 ])
+    self.assertEqual(m['c'], 'const')
+
+  def test_fallback(self):
+    n1 = Twice('n1')
+    n2 = Node('n2')
+    n1.attach(n2)
+    n1.update({ 'action': 'alert', 'batch': 4, 'batch_fields': ('x',),
+                'x': [ 1, -1, 2, 3 ] })
+    d = n2.last_data
+    self.assertEqual(d['action'], 'alert')
+    self.assertEqual(d['batch'], 3) # one trial dropped
+    self.assertEqual(d['x'], [ 1, 2, 3 ])
+    self.assertEqual(d['y'], [ 2, 4, 6 ])
+    self.assertEqual(d['history'].emit(), ('n1', 'n2'))
+
+  def test_histogram(self):
+    x = [ -1.0, 0.05, 0.5, 0.55, 0.99, 1.0, 3.0, float('nan') ]
+    h1 = Histogram1D(10, 0.0, 1.0, 'x', name='h1')
+    for v in x:
+      h1.update({ 'action': 'alert', 'x': v })
+    h2 = Histogram1D(10, 0.0, 1.0, 'x', name='h2')
+    h2.update({ 'action': 'alert', 'x': x, 'batch': len(x),
+                'batch_fields': ('x',) })
+    self.assertTrue(np.array_equal(h1.bins, h2.bins))
+    self.assertEqual(h1.underflow, h2.underflow)
+    self.assertEqual(h1.overflow, h2.overflow)
+    self.assertEqual(h1.count, h2.count)
+    self.assertAlmostEqual(h1.sum, h2.sum)
+    self.assertAlmostEqual(h1.sum2, h2.sum2)
+
+  def test_batchable(self):
+    n1 = Node('n1')
+    n2 = Node('n2')
+    a = Accumulator('acc', 'x', name='acc', clear_on=[])
+    n1.attach(a)
+    n2.attach(a)
+    self.assertTrue(batchable({ 'n1': n1, 'n2': n2, 'acc': a }))
+    t = Twice('t')
+    n1.attach(t)
+    n2.attach(t)
+    self.assertFalse(batchable({ 'n1': n1, 'n2': n2, 'acc': a, 't': t }))
+    a.update({ 'action': 'alert', 'x': [ 4, 5 ], 'batch': 2,
+               'batch_fields': ('x',) })
+    self.assertEqual(a.series, [ 4, 5 ])
+
+  def test_batchable_reset(self):
+    spec = [
+      { 'class': 'Pass', 'name': 'Control', 'kwargs': { 'line': 0 } },
+      { 'class': 'Copy', 'name': 'Copy', 'observe': [ 'Control' ],
+        'kwargs': { 'cp': [ [ 'x', 'y' ] ] } },
+      { 'class': 'DiffPointing', 'name': 'Diff', 'observe': [ 'Copy' ],
+        'kwargs': { 'detector_location':
+                    'snewpdag/data/detector_location.csv',
+                    'nside': 4, 'min_dts': 1 } },
+      ]
+    nodes = configure(spec)
+    # DiffPointing keeps time differences until reset
+    self.assertFalse(batchable(nodes))
+    del nodes['Diff']
+    self.assertTrue(batchable(nodes)) # Copy only passes resets on
@@ -0,0 +1,69 @@
+"""
+Unit tests for the ICRS to GCRS pixel map cache
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+from snewpdag.dag import CelestialPixels
+
+class TestCelestialPixels(unittest.TestCase):
+
+  def setUp(self):
+    self.saved = (CelestialPixels.cache_dir, CelestialPixels.max_maps,
+                  CelestialPixels.fast, CelestialPixels.fast_window)
+    CelestialPixels().delete_all_maps()
+
+  def tearDown(self):
+    CelestialPixels.cache_dir, CelestialPixels.max_maps, \
+      CelestialPixels.fast, CelestialPixels.fast_window = self.saved
+    CelestialPixels.anchors = {}
+    CelestialPixels().delete_all_maps()
+
+  def test_lru(self):
+    CelestialPixels.cache_dir = None
+    CelestialPixels.max_maps = 2
+    cp = CelestialPixels()
+    t = 1635744156.7
+    m1 = cp.get_map(1, t)
+    self.assertEqual(m1.shape, (3, 12))
+    self.assertTrue(np.allclose(np.sum(m1 * m1, axis=0), 1.0))
+    self.assertIs(cp.get_map(1, t + 0.2), m1) # same second
+    cp.get_map(1, t + 1)
+    cp.get_map(1, t) # m1 is now the most recently used
+    cp.get_map(1, t + 2)
+    self.assertEqual(list(cp.list_maps()),
+                     [ (1, int(t)), (1, int(t) + 2) ])
+
+  def test_disk(self):
+    cp = CelestialPixels()
+    t = 1635744156.0
+    with tempfile.TemporaryDirectory() as d:
+      CelestialPixels.cache_dir = d
+      m1 = cp.get_map(2, t)
+      self.assertEqual(len(os.listdir(d)), 1)
+      self.assertTrue(os.path.exists(cp.filename(2, int(t))))
+      cp.delete_all_maps()
+      m2 = cp.get_map(2, t) # from disk
+      self.assertIsInstance(m2, np.memmap)
+      self.assertTrue(np.array_equal(m1, m2))
+      self.assertFalse(m2.flags.writeable)
+      del m2
+
+  def test_fast(self):
+    CelestialPixels.cache_dir = None
+    CelestialPixels.fast_window = 3600
+    CelestialPixels.anchors = {}
+    ex = CelestialPixels()
+    fa = CelestialPixels(fast=True)
+    t = 1635744156.0
+    m1 = np.asarray(ex.get_map(4, t))
+    m2 = fa.get_map(4, t)
+    self.assertEqual(m2.shape, m1.shape)
+    self.assertIn((4, int(t), 'fast'), list(fa.list_maps()))
+    self.assertEqual(len(CelestialPixels.anchors), 2)
+    # angle between the directions, in mas
+    d = 2.0 * np.arcsin(np.linalg.norm(m1 - m2, axis=0) / 2.0) * 2.06265e8
+    self.assertLess(np.max(d), 0.01)
+    fa.get_map(8, t + 10) # same anchors
+    self.assertEqual(len(CelestialPixels.anchors), 2)
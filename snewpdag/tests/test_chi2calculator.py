@@ -0,0 +1,64 @@
+"""
+Unit tests for Chi2Calculator
+"""
+import unittest
+import numpy as np
+import healpy as hp
+from snewpdag.plugins import Chi2Calculator
+from snewpdag.values import History, MultiOrderMap
+
+class TestChi2Calculator(unittest.TestCase):
+
+  def test_map(self):
+    dets = [ 'IC', 'JUNO', 'SK' ]
+    times = { 'IC': (1635744156, 328000000), 'JUNO': (1635744156, 320000000),
+              'SK': (1635744156, 331000000) }
+    c = Chi2Calculator(dets, 'snewpdag/data/detector_location.csv', 4,
+                       name='chi2')
+    for det in dets:
+      c.last_source = det
+      data = c.alert({ 'action': 'alert', 'neutrino_time': times[det],
+                       'detector_id': det, 'history': History() })
+    self.assertEqual(data['ndof'], 1)
+    self.assertEqual(len(data['map']), hp.nside2npix(4))
+    self.assertEqual(data['map'].min(), 0.0)
+
+    # compare with chi2 evaluated pixel by pixel
+    measured, info, t0, info0 = c.get_time_dicts()
+    pos0 = c.det_cartesian_position(info0)
+    chi2 = []
+    for i in range(c.NPIX):
+      n = np.array(hp.pix2vec(4, i, nest=True))
+      d = np.array([ (measured[k][0] - t0[0]) + (measured[k][1] - t0[1])/1e9 \
+                     - info[k][4] + info0[4] \
+                     - (c.det_cartesian_position(info[k]) - pos0) @ n / 3.0e8
+                     for k in info ])
+      chi2.append(d @ c.precision_matrix @ d)
+    chi2 = np.array(chi2)
+    self.assertTrue(np.allclose(data['map'], chi2 - chi2.min()))
+
+  def test_refine(self):
+    dets = [ 'IC', 'JUNO', 'SK' ]
+    times = { 'IC': (1635744156, 328000000), 'JUNO': (1635744156, 320000000),
+              'SK': (1635744156, 331000000) }
+    maps = {}
+    for nside, kw in [ (32, {}), (4, { 'max_nside': 32 }),
+                       (4, { 'max_nside': 32, 'refine_output': 'moc' }) ]:
+      c = Chi2Calculator(dets, 'snewpdag/data/detector_location.csv', nside,
+                         refine_chi2=20.0, name='chi2', **kw)
+      for det in dets:
+        c.last_source = det
+        data = c.alert({ 'action': 'alert', 'neutrino_time': times[det],
+                         'detector_id': det, 'history': History() })
+      maps[len(kw)] = data
+    full = maps[0]['map']
+    dense = maps[1]['map']
+    self.assertEqual(len(dense), len(full))
+    inside = full < 20.0
+    self.assertTrue(np.allclose(dense[inside], full[inside]))
+    self.assertTrue(np.all(dense[~inside] >= 20.0))
+    # the multi-order map has fewer pixels, but upsamples to the same
+    moc = maps[2]['map']
+    self.assertIsInstance(moc, MultiOrderMap)
+    self.assertLess(len(moc), len(full))
+    self.assertTrue(np.array_equal(moc.to_dense(), dense))
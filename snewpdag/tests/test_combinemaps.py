@@ -6,7 +6,7 @@ import numpy as np
 import healpy as hp
 from scipy.stats import chi2
 from snewpdag.dag.app import configure, inject
-from snewpdag.values import History
+from snewpdag.values import History, MultiOrderMap
 
 class TestCombineMaps(unittest.TestCase):
 
@@ -274,3 +274,41 @@ class TestCombineMaps(unittest.TestCase):
     td1 = d1 * hp.ud_grade(rv.cdf(d2), 4, order_in='NESTED', order_out='NESTED')
     self.assertListEqual(tdata['cl'].tolist(), td1.tolist())
 
+
+  def test_multiorder(self):
+    spec = [ { 'class': 'CombineMaps', 'name': 'Node1',
+               'kwargs': { 'force_cl': False } } ]
+    nodes = {}
+    nodes[0] = configure(spec)
+    npix1 = hp.nside2npix(4)
+    npix2 = hp.nside2npix(2)
+    d1 = np.arange(npix1) * 2 / npix1
+    d2 = np.arange(npix2) * 3 / npix2
+    h1 = History()
+    h1.append('Input1')
+    h2 = History()
+    h2.append('Input2')
+    data = [ { 'name': 'Node1', 'action': 'alert', 'history': h1,
+               'ndof': 1, 'chi2': MultiOrderMap.from_dense(d1) },
+             { 'name': 'Node1', 'action': 'alert', 'history': h2,
+               'ndof': 2, 'chi2': d2.tolist() }
+           ]
+    inject(nodes, data, spec)
+    tdata = nodes[0]['Node1'].last_data
+    self.assertEqual(tdata['ndof'], 3)
+    self.assertIsInstance(tdata['chi2'], MultiOrderMap)
+    td1 = d1 + hp.ud_grade(d2, 4, order_in='NESTED', order_out='NESTED')
+    self.assertTrue(np.allclose(tdata['chi2'].to_dense(), td1))
+
+    # add a CL map:  output is CL
+    h3 = History()
+    h3.append('Input3')
+    d3 = np.arange(npix2) / npix2
+    data = [ { 'name': 'Node1', 'action': 'alert', 'history': h3,
+               'cl': d3.tolist() } ]
+    inject(nodes, data, spec)
+    tdata = nodes[0]['Node1'].last_data
+    self.assertIsInstance(tdata['cl'], MultiOrderMap)
+    td2 = chi2(1).cdf(d1) * hp.ud_grade(chi2(2).cdf(d2) * d3, 4,
+                                        order_in='NESTED', order_out='NESTED')
+    self.assertTrue(np.allclose(tdata['cl'].to_dense(), td2))
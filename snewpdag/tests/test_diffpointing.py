@@ -0,0 +1,60 @@
+"""
+Unit tests for DiffPointing chi2 calculation
+"""
+import unittest
+import numpy as np
+from snewpdag.plugins import DiffPointing
+
+class TestDiffPointing(unittest.TestCase):
+
+  def setUp(self):
+    self.dp = DiffPointing('snewpdag/data/detector_location.csv', 16, 3,
+                           name='Diff')
+    t = 1635744156.328
+    dts = { ('SNOP','Borexino'): { 'dt': 0.012, 't1': t, 't2': t-0.012 },
+            ('SNOP','KL'): { 'dt': -0.004, 't1': t, 't2': t+0.004 },
+            ('KM3','SNOP'): { 'dt': 0.02, 't1': t-0.02, 't2': t } }
+    for k, v in dts.items():
+      self.dp.cache[k] = self.dp.cache_values(k[0], k[1], v)
+    self.keys = list(self.dp.cache)
+
+  def test_covariance(self):
+    v = self.dp.covariance(self.keys)
+    c = self.dp.cache
+    k = self.keys
+    self.assertAlmostEqual(v[0,0], c[k[0]]['var'])
+    self.assertAlmostEqual(v[0,1], c[k[0]]['dsig1'] * c[k[1]]['dsig1'])
+    self.assertAlmostEqual(v[0,2], c[k[0]]['dsig1'] * c[k[2]]['dsig2'])
+    self.assertAlmostEqual(v[2,1], c[k[2]]['dsig2'] * c[k[1]]['dsig1'])
+    self.assertTrue(np.array_equal(v, v.T))
+
+  def test_covariance_reversed(self):
+    # (A,B) and (B,A) share both detectors:  first of row = second of column
+    # takes precedence, as in a loop over pairs of keys
+    c = self.dp.cache
+    c[('Borexino','SNOP')] = dict(c[('SNOP','Borexino')], dsig1=2.0, dsig2=-3.0)
+    keys = [ ('SNOP','Borexino'), ('Borexino','SNOP') ]
+    v = self.dp.covariance(keys)
+    self.assertAlmostEqual(v[0,1], c[keys[0]]['dsig1'] * c[keys[1]]['dsig2'])
+    self.assertAlmostEqual(v[1,0], c[keys[1]]['dsig1'] * c[keys[0]]['dsig2'])
+
+  def test_chi2(self):
+    d = np.random.default_rng(1).normal(size=(50, 3)) * 0.01
+    v = self.dp.covariance(self.keys)
+    ref = np.array([ d[i] @ np.linalg.solve(v, d[i]) for i in range(len(d)) ])
+    self.assertTrue(np.allclose(self.dp.chi2(self.keys, d), ref))
+
+  def test_refine(self):
+    dts = { k: { kk: self.dp.cache[k][kk] for kk in ('dt', 't1', 't2') }
+            for k in self.keys }
+    full = DiffPointing('snewpdag/data/detector_location.csv', 64, 3,
+                        name='Full').alert({ 'dts': dts })['map']
+    dp = DiffPointing('snewpdag/data/detector_location.csv', 8, 3,
+                      max_nside=64, refine_chi2=12.0, refine_output='moc',
+                      name='Refine')
+    data = dp.alert({ 'dts': dts })
+    self.assertTrue(data['map'].covers_sky())
+    m = data['map'].to_dense(64)
+    inside = full < 12.0
+    self.assertTrue(np.allclose(m[inside], full[inside]))
+    self.assertTrue(np.all(m[~inside] >= 12.0))
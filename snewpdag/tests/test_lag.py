@@ -0,0 +1,108 @@
+"""
+Unit tests for lag estimation
+"""
+import unittest
+import numpy as np
+from snewpdag.dag.lib import parabolic_peak
+from snewpdag.plugins import XCovLag, NLogLag, NBLag
+from snewpdag.plugins.LagScan import LagScan
+from snewpdag.values import TimeSeries
+
+class TestLag(unittest.TestCase):
+
+  def setUp(self):
+    rng = np.random.default_rng(2)
+    self.a = TimeSeries()
+    self.a.add(100.0123 + rng.gamma(2.0, 0.2, 500))
+    self.b = TimeSeries()
+    self.b.add(100.0 + rng.gamma(2.0, 0.2, 3000))
+    self.dt = np.arange(-0.05, 0.05, 0.001)
+
+  def test_shifted_histograms(self):
+    starts = np.array([ 99.5, 99.9, 100.03 ])
+    hs = self.b.shifted_histograms(20, starts, 2.0)
+    self.assertEqual(hs.shape, (3, 20))
+    for h, st in zip(hs, starts):
+      self.assertTrue(np.array_equal(h, self.b.histogram(20, st, st + 2.0)[0]))
+
+  def test_parabolic_peak(self):
+    x = np.linspace(0.0, 1.0, 11)
+    y = - (x - 0.43)**2
+    self.assertAlmostEqual(parabolic_peak(x, y, np.argmax(y)), 0.43)
+    self.assertEqual(parabolic_peak(x, x, 10), 1.0)
+
+  def test_xcovlag(self):
+    n = XCovLag(100, 2.0, 'ts', 'det', 'dets', 'lags', name='x')
+    n.cache = { 'A': self.a, 'B': self.b }
+    y = n.xcov_profile('A', 'B', self.dt)
+    ref = [ n.xcov('A', 'B', dt) for dt in self.dt ]
+    self.assertTrue(np.array_equal(y, ref))
+    lag = n.lag('A', 'B')
+    self.assertLessEqual(abs(lag[0] - lag[2][np.argmax(lag[3])]), 0.0001)
+
+  def test_nloglag(self):
+    n = NLogLag(100, 2.0, 'ts', 'det', 'dets', 'lags', name='n')
+    n.cache = { 'A': self.a, 'B': self.b }
+    y = n.xlognm_profile('A', 'B', self.dt)
+    ref = [ n.xlognm('A', 'B', dt) for dt in self.dt ]
+    self.assertTrue(np.allclose(y, ref))
+    lag = n.lag('A', 'B')
+    self.assertLess(abs(lag['dt'] - 0.0123), 0.005)
+    self.assertEqual(len(lag['profile_y']), len(lag['profile_x']))
+
+  def test_nblag(self):
+    n = NBLag(20, 1.0, 'ts', 'det', 'dets', 'lags', name='nb',
+              bg={ 'A': 10.0, 'B': 50.0 })
+    ns = [ 0, 0, 7, 3, 40, 120, 15 ]
+    ms = [ 0, 5, 0, 4, 90, 10, 15 ]
+    aa = [ 0.5, 2.0, 0.3, 1.0, 0.2, 6.5, 1.0 ]
+    x = n.xprods(ns, ms, aa)
+    ref = [ n.xprod(*v, 0.0, 0.0) for v in zip(ns, ms, aa) ]
+    self.assertTrue(np.allclose(x, ref))
+    self.assertTrue(np.isnan(n.xprods([ 3 ], [ 4 ], [ -1.0 ])[0]))
+
+    n.cache = { 'A': self.a, 'B': self.b }
+    dt = self.dt[::10]
+    ref = [ n.xprodnm('A', 'B', t) for t in dt ]
+    self.assertTrue(np.allclose(n.xprodnm_profile('A', 'B', dt), ref))
+
+  def test_profile_required(self):
+    class NoProfile(LagScan):
+      pass
+    with self.assertRaises(TypeError):
+      NoProfile(100, 2.0, 'ts', 'det', 'dets', 'lags', name='p')
+    n = NBLag(100, 2.0, 'ts', 'det', 'dets', 'lags', name='b')
+    n.cache = { 'A': self.a, 'B': self.b }
+    y = n.profile('A', 'B', self.dt)
+    self.assertEqual(n.statistic('A', 'B', self.dt[7]), y[7])
+
+  def test_search(self):
+    kw = { 'scan': [ -0.03, 0.03, 0.0005 ] }
+    grid = NLogLag(100, 2.0, 'ts', 'det', 'dets', 'lags', name='g', **kw)
+    brent = NLogLag(100, 2.0, 'ts', 'det', 'dets', 'lags', name='b',
+                    search='brent', coarse=0.005, **kw)
+    for n in [ grid, brent ]:
+      n.cache = { 'A': self.a, 'B': self.b }
+    g = grid.lag('A', 'B')
+    b = brent.lag('A', 'B')
+    self.assertEqual(len(g['profile_x']), 120)
+    self.assertEqual(len(b['profile_x']), 12)
+    # at least as good as the best point of the fine grid
+    self.assertGreaterEqual(brent.statistic('A', 'B', b['dt']),
+                            np.max(g['profile_y']))
+
+  def test_threads(self):
+    c = TimeSeries()
+    c.add(100.03 + np.random.default_rng(3).gamma(2.0, 0.2, 800))
+    data = []
+    for threads in [ None, 3 ]:
+      n = XCovLag(100, 2.0, 'ts', 'det', 'dets', 'lags', name='x',
+                  fixed_ref='B', threads=threads)
+      for k, ts in [ ('A', self.a), ('C', c), ('B', self.b) ]:
+        d = n.alert({ 'action': 'alert', 'ts': ts, 'det': k,
+                      'dets': [ 'A', 'B', 'C' ] })
+      data.append(d['lags'])
+    self.assertEqual(data[0].keys(), data[1].keys())
+    self.assertEqual(data[0][('B','B')], (0.0, 0.0))
+    for k in [ ('A','B'), ('C','B') ]:
+      self.assertEqual(data[0][k][0], data[1][k][0])
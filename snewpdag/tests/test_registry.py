@@ -0,0 +1,67 @@
+"""
+Unit tests for the DAG registry (eviction of idle/excess DAGs).
+"""
+import unittest
+from snewpdag.dag import Node, Registry
+
+class Clock:
+  def __init__(self):
+    self.t = 0.0
+  def __call__(self):
+    return self.t
+
+def make_dag():
+  n1 = Node('Control')
+  n2 = Node('Out')
+  n1.attach(n2)
+  return { 'Control': n1, 'Out': n2 }
+
+class TestRegistry(unittest.TestCase):
+
+  def setUp(self):
+    self.flushed = []
+
+  def flush(self, key, dag):
+    self.flushed.append(key)
+    dag['Control'].update({ 'action': 'report', 'burst_id': key })
+
+  def test_lru(self):
+    dags = Registry(max_dags=2, flush=self.flush)
+    d1 = make_dag()
+    dags[1] = d1
+    dags[2] = make_dag()
+    self.assertIs(dags[1], d1) # 2 is now least recently used
+    dags[3] = make_dag()
+    self.assertEqual(list(dags), [ 1, 3 ])
+    self.assertEqual(self.flushed, [ 2 ])
+    dags[4] = make_dag()
+    self.assertEqual(list(dags), [ 3, 4 ])
+    self.assertEqual(self.flushed, [ 2, 1 ])
+    # evicted DAG was reported, then disposed
+    self.assertEqual(d1['Out'].last_data, {})
+    self.assertEqual(d1['Control'].observers, [])
+    self.assertEqual(d1['Out'].watch_list, [])
+
+  def test_ttl(self):
+    clock = Clock()
+    dags = Registry(ttl=10.0, flush=self.flush, clock=clock)
+    dags['a'] = make_dag()
+    clock.t = 5.0
+    dags['b'] = make_dag()
+    clock.t = 12.0
+    self.assertIn('a', dags) # not expired until the registry is used
+    dags['b']['Control'].update({ 'action': 'alert' })
+    self.assertNotIn('a', dags)
+    self.assertEqual(self.flushed, [ 'a' ])
+    clock.t = 30.0
+    dags['c'] = make_dag()
+    self.assertEqual(list(dags), [ 'c' ])
+    dags.close()
+    self.assertEqual(len(dags), 0)
+    self.assertEqual(self.flushed, [ 'a', 'b', 'c' ])
+
+  def test_unbounded(self):
+    dags = Registry()
+    for i in range(100):
+      dags[i] = make_dag()
+    self.assertEqual(len(dags), 100)
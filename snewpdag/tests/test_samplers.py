@@ -0,0 +1,87 @@
+"""
+Unit tests for the event samplers of TimeDistSource generators
+"""
+import unittest
+import numpy as np
+from snewpdag.dag import Node
+from snewpdag.plugins.gen import TimeSeries, GenTimeDist, Uniform
+from snewpdag.values import Hist1D
+
+class TestSamplers(unittest.TestCase):
+
+  fn = 'snewpdag/data/fluxparametrisation_22.5kT_0Hz_0.0msT0_1msbin.txt'
+
+  def test_alias_table(self):
+    g = TimeSeries('D1', sig_filename=self.fn, sig_filetype='tn', name='g')
+    w = np.array([ 1.0, 0.0, 3.0, 2.0, 2.0 ])
+    prob, alias = g.alias_table('w', w)
+    self.assertIs(g.alias_table('w', w)[0], prob) # kept
+    # each bin's share of the table adds up to its probability
+    share = prob.copy()
+    np.add.at(share, alias, 1.0 - prob)
+    self.assertTrue(np.allclose(share / len(w), w / np.sum(w)))
+
+  def test_samplers(self):
+    Node.rng = np.random.default_rng(11)
+    w = np.array([ 5.0, 0.0, 20.0, 10.0, 15.0 ])
+    edges = np.arange(6.0)
+    for s in TimeSeries.samplers:
+      g = TimeSeries('D1', sig_filename=self.fn, sig_filetype='tn',
+                     sampler=s, name='g')
+      j, nev = g.draw_bins(w, np.full(400, 50.0), key='w')
+      self.assertEqual(len(j), np.sum(nev))
+      self.assertEqual(nev.shape, (400,))
+      n = np.bincount(j, minlength=5)
+      self.assertEqual(n[1], 0)
+      # 20000 events expected in all
+      self.assertLess(abs(np.sum(n) - 20000), 5 * np.sqrt(20000))
+      self.assertLess(np.sum((n - 400 * w)**2 / np.maximum(400 * w, 1)), 25)
+      j, nev = g.draw_bins(w, 30.0, smear=False, key='w')
+      self.assertEqual(nev, 30)
+      t = g.jitter(edges, j)
+      self.assertTrue(np.array_equal(np.floor(t), j))
+
+  def test_generate(self):
+    Node.rng = np.random.default_rng(12)
+    for s in TimeSeries.samplers:
+      g = TimeSeries('D1', sig_filename=self.fn, sig_filetype='tn',
+                     sampler=s, name='g')
+      data = { 'sn_distance': 20.0 }
+      g.alert(data)
+      ts = data['gen'][0]['times']
+      mean = 0.25 * np.sum(g.new_mu)
+      self.assertLess(abs(len(ts) - mean), 5 * np.sqrt(mean))
+      self.assertTrue(np.all((ts >= g.tedges[0]) & (ts < g.tedges[-1])))
+      data = { 'batch': 3, 'sn_distance': [ 10.0, 20.0, 40.0 ],
+               'batch_fields': ('sn_distance', ) }
+      g.alert(data)
+      self.assertEqual(len(data['gen']), 3)
+
+  def test_binned(self):
+    Node.rng = np.random.default_rng(13)
+    g = GenTimeDist('h', sig_filename=self.fn, sig_filetype='tn',
+                    sig_mean=20000, sig_t0=100.0, name='g')
+    u = Uniform('h', 1000.0, 99.0, 100.6, name='u')
+    hs = []
+    for binned in [ True, False ]:
+      g.binned = binned
+      u.binned = binned
+      h = Hist1D(10, 100.0, 100.5)
+      for i in range(10):
+        g.alert({ 'h': h })
+        u.alert({ 'h': h })
+      hs.append(h)
+    b, e = hs
+    self.assertAlmostEqual(b.count, e.count, delta=5 * np.sqrt(e.count))
+    self.assertAlmostEqual(b.underflow, e.underflow,
+                           delta=5 * np.sqrt(e.underflow))
+    self.assertAlmostEqual(b.overflow, e.overflow,
+                           delta=5 * np.sqrt(e.overflow) + 5)
+    self.assertLess(np.sum((b.bins - e.bins)**2 / (b.bins + e.bins)), 30)
+
+    # fixed number of events
+    g.sig_smear = False
+    g.binned = True
+    h = Hist1D(10, 100.0, 100.5)
+    g.alert({ 'h': h })
+    self.assertEqual(h.count, 20000)
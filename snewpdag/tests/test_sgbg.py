@@ -0,0 +1,40 @@
+"""
+Unit tests for the signal + background lightcurve generators
+"""
+import unittest
+import numpy as np
+from snewpdag.dag import Node
+from snewpdag.plugins.gen import GenerateSGBG, GenerateSGBG_deadtimes
+
+class TestSGBG(unittest.TestCase):
+
+  fn = 'snewpdag/data/output_scint20kt_27_Shen_1D_solar_mass_progenitor.fits_1msbin.txt'
+
+  def test_template(self):
+    g = GenerateSGBG(2.0, 'JUNO', sig_filename=self.fn, sig_filetype='tn',
+                     name='g')
+    self.assertEqual(len(g.bg_rate), 20000)
+    self.assertAlmostEqual(np.sum(g.sig_rate), np.sum(g.new_mu))
+    # signal starts tdelay (100 ms) after t = 0
+    i0 = np.nonzero(g.sig_rate)[0][0]
+    self.assertAlmostEqual(g.edges[i0], g.t[np.nonzero(g.new_mu)[0][0]] + 0.1)
+
+    d = GenerateSGBG_deadtimes(2.0, 'JUNO', sig_filename=self.fn,
+                               sig_filetype='tn', name='d')
+    self.assertEqual(d.bg_rate[10000], 1.0) # t = 0 is vetoed
+    self.assertEqual(d.bg_rate[10001], 2.0)
+    self.assertEqual(d.bg_rate[10100], 1.0)
+    self.assertEqual(np.sum(d.bg_rate < 2.0), 200)
+
+  def test_alert(self):
+    Node.rng = np.random.default_rng(2)
+    g = GenerateSGBG(0.5, 'JUNO', sig_filename=self.fn, sig_filetype='tn',
+                     name='g')
+    data = { 'sn_distance': 20.0 }
+    g.alert(data)
+    ts = data['gen'][0]['times']
+    mean = np.sum(g.bg_rate) + 0.25 * np.sum(g.sig_rate)
+    self.assertLess(abs(len(ts) - mean), 5.0 * np.sqrt(mean))
+    self.assertTrue(np.all((ts >= -10.0) & (ts < 10.0)))
+    self.assertEqual(data['gen'][0]['t_true'], 100)
+    self.assertEqual(data['detector_name'], 'JUNO')
@@ -3,10 +3,14 @@ Unit tests for input classes.
 """
 import unittest
 import logging
+import math
 import json
+import numpy as np
+from astropy.stats import bayesian_blocks
 from snewpdag.dag import Node
 from snewpdag.plugins import ShapeComparison
 from snewpdag.plugins import BayesianBlocks
+from snewpdag.plugins import ShapeHistFunctions as SHF
 
 class TestShape(unittest.TestCase):
 
@@ -23,3 +27,46 @@ class TestShape(unittest.TestCase):
     bayes.update(data[0])
     bayes.update(data[1])
 
+  def test_shifted_hists(self):
+    v = np.random.default_rng(3).normal(0.05, 0.05, 200)
+    # aligned (step is 2 bins) and unaligned scans
+    for dt in [ -0.04 + 0.002 * np.arange(20), -0.04 + 0.0013 * np.arange(20) ]:
+      hs = SHF.shifted_hists(50, -0.2, 0.3, v, dt)
+      for i in range(len(dt)):
+        h = SHF.remove_flow(SHF.fill_hist(50, -0.2, 0.3, v, dt[i]))
+        self.assertTrue(np.allclose(hs[i], h))
+
+  def test_minimise(self):
+    dt = -0.04 + 0.0005 * np.arange(160)
+    m = 3.0 + 100.0 * (dt - 0.0123)**2 + 1e5 * (dt - 0.0123)**4
+    self.assertAlmostEqual(SHF.minimise(m, -0.04, 0.0005, 160, 4, 0.01),
+                           0.0123)
+    m = SHF.diff_hist([ [ 0.5, 0.5, 0.0 ], [ 0.0, 0.5, 0.5 ] ],
+                      [ 0.0, 0.5, 0.5 ], 2.0)
+    self.assertTrue(np.allclose(m, [ 2.0, 0.0 ]))
+
+  def test_bayesian_block(self):
+    shape = ShapeComparison(100, -0.2, 0.3, 5.0, -0.04, 0.002, 20, 4, 0.01,
+                            name='Node1')
+    rng = np.random.default_rng(4)
+    v = np.concatenate((rng.uniform(-0.2, 0.3, 100),
+                        rng.exponential(0.05, 300)))
+    v = v[v < 0.3]
+    ref = bayesian_blocks(v, p0=None, ncp_prior=-math.log(0.01))
+    for prune in [ True, False ]:
+      bayes = BayesianBlocks(100, -0.2, 0.3, shape, 0.01, -1.0, prune=prune,
+                             name='Node2')
+      edges, counts, uniform = bayes.bayesian_block(v)
+      self.assertTrue(np.allclose(edges[1:-1], ref[1:-1]))
+      self.assertEqual(np.sum(counts), len(v))
+      self.assertEqual(len(uniform), 0)
+
+    # hybrid:  uniform bins up to the division
+    bayes = BayesianBlocks(100, -0.2, 0.3, shape, 0.01, 0.0, name='Node2')
+    b = bayes.bayesian_block(v)
+    self.assertEqual(len(b[2]), np.sum(v <= 0.0))
+    dt = np.array([ 0.0, 0.002, 0.011 ])
+    hs = bayes.block_hist(b, dt)
+    self.assertAlmostEqual(np.sum(hs[0]), 1.0)
+    for i in range(len(dt)):
+      self.assertTrue(np.allclose(hs[i], bayes.block_hist(b, dt[i])))
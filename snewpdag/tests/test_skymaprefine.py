@@ -0,0 +1,26 @@
+"""
+Unit tests for adaptive-resolution skymap helpers
+"""
+import unittest
+import numpy as np
+import healpy as hp
+from snewpdag.plugins import SkymapRefine as SR
+
+class TestSkymapRefine(unittest.TestCase):
+
+  def test_refine(self):
+    # chi2 of a direction with a 1 degree error
+    n0 = np.array(hp.ang2vec(40.0, 20.0, lonlat=True))
+    def evaluate(nside, ipix):
+      v = np.array(hp.pix2vec(nside, ipix, nest=True))
+      a = np.degrees(np.arccos(np.clip(n0 @ v, -1.0, 1.0)))
+      return a * a
+    mo = SR.refine(evaluate, 4, 128, 10.0)
+    self.assertTrue(mo.covers_sky())
+    dense = mo.to_dense()
+    full = evaluate(128, np.arange(hp.nside2npix(128)))
+    inside = full < 10.0
+    self.assertTrue(np.array_equal(dense[inside], full[inside]))
+    self.assertTrue(np.all(dense[~inside] >= 10.0))
+    self.assertLess(len(mo), hp.nside2npix(128) / 50)
+    self.assertEqual(mo.nsides()[0], 4)
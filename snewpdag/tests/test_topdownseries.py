@@ -0,0 +1,64 @@
+"""
+Unit tests for TopDownSeries
+"""
+import unittest
+import numpy as np
+from scipy.special import gammaln
+from snewpdag.plugins.TopDownSeries import TopDownSeries
+from snewpdag.values import TimeSeries
+
+class TestTopDownSeries(unittest.TestCase):
+
+  def test_histograms(self):
+    n = TopDownSeries('snewpdag/data/detector_location.csv', 1, 10, 2.0,
+                      'ts', 'det', 'dets', name='td')
+    rng = np.random.default_rng(5)
+    times = [ np.sort(rng.uniform(0.0, 3.0, 200)),
+              np.sort(rng.uniform(0.0, 3.0, 50)) ]
+    tdelays = np.array([ [ 0.0, 0.3, -0.2 ], [ 0.1, 0.0, 0.5 ] ])
+    nn = n.histograms(times, 0.5, tdelays)
+    self.assertEqual(nn.shape, (2, 3, 10))
+    for i in range(2):
+      for p in range(3):
+        t0 = 0.5 - tdelays[i,p]
+        h, e = np.histogram(times[i], bins=10, range=(t0, t0 + 2.0))
+        self.assertTrue(np.array_equal(nn[i,p], h))
+
+  def test_log_likelihood(self):
+    nn = np.array([ [ [ 1, 4, 2 ], [ 0, 3, 0 ] ],
+                    [ [ 2, 6, 3 ], [ 0, 0, 0 ] ] ], dtype=float)
+    n = TopDownSeries('snewpdag/data/detector_location.csv', 1, 3, 1.0,
+                      'ts', 'det', 'dets', method='poisson', name='td')
+    logp = n.log_likelihood(nn)
+    self.assertEqual(logp.shape, (2,))
+    # identical profiles, so only the Poisson terms at pp=nn remain
+    ref = np.array([ 1, 4, 2 ]) + np.array([ 2, 6, 3 ])
+    pp = np.outer([ 7, 11 ], ref / ref.sum())
+    x = (pp - nn[:,0]) * np.log(2.0) + gammaln(pp + 1) \
+        - gammaln(nn[:,0] + 1) + gammaln(pp + nn[:,0] + 1) \
+        - gammaln(2 * pp + 1)
+    self.assertAlmostEqual(logp[0], np.sum(x))
+    # second detector empty for pixel 1, so only the first contributes
+    self.assertAlmostEqual(logp[1], 0.0)
+
+  def test_refine(self):
+    rng = np.random.default_rng(6)
+    t0 = 1635744156.0
+    burst = t0 + rng.exponential(0.5, 4000)
+    series = { 'IC': burst[:3000] + 0.01, 'SK': burst[3000:] }
+    maps = []
+    for nside, kw in [ (16, {}), (2, { 'max_nside': 16 }) ]:
+      n = TopDownSeries('snewpdag/data/detector_location.csv', nside, 40, 2.0,
+                        'ts', 'det', 'dets', refine_chi2=5.0, name='td',
+                        **kw)
+      for det, ts in series.items():
+        s = TimeSeries(t0 - 1.0)
+        s.add(ts)
+        data = n.alert({ 'ts': s, 'det': det, 'dets': list(series) })
+      maps.append(data)
+    full, dense = maps
+    self.assertEqual(len(dense['map']), len(full['map']))
+    inside = full['map'] < 5.0
+    self.assertTrue(np.allclose(dense['map'][inside], full['map'][inside]))
+    self.assertTrue(np.allclose(dense['chi2'][inside], full['chi2'][inside]))
+    self.assertLess(np.sum(inside), len(inside) / 2)
@@ -0,0 +1,145 @@
+"""
+Unit tests for MC trial runners.
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+from snewpdag.dag.lib import combine_snapshots
+from snewpdag.plugins import Histogram1D, BinnedAccumulator, HistogramSkymap
+from snewpdag.plugins.ops import FillHist1D
+from snewpdag.values import Hist1D
+from snewpdag.trials.ParallelTrials import trials
+from snewpdag.trials import SimpleTrials, Reduce
+
+class TestTrials(unittest.TestCase):
+
+  def test_parallel(self):
+    spec = [
+      { 'class': 'Pass', 'name': 'Control', 'kwargs': { 'line': 0 } },
+      { 'class': 'Histogram1D', 'name': 'Hist', 'observe': [ 'Control' ],
+        'kwargs': { 'nbins': 5, 'xlow': 0, 'xhigh': 25,
+                    'in_field': 'trial_id' } },
+      { 'class': 'Accumulator', 'name': 'Acc', 'observe': [ 'Control' ],
+        'kwargs': { 'title': 'Trials', 'in_field': 'trial_id',
+                    'clear_on': [] } },
+      ]
+    nodes = trials(spec, ntrials=30, seed=1, workers=3)
+    self.assertEqual(list(nodes['Hist'].bins), [ 5, 5, 5, 5, 5 ])
+    self.assertEqual(nodes['Hist'].overflow, 5)
+    self.assertEqual(nodes['Hist'].count, 30)
+    self.assertEqual(nodes['Hist'].sum, 435)
+    self.assertEqual(nodes['Acc'].series, list(range(30)))
+    self.assertTrue(np.array_equal(nodes['Acc'].last_data['series'],
+                                   np.arange(30)))
+
+  def fill(self, node, xs):
+    for x in xs:
+      node.update({ 'action': 'alert', 'x': x, 'x_err': 0.5 * x,
+                    'x_stats': 0.25 * x, 'x_sys': 0.125 * x })
+    return node
+
+  def test_merge(self):
+    xs = [ [ 0.1, 0.5, 1.5, -0.2 ], [ 0.25, 0.75 ], [ 0.9, 0.0, 2.0 ] ]
+    for make in [ lambda: Histogram1D(4, 0.0, 1.0, 'x', name='h'),
+                  lambda: FillHist1D(4, 0.0, 1.0, 'x', 'h', name='h') ]:
+      parts = [ self.fill(make(), x) for x in xs ]
+      whole = self.fill(make(), xs[0] + xs[1] + xs[2])
+      snaps = [ p.snapshot() for p in parts ]
+      # associative:  (a+b)+c == a+(b+c) == all at once
+      s1 = combine_snapshots(combine_snapshots(snaps[0], snaps[1]), snaps[2])
+      s2 = combine_snapshots(snaps[0], combine_snapshots(snaps[1], snaps[2]))
+      for s in [ s1, s2 ]:
+        self.assertEqual(s.keys(), whole.snapshot().keys())
+      n = make()
+      for p in parts:
+        n.merge(p)
+      for s in [ s1, s2, n.snapshot() ]:
+        w = whole.snapshot()
+        for k, v in w.items():
+          if k == 'hist':
+            for kk, vv in v.items():
+              self.assertTrue(np.allclose(s[k][kk], vv) if kk != 'shape' \
+                              else s[k][kk] == vv)
+          elif k == 'shape':
+            self.assertEqual(s[k], v)
+          else:
+            self.assertTrue(np.allclose(s[k], v))
+    self.assertEqual(n.hist.count, 9)
+    self.assertEqual(n.hist.underflow, 1)
+    self.assertEqual(n.hist.overflow, 2)
+
+    with self.assertLogs() as cm:
+      Histogram1D(4, 0.0, 1.0, 'x', name='h').merge(
+        Histogram1D(5, 0.0, 1.0, 'x', name='h5'))
+    self.assertEqual(len(cm.output), 1)
+
+  def test_merge_values(self):
+    h1 = Hist1D(5, 0.0, 5.0)
+    h1.fill([ 0.5, 1.5, 1.5, 7.0 ])
+    h2 = Hist1D(5, 0.0, 5.0)
+    h2.fill([ -1.0, 4.5 ])
+    h1.merge(h2)
+    self.assertEqual(list(h1.bins), [ 1, 2, 0, 0, 1 ])
+    self.assertEqual(h1.underflow, 1)
+    self.assertEqual(h1.overflow, 1)
+    self.assertEqual(h1.count, 6)
+
+    b = BinnedAccumulator('x', 4, 0.0, 1.0, 'xs', 'ys', name='b')
+    b.merge(self.fill(BinnedAccumulator('x', 4, 0.0, 1.0, 'xs', 'ys', name='b1'),
+                      [ np.array([ 0.1, 0.2, 0.6 ]) ]))
+    self.assertEqual(list(b.bins), [ 2, 0, 1, 0 ])
+    self.assertEqual(list(b.edges), [ 0.0, 0.25, 0.5, 0.75, 1.0 ])
+    m = HistogramSkymap(1, 'x', 'm', 'e', name='m')
+    m1 = HistogramSkymap(1, 'x', 'm', 'e', name='m1')
+    m1.update({ 'action': 'alert', 'x': [ 0, 1 ] })
+    m1.update({ 'action': 'alert', 'x': [ 1 ] })
+    m.merge(m1)
+    self.assertEqual(list(m.m[:3]), [ 0.5, 1.5, 0.0 ])
+
+  def test_reduce(self):
+    spec = [
+      { 'class': 'Pass', 'name': 'Control', 'kwargs': { 'line': 0 } },
+      { 'class': 'Accumulator', 'name': 'Acc', 'observe': [ 'Control' ],
+        'kwargs': { 'title': 'Trials', 'in_field': 'trial_id',
+                    'clear_on': [] } },
+      ]
+    with tempfile.TemporaryDirectory() as d:
+      fns = [ os.path.join(d, 's{}.pkl'.format(i)) for i in range(3) ]
+      for i, fn in enumerate(fns):
+        SimpleTrials.trials(spec, ntrials=4, first=4*i, seed=i, snapshot=fn)
+      Reduce.combine(fns[1:], os.path.join(d, 's12.pkl'))
+      nodes = Reduce.reduce(spec, [ fns[0], os.path.join(d, 's12.pkl') ])
+    self.assertEqual(nodes['Acc'].series, list(range(12)))
+
+  def test_checkpoint_read_only(self):
+    n = Histogram1D(nbins=5, xlow=0, xhigh=25, in_field='x', name='H')
+    table = np.arange(5.0)
+    table.flags.writeable = False
+    n.table = table
+    state = n.checkpoint()
+    self.assertNotIn('table', state)
+    n.resume(dict(state, table=np.zeros(5)))
+    self.assertIs(n.table, table)
+
+  def test_checkpoint(self):
+    spec = [
+      { 'class': 'Pass', 'name': 'Control', 'kwargs': { 'line': 0 } },
+      { 'class': 'gen.TimeSeries', 'name': 'Gen', 'observe': [ 'Control' ],
+        'kwargs': { 'detector': 'D1', 'sig_filetype': 'tn',
+                    'sig_filename': 'snewpdag/data/fluxparametrisation_22.5kT_0Hz_0.0msT0_1msbin.txt' } },
+      { 'class': 'Accumulator', 'name': 'Acc', 'observe': [ 'Gen' ],
+        'kwargs': { 'title': 'Trials', 'in_field': 'gen', 'clear_on': [] } },
+      ]
+    whole = SimpleTrials.trials(spec, ntrials=12, seed=7)
+    with tempfile.TemporaryDirectory() as d:
+      fn = os.path.join(d, 'ckpt')
+      # stopped after 8 trials, with checkpoints at 4 and 8
+      SimpleTrials.trials(spec, ntrials=8, seed=7, checkpoint=fn, every=4)
+      resumed = SimpleTrials.trials(spec, ntrials=12, seed=7, checkpoint=fn,
+                                    every=4)
+    a = whole['Acc'].series
+    b = resumed['Acc'].series
+    self.assertEqual(len(b), 12)
+    for x, y in zip(a, b):
+      self.assertTrue(np.array_equal(x[0]['times'], y[0]['times']))
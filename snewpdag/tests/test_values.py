@@ -1,9 +1,12 @@
 """
 Unit tests for value objects
 """
+import pickle
 import unittest
 import numpy as np
-from snewpdag.values import Hist1D, TimeSeries
+import healpy as hp
+from snewpdag.values import Hist1D, TimeSeries, MultiOrderMap
+from snewpdag.values.MultiOrderMap import pix2uniq, uniq2pix
 
 class TestHist1D(unittest.TestCase):
 
@@ -25,6 +28,59 @@ class TestHist1D(unittest.TestCase):
     self.assertEqual(h.overflow, 1.0)
     self.assertEqual(h.underflow, 1.0)
 
+  def test_hist1d_weights(self):
+    h = Hist1D(4, 0.0, 2.0, sumw2=True)
+    h.fill([ 0.1, 0.2, 0.7, 1.9, 2.0, -0.5 ],
+           weight=[ 1.0, 2.0, 0.5, 3.0, 4.0, 5.0 ])
+    self.assertTrue(np.array_equal(h.bins, [ 3.0, 0.5, 0.0, 3.0 ]))
+    self.assertTrue(np.array_equal(h.sumw2, [ 5.0, 0.25, 0.0, 9.0 ]))
+    self.assertTrue(np.allclose(h.errors(), np.sqrt([ 5.0, 0.25, 0.0, 9.0 ])))
+    self.assertEqual(h.overflow, 4.0)
+    self.assertEqual(h.underflow, 5.0)
+    self.assertEqual(h.count, 15.5)
+    self.assertAlmostEqual(h.sum, 0.1 + 0.4 + 0.35 + 5.7 + 8.0 - 2.5)
+    self.assertEqual(h.bin_index(-0.1), -1)
+    self.assertEqual(list(h.bin_index([ 0.6, 2.0 ])), [ 1, 4 ])
+    self.assertEqual(h.bin_edge(3), 1.5)
+
+  def test_hist1d_rebin(self):
+    h = Hist1D(6, 0.0, 3.0)
+    h.fill(np.repeat(np.arange(6) * 0.5 + 0.25, [ 1, 2, 3, 4, 5, 6 ]))
+    self.assertTrue(np.array_equal(h.histogram(3), [ 3, 7, 11 ]))
+    self.assertTrue(np.allclose(h.histogram(2, 0.5, 2.5), [ 5, 9 ]))
+    self.assertTrue(np.allclose(h.histogram(1, 0.25, 0.75), [ 1.5 ]))
+    self.assertEqual(h.integral(), 21)
+    self.assertEqual(h.integral(1.0, 2.0), 7)
+    self.assertAlmostEqual(h.integral(0.25, 1.25), 0.5 + 2 + 1.5)
+    self.assertTrue(np.allclose(h.integral([ 0.0, 1.0 ], [ 1.0, 3.0 ]),
+                                [ 3, 18 ]))
+
+  def test_hist1d_fill_bins(self):
+    h = Hist1D(2, 0.0, 2.0, sumw2=True)
+    h.fill_bins([ 2, 4 ], 1, 3)
+    self.assertTrue(np.array_equal(h.bins, [ 2, 4 ]))
+    self.assertTrue(np.array_equal(h.sumw2, [ 2, 4 ]))
+    self.assertEqual(h.count, 10)
+    self.assertEqual(h.sum, 2 * 0.5 + 4 * 1.5 + 3 * 2.0)
+    self.assertAlmostEqual(h.sum2, 2 * 0.25 + 4 * 2.25 + 6 / 12.0 + 12.0)
+
+  def test_hist1d_dict(self):
+    h = Hist1D(5, 1.0, 2.0, sumw2=True)
+    h.fill([ 1.1, 1.5, 1.5, 3.0 ])
+    d = h.to_dict()
+    self.assertIs(d['bins'], h.bins)
+    g = Hist1D.from_dict(d)
+    self.assertTrue(np.array_equal(g.bins, h.bins))
+    self.assertEqual(g.nbins, 5)
+    self.assertEqual(g.overflow, 1.0)
+    self.assertTrue(np.array_equal(g.sumw2, h.sumw2))
+    g.fill([ 1.1 ]) # doesn't change h
+    self.assertEqual(h.bins[0], 1.0)
+    self.assertEqual(h.sumw2[0], 1.0)
+    g = Hist1D.from_dict({ 'xlow': 0.0, 'xhigh': 1.0, 'bins': [ 1, 2 ] })
+    self.assertEqual(g.nbins, 2)
+    self.assertEqual(g.sumw2, None)
+
   def test_timeseries(self):
     s = TimeSeries() # no limits
     s.add([1000, 200, 400])
@@ -39,3 +95,118 @@ class TestHist1D(unittest.TestCase):
     self.assertEqual(s.times[2], 400)
     self.assertEqual(s.times[3], 1000)
 
+
+  def test_timeseries_ordered(self):
+    rng = np.random.default_rng(4)
+    chunks = [ rng.uniform(0.0, 10.0, 1000), rng.uniform(5.0, 20.0, 500),
+               np.array([ 3.0, 3.0, 25.0 ]), rng.uniform(0.0, 30.0, 3000) ]
+    s = TimeSeries(start=1.0, stop=28.0)
+    u = TimeSeries(start=1.0, stop=28.0, ordered=False)
+    for c in chunks:
+      s.add(c)
+      u.add(c)
+    a = np.concatenate(chunks)
+    a = np.sort(a[(a >= 1.0) & (a < 28.0)])
+    self.assertTrue(np.array_equal(s.times, a))
+    self.assertTrue(np.array_equal(np.sort(u.times), a))
+    self.assertEqual(s.min(), a[0])
+    self.assertEqual(s.max(), a[-1])
+    self.assertEqual(u.min(), a[0])
+    for n in [ s, u ]:
+      self.assertEqual(n.integral(), len(a))
+      self.assertEqual(n.integral(2.5, 7.0), np.sum((a >= 2.5) & (a < 7.0)))
+      self.assertEqual(n.integral(3.0), np.sum((a >= 3.0) & (a < 28.0)))
+      for limits in [ (2.0, 9.5), (None, None), (3.0, None), (None, 12.0) ]:
+        h, e = n.histogram(17, *limits)
+        t0 = 1.0 if limits[0] == None else limits[0]
+        t1 = 28.0 if limits[1] == None else limits[1]
+        hr, er = np.histogram(a, bins=17, range=(t0, t1))
+        self.assertTrue(np.array_equal(h, hr))
+        self.assertTrue(np.allclose(e, er))
+    with self.assertRaises(ValueError):
+      s.times[0] = 0.0
+    self.assertEqual(TimeSeries().min(), None)
+
+  def test_timeseries_pickle(self):
+    s = TimeSeries()
+    s.add(np.arange(100.0))
+    t = pickle.loads(pickle.dumps(s))
+    self.assertTrue(np.array_equal(s.times, t.times))
+    t.add([ 50.5 ])
+    self.assertEqual(t.times[51], 50.5)
+    self.assertEqual(len(s.times), 100)
+
+  def test_timeseries_cache(self):
+    s = TimeSeries(ordered=False)
+    s.add(np.random.default_rng(5).uniform(0.0, 10.0, 1000))
+    h1, e1 = s.histogram(20, 2.0, 4.0)
+    h2, e2 = s.histogram(20, 2.0, 4.0)
+    self.assertIs(h1, h2)
+    self.assertTrue(np.array_equal(h1,
+                    np.histogram(s.times, bins=20, range=(2.0, 4.0))[0]))
+    with self.assertRaises(ValueError):
+      h1[0] = 0
+    s.add([ 3.01 ])
+    h3, e3 = s.histogram(20, 2.0, 4.0)
+    self.assertEqual(np.sum(h3), np.sum(h1) + 1)
+    s.hist_cache_size = 4
+    for i in range(10):
+      s.histogram(20, 0.1 * i, 0.1 * i + 2.0)
+    self.assertEqual(len(s._hcache), 4)
+
+class TestMultiOrderMap(unittest.TestCase):
+
+  def test_uniq(self):
+    nside = np.array([ 1, 1, 2, 1024 ])
+    ipix = np.array([ 0, 11, 5, 12 * 1024**2 - 1 ])
+    uniq = pix2uniq(nside, ipix)
+    self.assertEqual(list(uniq[:3]), [ 4, 15, 21 ])
+    ns, ip = uniq2pix(uniq)
+    self.assertTrue(np.array_equal(ns, nside))
+    self.assertTrue(np.array_equal(ip, ipix))
+
+  def test_dense(self):
+    m = np.repeat(np.arange(12.0), 16) # nside 4, constant in base pixels
+    m[:16] = np.arange(16.0)
+    mo = MultiOrderMap.from_dense(m)
+    self.assertEqual(len(mo), 16 + 11)
+    self.assertEqual(mo.max_nside(), 4)
+    self.assertTrue(mo.covers_sky())
+    self.assertAlmostEqual(mo.area(), 4.0 * np.pi)
+    self.assertTrue(np.array_equal(mo.to_dense(), m))
+    self.assertTrue(np.array_equal(mo.to_dense(8),
+                    hp.ud_grade(m, 8, order_in='NESTED', order_out='NESTED')))
+    self.assertEqual(len(MultiOrderMap.from_dense(m, compress=False)), 192)
+    d = mo.to_dict()
+    self.assertTrue(np.array_equal(MultiOrderMap.from_dict(d).values,
+                                   mo.values))
+
+  def test_combine(self):
+    rng = np.random.default_rng(3)
+    a = rng.uniform(size=hp.nside2npix(2))
+    b = np.repeat(rng.uniform(size=12), 16)
+    b[32:48] = rng.uniform(size=16)
+    for method in [ 'sum', 'product' ]:
+      mo = MultiOrderMap.from_dense(a)
+      mo.combine(MultiOrderMap.from_dense(b), method)
+      self.assertTrue(mo.covers_sky())
+      self.assertEqual(len(mo), 48 - 4 + 16)
+      aa = hp.ud_grade(a, 4, order_in='NESTED', order_out='NESTED')
+      ref = aa + b if method == 'sum' else aa * b
+      self.assertTrue(np.allclose(mo.to_dense(), ref))
+    mo.combine(rng.uniform(size=hp.nside2npix(8))) # dense
+    self.assertEqual(mo.max_nside(), 8)
+    self.assertEqual(len(mo), hp.nside2npix(8))
+
+  def test_credible_region(self):
+    m = np.zeros(hp.nside2npix(4))
+    m[:4] = [ 4.0, 3.0, 2.0, 1.0 ]
+    m[4:8] = 0.5
+    mo = MultiOrderMap.from_dense(m).normalize()
+    self.assertAlmostEqual(np.sum(mo.values * mo.pixel_areas()), 1.0)
+    r = mo.credible_region(0.55) # 4 + 3 out of 12
+    self.assertEqual(len(r), 2)
+    self.assertAlmostEqual(r.area(), 2.0 * 4.0 * np.pi / len(m))
+    self.assertFalse(r.covers_sky())
+    d = r.to_dense(fill=0.0)
+    self.assertTrue(np.array_equal(d > 0.0, m >= 3.0))
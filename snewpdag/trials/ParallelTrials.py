@@ -0,0 +1,100 @@
+"""
+ParallelTrials - run MC trials in a pool of processes
+
+Same as SimpleTrials, but the trials are split into contiguous shards,
+one per worker process.  Each worker configures its own DAG from the spec,
+with its own random number generator spawned from a common
+np.random.SeedSequence, and runs its shard of alert/reset pairs.
+The accumulated state of every node (see Node.snapshot()) is then sent
+back and merged, in worker order, into a fresh DAG in the parent process,
+which is sent the final report.
+
+So for a given seed and number of workers, results are reproducible
+bit for bit.  (They differ from SimpleTrials, or from a different number
+of workers, since each worker has its own random number stream.)
+
+Only state which nodes expose through snapshot()/merge() is combined,
+e.g., Accumulator, Histogram1D, BinnedAccumulator, HistogramSkymap
+and ops.FillHist1D.  Anything else a node keeps over trials
+(such as counters) only reflects the parent's DAG.
+
+  from snewpdag.trials.ParallelTrials import trials
+  trials(spec, ntrials=1000000, seed=42, workers=64)
+
+Since worker processes import the DAG modules again, call trials()
+from within an `if __name__ == '__main__':` block in scripts.
+"""
+import os
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from snewpdag.dag import Node, Checkpoint
+from snewpdag.dag.app import configure, inject
+from snewpdag.dag.lib import snapshot_dag, merge_dag
+from .SimpleTrials import batchable, run
+
+def shard(spec, first, last, seed, compiled=False, batch=None,
+          checkpoint=None, every=1000):
+  """
+  Run trials first, ..., last-1 in a DAG of its own.
+  seed is anything np.random.default_rng() accepts (e.g., a SeedSequence).
+  If checkpoint is given, save the state of the DAG to this file
+  every so many trials, and resume from it if it already exists.
+  Returns the snapshots of the nodes { name: snapshot }, or None on error.
+  """
+  Node.rng = np.random.default_rng(seed)
+  nodes = configure(spec, compiled)
+  if nodes == None:
+    logging.error('Invalid configuration specified')
+    return None
+  if batch != None and batch > 1 and not batchable(nodes):
+    batch = None
+  dags = { 0: nodes }
+  start = first
+  if checkpoint != None and os.path.exists(checkpoint):
+    c = Checkpoint.load(checkpoint)
+    if c != None:
+      start = Checkpoint.restore(c, dags, None)
+  run(dags, spec, start, last, batch, checkpoint, every)
+  return snapshot_dag(nodes)
+
+def trials(spec, ntrials=1000, seed=None, workers=None, compiled=False,
+           batch=None, checkpoint=None, every=1000):
+  """
+  Configure nodes using spec (a list of dictionaries),
+  and run ntrials alert/reset pairs over a pool of workers
+  (by default, one per CPU).  Then merge the results and run a report.
+  If checkpoint is given, worker k checkpoints to checkpoint.k
+  (see dag/Checkpoint.py), so rerunning with the same seed and
+  number of workers resumes where the workers stopped.
+  Returns the DAG which received the report.
+  """
+  if workers == None:
+    workers = os.cpu_count()
+  workers = max(1, min(workers, ntrials))
+
+  ss = np.random.SeedSequence(seed)
+  seeds = ss.spawn(workers)
+  bounds = [ ntrials * k // workers for k in range(workers + 1) ]
+
+  with ProcessPoolExecutor(max_workers=workers) as pool:
+    futures = [ pool.submit(shard, spec, bounds[k], bounds[k+1], seeds[k],
+                            compiled, batch,
+                            None if checkpoint == None \
+                              else '{}.{}'.format(checkpoint, k),
+                            every) for k in range(workers) ]
+    parts = [ f.result() for f in futures ]
+  if any(p == None for p in parts):
+    logging.error('Trials failed in worker process')
+    return None
+
+  Node.rng = np.random.default_rng(ss)
+  nodes = configure(spec, compiled)
+  if nodes == None:
+    logging.error('Invalid configuration specified')
+    return None
+  for part in parts:
+    merge_dag(nodes, part)
+  data = [ { 'action': 'report', 'burst_id': 0, 'name': 'Control' } ]
+  inject({ 0: nodes }, data, spec)
+  return nodes
@@ -0,0 +1,74 @@
+"""
+Reduce - combine MC trials run as separate jobs
+
+Each job runs a shard of trials and saves the accumulated state of its DAG,
+e.g.,
+
+  from snewpdag.trials.SimpleTrials import trials
+  trials(spec, ntrials=10000, first=20000, seed=3, snapshot='shard3.pkl')
+
+(use a different seed for each shard!)  Afterwards, the shards are
+combined into one DAG, which is then sent the report:
+
+  from snewpdag.trials.Reduce import reduce
+  reduce(spec, [ 'shard0.pkl', 'shard1.pkl', ... ])
+
+Snapshot files can also be combined into one without a DAG, with
+combine(filenames, outfile), since the combination is associative.
+"""
+import logging
+import pickle
+from functools import reduce as fold
+from snewpdag.dag.app import configure, inject
+from snewpdag.dag.lib import combine_snapshots, merge_dag
+
+snapshot_version = 1
+
+def save(snaps, filename):
+  """
+  Write DAG snapshots { name: snapshot } to file.
+  """
+  with open(filename, 'wb') as f:
+    pickle.dump({ 'version': snapshot_version, 'snapshots': snaps }, f)
+
+def load(filename):
+  """
+  Read DAG snapshots from file.  Returns None if unreadable.
+  """
+  with open(filename, 'rb') as f:
+    d = pickle.load(f)
+  if not isinstance(d, dict) or d.get('version') != snapshot_version:
+    logging.error('{}: unrecognized snapshot file'.format(filename))
+    return None
+  return d['snapshots']
+
+def combine(filenames, outfile=None):
+  """
+  Combine snapshot files.  Write to outfile if given.
+  Returns the combined snapshots, or None if a file is unreadable.
+  """
+  snaps = [ load(fn) for fn in filenames ]
+  if any(s == None for s in snaps):
+    return None
+  s = fold(combine_snapshots, snaps)
+  if outfile != None:
+    save(s, outfile)
+  return s
+
+def reduce(spec, filenames, compiled=False):
+  """
+  Configure nodes using spec, merge the snapshot files into them,
+  and run a report.  Returns the DAG.
+  """
+  nodes = configure(spec, compiled)
+  if nodes == None:
+    logging.error('Invalid configuration specified')
+    return None
+  for fn in filenames:
+    s = load(fn)
+    if s == None:
+      return None
+    merge_dag(nodes, s)
+  data = [ { 'action': 'report', 'burst_id': 0, 'name': 'Control' } ]
+  inject({ 0: nodes }, data, spec)
+  return nodes
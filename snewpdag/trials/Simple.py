@@ -12,6 +12,10 @@ Note that trial_id keeps track of which trial is being run.
 burst_id is always 0.  The reason for this is that a new burst_id
 would trigger inject() to create a new DAG from scratch.
 So we keep burst_id the same, but count using trial_id.
+
+With --batch m, each alert/reset carries m trials (see dag/lib.py),
+with trial_id a list.  The DAG must be able to handle batched payloads
+(see SimpleTrials.batchable()).
 """
 import sys, argparse, json
 
@@ -19,10 +23,19 @@ def run():
   parser = argparse.ArgumentParser()
   parser.add_argument('name', help='injection name')
   parser.add_argument('-n', '--number', default=1000, help='number of trials')
+  parser.add_argument('-b', '--batch', default=0, help='number of trials per payload')
   args = parser.parse_args()
 
   i = 0
   imax = int(args.number)
+  m = int(args.batch)
+  while m > 0 and i < imax:
+    ids = list(range(i, min(i + m, imax)))
+    for action in [ 'alert', 'reset' ]:
+      print(json.dumps(
+        { 'action': action, 'burst_id': 0, 'trial_id': ids, 'name': args.name,
+          'batch': len(ids), 'batch_fields': [ 'trial_id' ] }))
+    i += len(ids)
   while i < imax:
     print(json.dumps(
       { 'action': 'alert', 'burst_id': 0, 'trial_id': i, 'name': args.name }))
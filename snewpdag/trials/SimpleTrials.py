@@ -26,36 +26,119 @@ Note that trial_id keeps track of which trial is being run.
 burst_id is always 0.  The reason for this is that a new burst_id
 would trigger inject() to create a new DAG from scratch.
 So we keep burst_id the same, but count using trial_id.
+
+With batch=m, each alert/reset payload carries m trials at once
+(see dag/lib.py), with trial_id a list.  Nodes which declare batch
+support process all the trials in one call, and other nodes are run
+once per trial.  Since the other nodes then see all the alerts of a
+batch before the resets, they must only have a single input,
+and must not depend on being reset between trials, i.e., they either
+keep Node's reset() or declare stateless_reset.
+If the DAG has other nodes which don't handle batches,
+the trials are run one at a time.  Random numbers are drawn in a
+different order, so batched results are statistically equivalent
+to unbatched ones, but not identical.
 """
+import os
 import sys
+import logging
 import numpy as np
-from snewpdag.dag import Node
+from snewpdag.dag import Node, Checkpoint
 from snewpdag.dag.app import configure, inject
+from snewpdag.dag.lib import snapshot_dag
+from .Reduce import save
+
+def batchable(nodes):
+  """
+  True if batched payloads can be sent through the DAG.
+  """
+  for node in nodes.values():
+    if type(node).batch:
+      continue
+    if len(node.watch_list) > 1 or type(node).update is not Node.update:
+      logging.info('{} cannot handle batched payloads'.format(node.name))
+      return False
+    # state kept until reset would leak from one trial into the next
+    if type(node).reset is not Node.reset and not type(node).stateless_reset:
+      logging.info('{} needs a reset between trials'.format(node.name))
+      return False
+  return True
 
-def trials(spec, ntrials=1000, seed=None):
+def trials(spec, ntrials=1000, seed=None, compiled=False, batch=None,
+           first=0, snapshot=None, checkpoint=None, every=1000):
   """
   Configure nodes using spec (a list of dictionaries).
   Then run alert/reset pairs for as many times as given in ntrials,
   followed by a report action.
+  If compiled, run the trials through a compiled execution plan.
+  If batch is given, send batch trials per alert/reset payload.
+  first is the trial_id of the first trial.
+  If snapshot is given, write the accumulated state to this file
+  (see Reduce.py) instead of running the report.
+  If checkpoint is given, save the state of the DAG to this file
+  every so many trials, and resume from it if it already exists
+  (see dag/Checkpoint.py).
+  Returns the DAG.
   """
   if seed == None:
     Node.rng = np.random.default_rng()
   else:
     Node.rng = np.random.default_rng(seed)
 
-  nodes = configure(spec)
+  nodes = configure(spec, compiled)
   if nodes == None:
     logging.error('Invalid configuration specified')
     return
+  dags = { 0: nodes }
+
+  if batch != None and batch > 1 and not batchable(nodes):
+    logging.warning('DAG cannot handle batches, running trials one at a time')
+    batch = None
+
+  start = first
+  if checkpoint != None and os.path.exists(checkpoint):
+    c = Checkpoint.load(checkpoint)
+    if c != None:
+      start = Checkpoint.restore(c, dags, None)
+      logging.info('Resuming trials at {}'.format(start))
 
-  i = 0
-  while i < ntrials:
+  run(dags, spec, start, first + ntrials, batch, checkpoint, every)
+  if snapshot != None:
+    save(snapshot_dag(nodes), snapshot)
+    return nodes
+  data = [ { 'action': 'report', 'burst_id': 0, 'name': 'Control' } ]
+  inject(dags, data, spec)
+  return nodes
+
+def run(dags, spec, first, last, batch=None, checkpoint=None, every=1000):
+  """
+  Run alert/reset pairs for trials first, ..., last-1 through dags[0]
+  (without the final report), batch trials at a time if batch is given.
+  If checkpoint is given, save a checkpoint to this file after
+  (at least) every so many trials.
+  """
+  i = first
+  saved = first
+  while batch != None and batch > 1 and i < last:
+    ids = np.arange(i, min(i + batch, last))
+    data = [ { 'action': 'alert', 'burst_id': 0, 'trial_id': ids,
+               'name': 'Control', 'batch': len(ids),
+               'batch_fields': ('trial_id',) },
+             { 'action': 'reset', 'burst_id': 0, 'trial_id': ids,
+               'name': 'Control', 'batch': len(ids),
+               'batch_fields': ('trial_id',) } ]
+    inject(dags, data, spec)
+    i += len(ids)
+    if checkpoint != None and i - saved >= every:
+      Checkpoint.save(checkpoint, dags, i)
+      saved = i
+  while i < last:
     data = [ { 'action': 'alert', 'burst_id': 0, 'trial_id': i,
                'name': 'Control' },
              { 'action': 'reset', 'burst_id': 0, 'trial_id': i,
                'name': 'Control' } ]
-    inject(nodes, data, spec)
+    inject(dags, data, spec)
     i += 1
-  data = [ { 'action': 'report', 'burst_id': 0, 'name': 'Control' } ]
-  inject(nodes, data, spec)
-
+    if checkpoint != None and i - saved >= every:
+      Checkpoint.save(checkpoint, dags, i)
+      saved = i
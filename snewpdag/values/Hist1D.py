@@ -1,19 +1,32 @@
 """
 Hist1D - a 1D histogram value with evenly-spaced bins
+
+Bin contents are sums of weights (1 per entry unless weights are given).
+If constructed with sumw2=True, the sums of squared weights are kept
+as well, so that errors() gives the statistical error of each bin.
+
+count, sum and sum2 are the sums of weights, weight*x and weight*x^2
+of all entries, including under- and overflows.
 """
+import sys
 import logging
 import numpy as np
 
 class Hist1D:
-  def __init__(self, nbins, xlow, xhigh):
+  track_sumw2 = False
+  sumw2 = None # sums of squared weights, if tracked
+
+  def __init__(self, nbins, xlow, xhigh, sumw2=False):
     self.nbins = nbins
     self.xlow = xlow
     self.xhigh = xhigh
     self.xwidth = xhigh - xlow
+    self.track_sumw2 = sumw2
     self.clear()
 
   def clear(self):
     self.bins = np.zeros(self.nbins)
+    self.sumw2 = np.zeros(self.nbins) if self.track_sumw2 else None
     self.overflow = 0.0
     self.underflow = 0.0
     self.sum = 0.0
@@ -21,8 +34,10 @@ class Hist1D:
     self.count = 0
 
   def copy(self):
-    h = Hist1D(self.nbins, self.xlow, self.xhigh)
+    h = Hist1D(self.nbins, self.xlow, self.xhigh, self.track_sumw2)
     h.bins = self.bins.copy()
+    if self.sumw2 is not None:
+      h.sumw2 = self.sumw2.copy()
     h.overflow = self.overflow
     h.underflow = self.underflow
     h.sum = self.sum
@@ -30,6 +45,62 @@ class Hist1D:
     h.count = self.count
     return h
 
+  def snapshot(self):
+    """
+    Return the contents as a dictionary which can be combined with
+    snapshots of compatible histograms (see dag/lib.py combine_snapshots()).
+    """
+    s = {
+          'shape': (self.nbins, self.xlow, self.xhigh),
+          'bins': self.bins.copy(),
+          'underflow': self.underflow,
+          'overflow': self.overflow,
+          'sum': self.sum,
+          'sum2': self.sum2,
+          'count': self.count,
+        }
+    if self.sumw2 is not None:
+      s['sumw2'] = self.sumw2.copy()
+    return s
+
+  def restore(self, snapshot):
+    """
+    Set the contents from a snapshot.
+    """
+    if snapshot['shape'] != (self.nbins, self.xlow, self.xhigh):
+      logging.error('Hist1D.restore: incompatible histogram {}'.format(
+                    snapshot['shape']))
+      return
+    self.bins = snapshot['bins'].copy()
+    self.track_sumw2 = 'sumw2' in snapshot
+    self.sumw2 = snapshot['sumw2'].copy() if self.track_sumw2 else None
+    self.underflow = snapshot['underflow']
+    self.overflow = snapshot['overflow']
+    self.sum = snapshot['sum']
+    self.sum2 = snapshot['sum2']
+    self.count = snapshot['count']
+
+  def merge(self, other):
+    """
+    Add the contents of other (a compatible Hist1D, or a snapshot of one).
+    """
+    s = other.snapshot() if isinstance(other, Hist1D) else other
+    if s['shape'] != (self.nbins, self.xlow, self.xhigh):
+      logging.error('Hist1D.merge: incompatible histogram {}'.format(
+                    s['shape']))
+      return
+    if ('sumw2' in s) != (self.sumw2 is not None):
+      logging.error('Hist1D.merge: only one histogram has sumw2')
+      return
+    self.bins = self.bins + s['bins']
+    if self.sumw2 is not None:
+      self.sumw2 = self.sumw2 + s['sumw2']
+    self.underflow += s['underflow']
+    self.overflow += s['overflow']
+    self.sum += s['sum']
+    self.sum2 += s['sum2']
+    self.count += s['count']
+
   def is_compatible(self, other):
     if isinstance(other, Hist1D):
       return self.nbins == other.nbins and \
@@ -39,7 +110,12 @@ class Hist1D:
       return False
 
   def to_dict(self):
+    """
+    Return the contents as a dictionary, e.g., for JSON output.
+    Arrays are not copied, so the dictionary shouldn't be modified.
+    """
     d = {
+          'nbins': self.nbins,
           'xlow': self.xlow,
           'xhigh': self.xhigh,
           'count': self.count,
@@ -47,18 +123,41 @@ class Hist1D:
           'sum2': self.sum2,
           'underflow': self.underflow,
           'overflow': self.overflow,
-          'bins': self.bins.copy()
+          'bins': self.bins,
         }
+    if self.sumw2 is not None:
+      d['sumw2'] = self.sumw2
+    return d
+
+  @classmethod
+  def from_dict(cls, d):
+    """
+    Make a Hist1D from a dictionary made by to_dict().
+    Arrays are copied, so the histogram doesn't share them with d.
+    """
+    bins = np.array(d['bins'], dtype=np.float64)
+    nbins = d.get('nbins', len(bins))
+    h = cls(nbins, d['xlow'], d['xhigh'], 'sumw2' in d)
+    h.bins = bins
+    if 'sumw2' in d:
+      h.sumw2 = np.array(d['sumw2'], dtype=np.float64)
+    h.count = d.get('count', 0)
+    h.sum = d.get('sum', 0.0)
+    h.sum2 = d.get('sum2', 0.0)
+    h.underflow = d.get('underflow', 0.0)
+    h.overflow = d.get('overflow', 0.0)
+    return h
 
   def bin_index(self, x):
     """
-    Return bin index for a given x.
+    Return bin index (or array of indices) for a given x.
     Doesn't really worry about range, so
-    underflow is anything engative,
+    underflow is anything negative,
     and overflow is a number >= nbins
     """
     try:
-      return np.int(self.nbins * (x - self.xlow) / self.xwidth)
+      ix = np.floor(self.nbins * (np.asarray(x) - self.xlow) / self.xwidth)
+      return ix.astype(int) if np.ndim(ix) > 0 else int(ix)
     except:
       logging.info('Hist1D.bin: index calc error {}'.format(sys.exc_info()))
       return None
@@ -67,26 +166,59 @@ class Hist1D:
     """
     Return low edge of bin
     """
-    dx = self.width / len(self.bins)
-    return self.xlow + index * dx
+    dx = self.xwidth / self.nbins
+    return self.xlow + np.asarray(index) * dx
+
+  def edges(self):
+    """
+    Return all nbins+1 bin edges
+    """
+    return np.linspace(self.xlow, self.xhigh, self.nbins + 1)
 
   def fill(self, x, weight=1.0):
     """
     fill histogram.  x can be a scalar or an array of fill values.
+    weight can be a scalar or an array of the same shape as x.
     """
-    v = np.array(x)
     try:
-      ix = self.nbins * (v - self.xlow) / self.xwidth
+      v = np.asarray(x, dtype=np.float64).ravel()
+      w = np.broadcast_to(np.asarray(weight, dtype=np.float64),
+                          np.shape(x)).ravel()
+      ix = np.floor(self.nbins * (v - self.xlow) / self.xwidth)
     except:
       logging.info('Hist1D: index calculation error {}'.format(sys.exc_info()))
       return
-    h, bin_edges = np.histogram(ix, bins=self.nbins, range=(0, self.nbins))
-    self.bins += h
-    self.underflow += weight * np.sum(ix < 0)
-    self.overflow += weight * np.sum(ix >= self.nbins)
-    self.sum += np.sum(v)
-    self.sum2 += np.sum(v*v)
-    self.count += weight * v.size
+    under = ix < 0
+    over = ix >= self.nbins
+    m = ~(under | over) & ~np.isnan(ix)
+    ib = ix[m].astype(int)
+    self.bins += np.bincount(ib, weights=w[m], minlength=self.nbins)
+    if self.sumw2 is not None:
+      self.sumw2 += np.bincount(ib, weights=w[m]**2, minlength=self.nbins)
+    self.underflow += np.sum(w[under])
+    self.overflow += np.sum(w[over])
+    self.sum += np.sum(w * v)
+    self.sum2 += np.sum(w * v * v)
+    self.count += np.sum(w)
+
+  def fill_bins(self, counts, underflow=0, overflow=0):
+    """
+    Add counts to the bins directly, e.g., from binned generation.
+    Entries are taken as spread uniformly over their bins for sum and sum2,
+    and under- and overflows as being at xlow and xhigh.
+    """
+    n = np.asarray(counts, dtype=np.float64)
+    self.bins += n
+    if self.sumw2 is not None:
+      self.sumw2 += n
+    self.underflow += underflow
+    self.overflow += overflow
+    w = self.xwidth / self.nbins
+    c = self.bin_edge(np.arange(self.nbins)) + 0.5 * w # bin centres
+    self.sum += np.sum(n * c) + underflow * self.xlow + overflow * self.xhigh
+    self.sum2 += np.sum(n * (c * c + w * w / 12.0)) + \
+                 underflow * self.xlow**2 + overflow * self.xhigh**2
+    self.count += np.sum(n) + underflow + overflow
 
   def add(self, x, weight=1.0):
     """
@@ -94,6 +226,13 @@ class Hist1D:
     """
     self.fill(x, weight)
 
+  def errors(self):
+    """
+    Statistical error of each bin:  sqrt(sumw2) if kept,
+    otherwise sqrt(bins), i.e., assuming unit weights.
+    """
+    return np.sqrt(self.bins if self.sumw2 is None else self.sumw2)
+
   def mean(self):
     return 0.0 if self.count == 0 else self.sum / self.count
 
@@ -105,31 +244,38 @@ class Hist1D:
       xx = self.sum2 / self.count
       return xx - x*x
 
+  def cumulative(self, x, contents=None):
+    """
+    Contents between xlow and x (scalar or array), assuming each bin
+    is uniformly populated, i.e., interpolating linearly within bins.
+    contents defaults to the bins, but could also be, e.g., sumw2.
+    """
+    c = self.bins if contents is None else contents
+    cs = np.concatenate(([ 0.0 ], np.cumsum(c)))
+    return np.interp(x, self.edges(), cs)
+
   def histogram(self, nbins, xlow=None, xhigh=None):
     """
-    Rebin histogram.
+    Rebin histogram into nbins between xlow and xhigh
+    (by default, the range of this histogram).
+    New bins which straddle old bin edges get contents in proportion
+    to their overlap with each old bin, so rebinning to bin edges
+    which line up with the old ones is exact.
+    Under- and overflows are not included.
     """
-    x0 = self.xlow if xlow == None else xlow
-    x1 = self.xhigh if xhigh == None else xhigh
-    js = self.bin_edge(np.linspace(x0, x1, num=nbins, endpoint=False))
-    m = (js >= 0) & (js < self.nbins)
-    ks = js[m]
-    h = np.zeros(nbins)
-    for i in range(len(ks)):
-      h[ks[i]] += self.bins[i]
-    return h
+    x0 = self.xlow if xlow is None else xlow
+    x1 = self.xhigh if xhigh is None else xhigh
+    return np.diff(self.cumulative(np.linspace(x0, x1, nbins + 1)))
 
   def integral(self, xlow=None, xhigh=None):
     """
-    Count events in bins between xlow and xhigh (if given).
-    Gives best approximation based on closest bin edges.
+    Contents of bins between xlow and xhigh (if given; may be arrays).
+    Bins which are only partly inside contribute in proportion
+    to the overlap, so integrals between bin edges are exact.
+    Under- and overflows are not included.
     """
-    x0 = self.xlow if xlow == None else xlow
-    x1 = self.xhigh if xhigh == None else xhigh
-    if x0 == self.xlow and x1 == self.xhigh:
+    if xlow is None and xhigh is None:
       return np.sum(self.bins)
-    else:
-      i0 = np.round((x0 - self.xlow) * self.nbins / self.xwidth)
-      i1 = np.round((x1 - self.xhigh) * self.nbins / self.xwidth)
-      return np.sum(self.bins[i0:i1])
-
+    x0 = self.xlow if xlow is None else xlow
+    x1 = self.xhigh if xhigh is None else xhigh
+    return self.cumulative(x1) - self.cumulative(x0)
@@ -0,0 +1,253 @@
+"""
+MultiOrderMap - a sparse skymap with pixels of different resolutions
+
+Pixels are given by NUNIQ indices, uniq = 4 nside^2 + ipix, with ipix in
+nested order (as in the IVOA MOC standard and multi-order FITS skymaps),
+so only the parts of the sky which need it are kept at high resolution.
+self.uniq is sorted, and self.values has one value per pixel.
+
+Values are taken to be intensive (chi2, CL, probability density per
+steradian):  a pixel split into its children gives each of them its value,
+as hp.ud_grade() does when upgrading a nested map.
+
+A map usually covers the sky exactly once, but need not,
+e.g., a credible region.
+"""
+import logging
+import numpy as np
+import healpy as hp
+
+
+def uniq2pix(uniq):
+  """
+  (nside, ipix) of NUNIQ indices.
+  """
+  uniq = np.asarray(uniq, dtype=np.int64)
+  order = np.floor(np.log2(uniq)).astype(np.int64) // 2 - 1
+  nside = np.left_shift(1, order)
+  return nside, uniq - 4 * nside * nside
+
+
+def pix2uniq(nside, ipix):
+  """
+  NUNIQ indices of nested pixels ipix at nside (scalar or array).
+  """
+  return 4 * np.asarray(nside, dtype=np.int64)**2 + \
+         np.asarray(ipix, dtype=np.int64)
+
+
+class MultiOrderMap:
+  def __init__(self, uniq, values):
+    u = np.asarray(uniq, dtype=np.int64).ravel()
+    v = np.asarray(values, dtype=np.float64).ravel()
+    if len(u) != len(v):
+      logging.error('MultiOrderMap: {} pixels but {} values'.format(
+                    len(u), len(v)))
+      n = min(len(u), len(v))
+      u = u[:n]
+      v = v[:n]
+    if np.any(u[1:] <= u[:-1]):
+      i = np.argsort(u, kind='stable')
+      u = u[i]
+      v = v[i]
+    self.uniq = u
+    self.values = v
+
+  @classmethod
+  def from_dense(cls, m, compress=True):
+    """
+    Make a MultiOrderMap from a nested healpix map.
+    With compress, groups of 4 sibling pixels with equal values
+    are merged (see compress()).
+    """
+    m = np.asarray(m, dtype=np.float64)
+    nside = hp.npix2nside(len(m))
+    mo = cls(pix2uniq(nside, np.arange(len(m))), m)
+    return mo.compress() if compress else mo
+
+  def __len__(self):
+    return len(self.uniq)
+
+  def copy(self):
+    return MultiOrderMap(self.uniq.copy(), self.values.copy())
+
+  def to_dict(self):
+    """
+    Return the contents as a dictionary.  Arrays are not copied.
+    """
+    return { 'uniq': self.uniq, 'values': self.values }
+
+  @classmethod
+  def from_dict(cls, d):
+    return cls(d['uniq'], d['values'])
+
+  def nsides(self):
+    return uniq2pix(self.uniq)[0]
+
+  def max_nside(self):
+    return int(np.max(self.nsides())) if len(self.uniq) > 0 else 1
+
+  def pixel_areas(self):
+    """
+    Solid angle of each pixel (sr).
+    """
+    ns = self.nsides()
+    return np.pi / (3.0 * ns * ns)
+
+  def area(self):
+    """
+    Total solid angle of the map (sr).
+    """
+    return np.sum(self.pixel_areas())
+
+  def ranges(self, nside):
+    """
+    Ranges of nested pixels at nside (at least max_nside()) covered by
+    each pixel:  returns (start, length, index), sorted by start,
+    where index gives the pixel of each range.
+    """
+    ns, ipix = uniq2pix(self.uniq)
+    n = (np.int64(nside) // ns)**2
+    start = ipix * n
+    i = np.argsort(start, kind='stable')
+    return start[i], n[i], i
+
+  def covers_sky(self):
+    """
+    True if the pixels cover the sky exactly once.
+    """
+    nside = self.max_nside()
+    start, n, i = self.ranges(nside)
+    return self.contiguous(start, n, nside)
+
+  @staticmethod
+  def contiguous(start, n, nside):
+    """
+    True if ranges from ranges() cover all pixels at nside exactly once.
+    """
+    return len(start) > 0 and start[0] == 0 and \
+           np.array_equal(start[1:], (start + n)[:-1]) and \
+           start[-1] + n[-1] == hp.nside2npix(nside)
+
+  def to_dense(self, nside=None, fill=np.nan):
+    """
+    Nested healpix map at nside (default max_nside()).
+    Sky not covered by the map is set to fill.
+    """
+    if nside == None:
+      nside = self.max_nside()
+    if nside < self.max_nside():
+      logging.error('MultiOrderMap.to_dense: nside {} < {}'.format(
+                    nside, self.max_nside()))
+      return None
+    start, n, i = self.ranges(nside)
+    v = np.repeat(self.values[i], n)
+    if self.contiguous(start, n, nside):
+      return v
+    # offset of each pixel within its range
+    k = np.arange(len(v)) - np.repeat(np.cumsum(n) - n, n)
+    m = np.full(hp.nside2npix(nside), fill, dtype=np.float64)
+    m[np.repeat(start, n) + k] = v
+    return m
+
+  def compress(self):
+    """
+    Merge groups of 4 sibling pixels with equal values into their parent,
+    repeatedly.  Returns self.
+    """
+    ns, ipix = uniq2pix(self.uniq)
+    nside = self.max_nside()
+    sel = ns == nside
+    ip = ipix[sel]
+    v = self.values[sel]
+    us = []
+    vs = []
+    while nside > 1:
+      # complete groups of siblings (ip is sorted and unique)
+      k = np.flatnonzero(ip % 4 == 0)
+      k = k[k + 3 < len(ip)]
+      k = k[ip[k + 3] == ip[k] + 3]
+      k = k[(v[k] == v[k + 1]) & (v[k] == v[k + 2]) & (v[k] == v[k + 3])]
+      merged = np.zeros(len(ip), dtype=bool)
+      for j in range(4):
+        merged[k + j] = True
+      us.append(pix2uniq(nside, ip[~merged]))
+      vs.append(v[~merged])
+      nside //= 2
+      sel = ns == nside
+      ip = np.concatenate((ipix[sel], ip[k] // 4))
+      v = np.concatenate((self.values[sel], v[k]))
+      i = np.argsort(ip, kind='stable')
+      ip = ip[i]
+      v = v[i]
+    us.append(pix2uniq(nside, ip))
+    vs.append(v)
+    u = np.concatenate(us)
+    i = np.argsort(u)
+    self.uniq = u[i]
+    self.values = np.concatenate(vs)[i]
+    return self
+
+  def combine(self, other, method='product'):
+    """
+    Combine with another map (MultiOrderMap or nested healpix map)
+    pixel by pixel:  'sum' (e.g., chi2) or 'product' (e.g., CL).
+    Both maps have to cover the sky.  The result has the finer pixels
+    of the two everywhere.
+    """
+    if not isinstance(other, MultiOrderMap):
+      other = MultiOrderMap.from_dense(other)
+    nside = max(self.max_nside(), other.max_nside())
+    sa, na, ia = self.ranges(nside)
+    sb, nb, ib = other.ranges(nside)
+    if not (self.contiguous(sa, na, nside) and
+            other.contiguous(sb, nb, nside)):
+      logging.error('MultiOrderMap.combine: maps must cover the sky')
+      return
+    # nested pixels either contain one another or don't overlap,
+    # so the ranges between consecutive starts are the smaller pixels
+    start = np.union1d(sa, sb)
+    n = np.diff(np.append(start, hp.nside2npix(nside)))
+    va = self.values[ia[np.searchsorted(sa, start, side='right') - 1]]
+    vb = other.values[ib[np.searchsorted(sb, start, side='right') - 1]]
+    if method == 'sum':
+      v = va + vb
+    elif method == 'product':
+      v = va * vb
+    else:
+      logging.error('MultiOrderMap.combine: unknown method {}'.format(method))
+      return
+    ns = nside // np.sqrt(n).astype(np.int64)
+    self.uniq = pix2uniq(ns, start // n)
+    self.values = v
+    i = np.argsort(self.uniq)
+    self.uniq = self.uniq[i]
+    self.values = self.values[i]
+
+  def normalize(self):
+    """
+    Scale the values to a probability density (per sr) which
+    integrates to 1 over the map.  Returns self.
+    """
+    s = np.sum(self.values * self.pixel_areas())
+    if s > 0:
+      self.values = self.values / s
+    else:
+      logging.error('MultiOrderMap.normalize: integral {}'.format(s))
+    return self
+
+  def credible_region(self, cl):
+    """
+    Smallest region containing probability cl, taking the values as
+    a probability density.  Returns a MultiOrderMap of its pixels
+    (use area() for its size).
+    """
+    p = self.values * self.pixel_areas()
+    i = np.argsort(-self.values, kind='stable')
+    c = np.cumsum(p[i])
+    if len(c) == 0 or c[-1] <= 0:
+      logging.error('MultiOrderMap.credible_region: empty map')
+      return MultiOrderMap([], [])
+    n = min(np.searchsorted(c, cl * c[-1]) + 1, len(c))
+    k = i[:n]
+    return MultiOrderMap(self.uniq[k], self.values[k])
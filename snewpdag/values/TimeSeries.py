@@ -3,31 +3,114 @@ TimeSeries - a series of events
 
 Timestamps are simply seconds into a SNEWS or snewpdag instance epoch,
 represented as floats which can be negative as well as positive.
+
+Times are stored in a buffer which doubles its capacity when it fills up,
+so adding events costs amortized O(k) for k events rather than
+reallocating the whole series every time.
+
+By default (ordered=True) the times are kept sorted:  each chunk of
+added times is sorted and merged into the series.  Then min(), max(),
+integral() and windowed histogram() only need binary searches
+(np.searchsorted) rather than a scan of all the events.
+With ordered=False, times are kept in the order they were added;
+queries scan the series, or a sorted copy made when first needed.
+
+times is a read-only view of the stored times.  Don't keep it across add()
+calls, since the buffer may be rearranged or replaced.
+
+Histograms over a window with both limits are taken from the cumulative
+counts of the sorted times (searchsorted on the bin edges), and the most
+recent ones are kept in an LRU cache keyed by (nbins, width, start),
+with width and start quantized to hist_quantum.  Plugins which scan
+lags keep asking for the same windows (e.g., the reference window for
+every lag), so these then cost a dictionary lookup.  The cache is
+cleared whenever times are added.  Cached histograms are read-only.
 """
 import logging
+import threading
+from collections import OrderedDict
 import numpy as np
 from astropy import units as u
 
 class TimeSeries:
-  def __init__(self, start=None, stop=None):
+  hist_cache_size = 256 # number of histograms kept per series
+  hist_quantum = 1e-9 # (s) windows closer than this share a cache entry
+
+  def __init__(self, start=None, stop=None, ordered=True):
     """
     start:  start time (float), or None if no minimum time
     stop:  stop time (float), or None if no maximum time
+    ordered:  keep the times sorted
     """
     self.start = start
     self.stop = stop
-    self.times = np.array([], dtype=np.float64)
+    self.ordered = ordered
+    self._buf = np.empty(0, dtype=np.float64)
+    self._n = 0
+    self._init_cache()
+
+  def _init_cache(self):
+    self._sorted = None # sorted copy of times, if not ordered
+    self._hcache = OrderedDict() # { (nbins, width, start): (h, edges) }
+    self._lock = threading.Lock()
+
+  @property
+  def times(self):
+    v = self._buf[:self._n]
+    v.flags.writeable = False
+    return v
+
+  def __getstate__(self):
+    # don't save unused capacity or caches
+    d = self.__dict__.copy()
+    d['_buf'] = self._buf[:self._n].copy()
+    for k in [ '_sorted', '_hcache', '_lock' ]:
+      d.pop(k, None)
+    return d
+
+  def __setstate__(self, d):
+    if 'times' in d: # saved before times were buffered
+      d = d.copy()
+      ts = np.asarray(d.pop('times'), dtype=np.float64)
+      d['_buf'] = ts
+      d['_n'] = len(ts)
+      d.setdefault('ordered', False)
+    self.__dict__.update(d)
+    self._init_cache()
 
   def to_dict(self):
     return { 'start': self.start, 'stop': self.stop,
              'times': [ t for t in self.times ],
            }
 
+  def _reserve(self, n):
+    """
+    Make sure the buffer can hold n times.
+    """
+    if n > len(self._buf):
+      buf = np.empty(max(n, 2 * len(self._buf), 16), dtype=np.float64)
+      buf[:self._n] = self._buf[:self._n]
+      self._buf = buf
+
   def sort(self):
     """
     Sort the times
     """
-    self.times.sort()
+    self._buf[:self._n].sort()
+
+  def sorted_times(self):
+    """
+    Return the times in ascending order (without sorting in place
+    if the series isn't ordered).
+    """
+    if self.ordered:
+      return self.times
+    ts = self._sorted
+    if ts is None:
+      ts = np.sort(self.times)
+      ts.flags.writeable = False
+      self._sorted = ts
+    return ts
 
   def add(self, times):
     """
@@ -36,13 +119,50 @@ class TimeSeries:
             it's an array of Quantity, in which case convert to seconds.
     """
     ts = times.to(u.s).value if hasattr(times, 'unit') else times
-    if self.start == self.stop: # also includes both being None
-      self.times = np.append(self.times, ts)
-    else:
-      m = np.full_like(ts, True) if self.start == None else (ts >= self.start)
+    ts = np.atleast_1d(np.asarray(ts, dtype=np.float64))
+    if self.start != self.stop: # both None means no limits
+      m = np.full(ts.shape, True) if self.start == None else (ts >= self.start)
       if self.stop != None:
         m &= (ts < self.stop)
-      self.times = np.append(self.times, ts[m])
+      ts = ts[m]
+    k = len(ts)
+    if k == 0:
+      return
+    with self._lock:
+      self._sorted = None
+      self._hcache.clear()
+    n = self._n
+    if self.ordered:
+      ts = np.sort(ts)
+    self._reserve(n + k)
+    if not self.ordered or n == 0 or ts[0] >= self._buf[n-1]:
+      # append
+      self._buf[n:n+k] = ts
+    else:
+      # merge: new times go after any equal times already in the series
+      old = self._buf[:n].copy()
+      pos = np.searchsorted(old, ts, side='right') + np.arange(k)
+      m = np.full(n + k, True)
+      m[pos] = False
+      self._buf[pos] = ts
+      self._buf[:n+k][m] = old
+    self._n = n + k
+
+  def min(self):
+    """
+    Earliest time, or None if the series is empty.
+    """
+    if self._n == 0:
+      return None
+    return self._buf[0] if self.ordered else np.min(self.times)
+
+  def max(self):
+    """
+    Latest time, or None if the series is empty.
+    """
+    if self._n == 0:
+      return None
+    return self._buf[self._n-1] if self.ordered else np.max(self.times)
 
   def histogram(self, nbins, start=None, stop=None):
     """
@@ -50,20 +170,64 @@ class TimeSeries:
     """
     t0 = self.start if start == None else start
     t1 = self.stop if stop == None else stop
-    #logging.debug('histogram: nbins = {}, t0 = {}, t1 = {}, times = {}'.format(nbins, t0, t1, self.times))
+    if t0 != None and t1 != None: # both limits
+      return self.window_histogram(nbins, t0, t1)
+    ts = self.times
+    if self.ordered:
+      i0 = 0 if t0 == None else np.searchsorted(ts, t0, side='left')
+      i1 = len(ts) if t1 == None else np.searchsorted(ts, t1, side='left')
+      return np.histogram(ts[i0:i1], bins=nbins)
     if t0 == None:
       if t1 == None: # no limits, so let np.histogram optimize
-        h, edges = np.histogram(self.times, bins=nbins)
+        h, edges = np.histogram(ts, bins=nbins)
       else: # only upper limit
-        h, edges = np.histogram(self.times[self.times < t1], bins=nbins)
-    else:
-      if t1 == None: # only lower limit
-        h, edges = np.histogram(self.times[self.times >= t0], bins=nbins)
-      else: # both limits
-        #logging.debug('  hasattr unit self.times = {}, nbins = {}, t0 = {}, t1 = {}'.format(hasattr(self.times, 'unit'), hasattr(nbins, 'unit'), hasattr(t0, 'unit'), hasattr(t1, 'unit')))
-        h, edges = np.histogram(self.times, bins=nbins, range=(t0, t1))
+        h, edges = np.histogram(ts[ts < t1], bins=nbins)
+    else: # only lower limit
+      h, edges = np.histogram(ts[ts >= t0], bins=nbins)
     return h, edges
 
+  def window_histogram(self, nbins, start, stop):
+    """
+    Histogram of the window [start, stop], same as
+    np.histogram(times, nbins, range=(start, stop)), from the cache
+    if the same window was asked for recently.
+    """
+    q = self.hist_quantum
+    key = (nbins, round((stop - start) / q), round(start / q))
+    with self._lock:
+      r = self._hcache.get(key)
+      if r is not None:
+        self._hcache.move_to_end(key)
+        return r
+    ts = self.sorted_times()
+    edges = np.linspace(start, stop, nbins + 1)
+    c = np.searchsorted(ts, edges, side='left') # events before each edge
+    c[-1] = np.searchsorted(ts, stop, side='right') # last bin is closed
+    h = np.diff(c)
+    h.flags.writeable = False
+    edges.flags.writeable = False
+    with self._lock:
+      self._hcache[key] = (h, edges)
+      if len(self._hcache) > self.hist_cache_size:
+        self._hcache.popitem(last=False)
+    return h, edges
+
+  def shifted_histograms(self, nbins, starts, width):
+    """
+    Histogram the time series in windows [start, start + width)
+    for many start times at once, from cumulative counts of the sorted
+    times.  Each row is the same as histogram(nbins, start, start + width),
+    i.e., the last bin includes its upper edge.
+    starts:  array of window start times
+    Returns counts, shape starts.shape + (nbins,).
+    """
+    ts = self.sorted_times()
+    e = np.asarray(starts, dtype=np.float64)[...,np.newaxis] + \
+        np.linspace(0.0, width, nbins + 1)
+    c = np.searchsorted(ts, e, side='left') # events before each edge
+    c[...,-1] = np.searchsorted(ts, e[...,-1], side='right')
+    return np.diff(c, axis=-1)
+
   def integral(self, start=None, stop=None):
     """
     Count the events between the start and stop times.
@@ -71,14 +235,18 @@ class TimeSeries:
     """
     t0 = self.start if start == None else start
     t1 = self.stop if stop == None else stop
+    ts = self.times
+    if self.ordered:
+      i0 = 0 if t0 == None else np.searchsorted(ts, t0, side='left')
+      i1 = len(ts) if t1 == None else np.searchsorted(ts, t1, side='left')
+      return max(0, i1 - i0)
     if t0 == None:
       if t1 == None: # no limits
-        return np.times.size
+        return ts.size
       else: # only upper limit
-        return np.sum(self.times < t1)
+        return np.sum(ts < t1)
     else:
       if t1 == None: # only lower limit
-        return np.sum(self.times >= t0)
+        return np.sum(ts >= t0)
       else: # both limits
-        return np.sum((self.times >= t0) & (self.times < t1))
-
+        return np.sum((ts >= t0) & (ts < t1))
@@ -2,6 +2,7 @@
 from .History import History
 from .Hist1D import Hist1D
 from .LMap import LMap
+from .MultiOrderMap import MultiOrderMap
 
 from .TimeSeries import TimeSeries
 